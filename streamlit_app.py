@@ -1,9 +1,25 @@
 import streamlit as st
-from openai import OpenAI
-import json
-import os
 from datetime import datetime
 
+from swarm_council import prewarm_client
+from swarm_council.clients import key_fingerprint
+from swarm_council.cache import get_cache
+from swarm_council.config import (DEBATE_MAX_ROUNDS, DEBATE_ROUNDS, LATE_REVIEW_POLICIES, LATE_REVIEW_POLICY,
+                                  MAX_PARALLEL_AGENTS, REVIEW_QUORUM,
+                                  REVIEW_QUORUM_DEADLINE_SECONDS, ROUTER_LATENCY_SLO_SECONDS, ROUTING_POLICIES,
+                                  ROUTING_POLICY, STAGE_DEADLINE_SECONDS, STAGES, SWARM_AGENTS,
+                                  SYNTHESIS_FALLBACK_MODELS, SYNTHESIS_MODEL, TOPIC_REUSE_MODE, TOPIC_REUSE_MODES,
+                                  TOPIC_REUSE_THRESHOLD)
+from swarm_council.engine import SwarmCouncil
+from swarm_council.events import LEVELS, EventLog
+from swarm_council.jobs import get_job_queue
+from swarm_council.ranking import consensus_ranking
+from swarm_council.router import get_router
+from swarm_council.runstore import get_run_store
+from swarm_council.singleflight import get_single_flight
+from swarm_council.telemetry import DEFAULT_METRICS_PORT, get_telemetry, serve_metrics
+from swarm_council.topics import REUSED_STAGES, get_topic_index
+
 # Page config
 st.set_page_config(
     page_title="AI Swarm Council",
@@ -11,6 +27,40 @@ st.set_page_config(
     layout="wide"
 )
 
+@st.cache_resource
+def response_cache():
+    """The response cache, opened once per server process"""
+    return get_cache()
+
+@st.cache_resource
+def run_store():
+    """The run store, opened once per server process"""
+    return get_run_store()
+
+@st.cache_resource
+def topic_index():
+    """Near-duplicate index over the run store's topics"""
+    return get_topic_index(run_store())
+
+@st.cache_resource
+def job_queue():
+    """The background queue every session's stages run on"""
+    return get_job_queue()
+
+@st.cache_resource
+def telemetry():
+    """Call and stage telemetry, shared by all sessions; served at /metrics when SWARM_METRICS_PORT is set"""
+    if DEFAULT_METRICS_PORT:
+        try:
+            serve_metrics(DEFAULT_METRICS_PORT)
+        except OSError as e:
+            st.warning(f"Could not serve metrics on port {DEFAULT_METRICS_PORT}: {e}")
+    return get_telemetry()
+
+def user_key():
+    """Who the per-user job limit and run ownership apply to: the OpenRouter account, i.e. the API key"""
+    return key_fingerprint(st.session_state.api_key)
+
 # Initialize session state
 if 'api_key' not in st.session_state:
     st.session_state.api_key = ''
@@ -20,552 +70,744 @@ if 'peer_reviews' not in st.session_state:
     st.session_state.peer_reviews = None
 if 'synthesis' not in st.session_state:
     st.session_state.synthesis = None
+if 'debate' not in st.session_state:
+    st.session_state.debate = None
 if 'proposal' not in st.session_state:
     st.session_state.proposal = None
 if 'logs' not in st.session_state:
-    st.session_state.logs = []
-
-# Agent configurations with model assignments
-SWARM_AGENTS = [
-    {
-        'id': 'cognitive',
-        'name': 'Cognitive Scientist',
-        'icon': '🧠',
-        'model': 'anthropic/claude-sonnet-4.5',
-        'system_prompt': 'You are an expert in cognitive science and educational psychology. Help explore research topics by identifying relevant cognitive theories, mental models, and learning mechanisms.'
-    },
-    {
-        'id': 'clinical',
-        'name': 'Clinical Educator',
-        'icon': '👨‍⚕️',
-        'model': 'google/gemini-3-flash-preview',
-        'system_prompt': 'You are a seasoned clinical educator. Help explore research topics by considering practical implementation, feasibility, and real-world constraints.'
-    },
-    {
-        'id': 'assessment',
-        'name': 'Assessment Specialist',
-        'icon': '📊',
-        'model': 'openai/gpt-oss-120b',
-        'system_prompt': 'You are an expert in educational measurement. Help explore research topics by considering how constructs might be measured, what validity issues exist, and assessment challenges.'
-    },
-    {
-        'id': 'technology',
-        'name': 'Technology Innovator',
-        'icon': '💻',
-        'model': 'anthropic/claude-sonnet-4.5',
-        'system_prompt': 'You are an educational technologist. Help explore research topics by identifying relevant technologies, novel methods, and innovative approaches.'
-    },
-    {
-        'id': 'crosscultural',
-        'name': 'Cross-Cultural Researcher',
-        'icon': '🌍',
-        'model': 'z-ai/glm-4.7',
-        'system_prompt': 'You are focused on equity and global perspectives. Help explore research topics by considering cultural contexts, power dynamics, and generalizability across diverse populations.'
-    }
-]
-
-# Synthesis and proposal model
-SYNTHESIS_MODEL = 'anthropic/claude-sonnet-4.5'
-
-def add_log(message, log_type='info'):
-    """Add a log message with timestamp"""
-    timestamp = datetime.now().strftime('%H:%M:%S')
-    st.session_state.logs.append({
-        'timestamp': timestamp,
-        'message': message,
-        'type': log_type
-    })
-
-def call_llm(system_prompt, user_prompt, model, agent_name, max_tokens=2000):
-    """Call LLM via OpenRouter API"""
-    try:
-        api_key = st.session_state.api_key
-        if not api_key:
-            raise ValueError("API key not provided. Please enter your OpenRouter API key.")
-        
-        client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=api_key,
-            timeout=120.0,  # 2 minute timeout
-        )
-        
-        add_log(f"Calling {agent_name} with model {model}...", 'info')
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.7,
-        )
-        
-        content = response.choices[0].message.content
-        if not content:
-            add_log(f"Warning: Empty response from {agent_name}", 'error')
-            return ""
-        
-        add_log(f"Received {len(content)} chars from {agent_name}", 'info')
-        return content
-    except Exception as e:
-        error_msg = str(e)
-        add_log(f"Error from {agent_name}: {error_msg}", 'error')
-        # Show more details for common errors
-        if "timeout" in error_msg.lower():
-            add_log(f"The model {model} timed out. Consider using a faster model.", 'error')
-        elif "rate" in error_msg.lower():
-            add_log("Rate limit hit. Please wait and try again.", 'error')
-        elif "credits" in error_msg.lower() or "balance" in error_msg.lower():
-            add_log("Insufficient credits on OpenRouter. Please add funds.", 'error')
-        raise e
-
-def explore_topic(user_topic):
-    """Stage 1: Diverse Idea Generation"""
-    st.session_state.exploration = None
-    st.session_state.peer_reviews = None
-    st.session_state.synthesis = None
-    st.session_state.proposal = None
-    st.session_state.logs = []
+    st.session_state.logs = EventLog()
+if 'stage_deadline' not in st.session_state:
+    st.session_state.stage_deadline = STAGE_DEADLINE_SECONDS
+if 'cache_bypass' not in st.session_state:
+    st.session_state.cache_bypass = set()
+if 'review_quorum' not in st.session_state:
+    st.session_state.review_quorum = min(REVIEW_QUORUM or len(SWARM_AGENTS), len(SWARM_AGENTS))
+if 'quorum_deadline' not in st.session_state:
+    st.session_state.quorum_deadline = REVIEW_QUORUM_DEADLINE_SECONDS or STAGE_DEADLINE_SECONDS
+if 'late_review_policy' not in st.session_state:
+    st.session_state.late_review_policy = LATE_REVIEW_POLICY
+if 'routing_policy' not in st.session_state:
+    st.session_state.routing_policy = ROUTING_POLICY
+if 'debate_rounds' not in st.session_state:
+    st.session_state.debate_rounds = DEBATE_ROUNDS or 2
+if 'late_reviews' not in st.session_state:
+    st.session_state.late_reviews = None
+if 'run_id' not in st.session_state:
+    st.session_state.run_id = None
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+if 'job_error' not in st.session_state:
+    st.session_state.job_error = None
+if 'topic_reuse_mode' not in st.session_state:
+    st.session_state.topic_reuse_mode = TOPIC_REUSE_MODE
+if 'topic_reuse_threshold' not in st.session_state:
+    st.session_state.topic_reuse_threshold = TOPIC_REUSE_THRESHOLD
+if 'topic_match' not in st.session_state:
+    st.session_state.topic_match = None
+if 'reused_from' not in st.session_state:
+    st.session_state.reused_from = None
+
+# ?run=<id> reopens a run from the run store, e.g. after a server restart or
+# from another browser. Runs are private to the API key that started them, so
+# opening one waits for the key.
+requested_run = st.query_params.get('run')
+if requested_run and requested_run != st.session_state.run_id and not st.session_state.api_key:
+    st.info(f"Enter your OpenRouter API key in the sidebar to open run `{requested_run}`.")
+elif requested_run and requested_run != st.session_state.run_id:
+    saved_run = run_store().load_run(requested_run, owner=user_key())
+    if saved_run is None:
+        st.warning(f"Run `{requested_run}` was not found; starting a new one.")
+        del st.query_params['run']
+    else:
+        st.session_state.run_id = requested_run
+        st.session_state.current_topic = saved_run['topic']
+        st.session_state.exploration = saved_run['stages'].get('explore')
+        st.session_state.peer_reviews = saved_run['stages'].get('review')
+        st.session_state.synthesis = saved_run['stages'].get('synthesize')
+        st.session_state.debate = saved_run['stages'].get('debate')
+        st.session_state.proposal = saved_run['stages'].get('propose')
+        st.session_state.late_reviews = None
+        st.session_state.reused_from = None
+        st.session_state.logs.clear()
+
+# ?job=<id> reattaches to a stage still running for this run (e.g. after a reload)
+requested_job = st.query_params.get('job')
+if requested_job and requested_job != st.session_state.job_id:
+    if job_queue().get(requested_job) is not None:
+        st.session_state.job_id = requested_job
+    else:
+        del st.query_params['job']
+
+def add_log(message, log_type='info', stage='app'):
+    """Add a message from the app itself to the Activity Log"""
+    st.session_state.logs.append(stage, message, log_type)
 
-    add_log('🧠 Stage 1: Diverse Idea Generation starting...', 'info')
-    explorations = []
+# Result panels. They tolerate missing fields so the same code renders
+# partially streamed results while a stage is still running.
 
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+def render_exploration(agent_data):
+    """Render one agent's Stage 1 analysis"""
+    st.caption(f"🤖 Model: `{agent_data.get('model', 'Unknown')}`")
 
-    for idx, agent in enumerate(SWARM_AGENTS):
-        status_text.text(f"Consulting {agent['name']}...")
-        add_log(f"Consulting {agent['name']}...", 'progress')
+    col1, col2 = st.columns(2)
 
-        prompt = f"""A researcher is interested in exploring this topic:
+    with col1:
+        st.markdown("**Key Concepts:**")
+        for concept in agent_data.get('keyConcepts', []):
+            st.markdown(f"- {concept}")
+
+        st.markdown("**Theoretical Frameworks:**")
+        st.write(", ".join(agent_data.get('theoreticalFrameworks', [])))
 
-"{user_topic}"
+    with col2:
+        st.markdown("**✅ What's Clear:**")
+        st.write(agent_data.get('whatsClear', '…'))
 
-From your perspective ({agent['name']}), help them think through this topic by:
-1. Identifying the KEY CONCEPTS and theoretical frameworks that are relevant
-2. Highlighting what aspects are CLEAR vs. FUZZY/UNCLEAR and need more definition
-3. Suggesting important QUESTIONS they should consider
-4. Noting potential CHALLENGES or considerations from your lens
+        st.markdown("**⚠️ What's Fuzzy:**")
+        st.write(agent_data.get('whatsFuzzy', '…'))
 
-Be concise but insightful. Format as JSON:
-{{
-  "keyConcepts": ["concept1", "concept2", "concept3"],
-  "theoreticalFrameworks": ["framework1", "framework2"],
-  "whatsClear": "brief statement of what seems well-defined",
-  "whatsFuzzy": "what needs clarification or further thought",
-  "importantQuestions": ["question1", "question2", "question3"],
-  "considerations": "key challenges or factors to consider from your perspective"
-}}"""
+    st.markdown("**❓ Important Questions:**")
+    for question in agent_data.get('importantQuestions', []):
+        st.markdown(f"- {question}")
 
-        try:
-            response = call_llm(agent['system_prompt'], prompt, agent['model'], agent['name'])
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                analysis = json.loads(json_str)
-                explorations.append({
-                    'agentId': agent['id'],
-                    'agentName': agent['name'],
-                    'icon': agent['icon'],
-                    'model': agent['model'],
-                    **analysis
-                })
-                add_log(f"✅ {agent['name']} analysis complete", 'success')
-        except Exception as e:
-            add_log(f"⚠️ {agent['name']} analysis failed", 'error')
-
-        progress_bar.progress((idx + 1) / len(SWARM_AGENTS))
-
-    if not explorations:
-        st.error("No analyses generated")
+    st.markdown("**💡 Considerations:**")
+    st.info(agent_data.get('considerations', '…'))
+
+def render_peer_review(review_data, key=None):
+    """Render one reviewer's Stage 2 critique
+
+    With a key, each idea's detailed critique is only built while its expander
+    is open; without one (live streaming) every expander is filled in.
+    """
+    st.caption(f"🤖 Model: `{review_data.get('model', 'Unknown')}`")
+
+    st.markdown("### 📝 Overall Commentary")
+    st.info(review_data.get('overallCommentary', '…'))
+
+    st.markdown("### 🏆 Ranking (Strongest to Weakest)")
+    ranking_str = " → ".join([f"Idea #{i}" for i in review_data.get('ranking', [])])
+    st.success(ranking_str or '…')
+
+    st.markdown("### 📊 Detailed Reviews")
+    for idx, review in enumerate(review_data.get('reviews', [])):
+        label = f"Idea #{review.get('ideaNumber', '?')} - Detailed Critique"
+        if key is None:
+            expander = st.expander(label)
+        else:
+            expander = st.expander(label, key=f"{key}_idea_{idx}", on_change='rerun')
+            if not expander.open:
+                continue
+        with expander:
+            col1, col2, col3 = st.columns(3)
+
+            with col1:
+                st.markdown("**✅ Strengths:**")
+                for strength in review.get('strengths', []):
+                    st.markdown(f"- {strength}")
+
+            with col2:
+                st.markdown("**⚠️ Weaknesses:**")
+                for weakness in review.get('weaknesses', []):
+                    st.markdown(f"- {weakness}")
+
+            with col3:
+                st.markdown("**➕ Missing Elements:**")
+                for missing in review.get('missingElements', []):
+                    st.markdown(f"- {missing}")
+
+def render_consensus(consensus):
+    """Render every reviewer's ranking combined into one"""
+    st.markdown("### 🏆 Consensus Ranking")
+    st.caption(f"Combined from {consensus['reviewers']} reviewers' rankings "
+               f"({consensus['pairCoverage']:.0%} of idea pairs compared). Agreement is the share of reviewer "
+               "judgments involving an idea that match its consensus position.")
+    rows = ["| Rank | Idea | Agent | Borda | Bradley–Terry | Agreement |", "|---|---|---|---|---|---|"]
+    for idea in consensus['ideas']:
+        borda = '–' if idea['borda'] is None else f"{idea['borda']:.2f}"
+        rows.append(f"| {idea['rank']} | #{idea['ideaNumber']} | {idea['icon']} {idea['agentName']} | {borda} | "
+                    f"{idea['bradleyTerry']:.3f} | {idea['confidence']:.0%} |")
+    st.markdown("\n".join(rows))
+
+def render_synthesis(synthesis):
+    """Render the Stage 3 synthesis"""
+    st.markdown("### 🎯 Clarified Research Focus")
+    st.write(synthesis.get('clarifiedFocus', '…'))
+
+    st.markdown("### 📚 Theoretical Foundations to Build On")
+    for framework in synthesis.get('theoreticalFoundations', []):
+        st.markdown(f"✅ {framework}")
+
+    st.markdown("### ⚡ Key Tensions to Resolve")
+    for tension in synthesis.get('keyTensions', []):
+        st.markdown(f"⚠️ {tension}")
+
+    st.markdown("### ❓ Critical Questions")
+    for idx, question in enumerate(synthesis.get('criticalQuestions', []), 1):
+        st.markdown(f"**Q{idx}:** {question}")
+
+    st.markdown("### 🔗 Integrated Perspectives")
+    st.write(synthesis.get('integratedPerspectives', '…'))
+
+    if 'peerReviewInsights' in synthesis:
+        st.markdown("### 🔍 Peer Review Insights")
+        st.write(synthesis['peerReviewInsights'])
+
+    st.markdown("### 🚀 Recommended Next Steps")
+    for idx, step in enumerate(synthesis.get('recommendedNextSteps', []), 1):
+        st.markdown(f"{idx}. {step}")
+
+DEBATE_STOPS = {'converged': "the rankings settled", 'max rounds': "the round limit was reached",
+                'no reviews': "no reviews came back"}
+
+def render_debate(debate):
+    """Render the debate rounds that followed the synthesis, one table row per round"""
+    rounds = debate['rounds']
+    st.caption(f"{len(rounds)} round(s) of re-review and revision; stopped because "
+               f"{DEBATE_STOPS.get(debate.get('stopped'), 'it was interrupted')}. Each round sent only the previous "
+               "round's changes, so its prompts stay the same size.")
+    rows = ["| Round | Reviews | Pairs reordered | Rank moves | New points | Fields revised | Prompt tokens |",
+            "|---|---|---|---|---|---|---|"]
+    for entry in rounds:
+        moves = ', '.join(f"#{move['ideaNumber']} {move['from']}→{move['to']}" for move in entry['rankChanges'])
+        rows.append(f"| {entry['round']} | {len(entry['reviews'])} | {entry['movement']:.0%} | {moves or '–'} | "
+                    f"{len(entry['newPoints'])} | {len(entry['revisedFields'])} | {entry['promptTokens']:,} |")
+    st.markdown("\n".join(rows))
+    if rounds:
+        render_consensus(rounds[-1]['consensus'])
+
+def render_debate_partial(fields):
+    """Streamed fields of a debate call: a reviewer's review, or the synthesizer's revision"""
+    if 'ranking' in fields or 'reviews' in fields:
+        render_peer_review(fields)
+    else:
+        render_synthesis(fields)
+
+def render_proposal(proposal):
+    """Render the Stage 4 research proposal"""
+    st.markdown(f"## {proposal.get('title', '…')}")
+
+    st.markdown("### Research Question")
+    st.write(proposal.get('researchQuestion', '…'))
+
+    st.markdown("### Background")
+    st.write(proposal.get('background', '…'))
+
+    st.markdown("### Methodology")
+    st.write(proposal.get('methodology', '…'))
+
+    st.markdown("### Expected Contribution")
+    st.write(proposal.get('expectedContribution', '…'))
+
+    st.info(f"**Feasibility Notes:** {proposal.get('feasibilityNotes', '…')}")
+
+def usage_line(summary):
+    """One-line cost and latency summary of a run's calls so far"""
+    cost = f"${summary['cost']:.4f}" + ('' if summary['cost_known'] else '+')
+    line = (f"💰 {cost} · {summary['calls']} calls · "
+            f"{summary['prompt_tokens'] + summary['completion_tokens']:,} tokens")
+    if summary['cached_tokens']:
+        line += f" ({summary['cached_tokens']:,} prompt tokens cached)"
+    if summary['max_wall'] is not None:
+        line += f" · slowest call {summary['max_wall']:.1f}s"
+    return line
+
+JOB_POLL_SECONDS = 1.0
+# How a stage's streamed fields are drawn while it runs: (render, one tab per agent)
+STAGE_VIEWS = {
+    'explore': (render_exploration, True),
+    'review': (render_peer_review, True),
+    'synthesize': (render_synthesis, False),
+    'debate': (render_debate_partial, True),
+    'propose': (render_proposal, False),
+}
+# Stages whose errors are logged and shown with their traceback
+JOB_ERROR_LABELS = {'synthesize': "Synthesis error", 'debate': "Debate error", 'propose': "Proposal generation error"}
+
+def submit_stage(stage, label, stage_call):
+    """Queue one SwarmCouncil stage on the background job queue
+
+    stage_call(council) returns the stage coroutine. It runs on the queue's
+    thread, so it must not touch st.session_state: everything the council
+    needs from the session is read here, and the coroutine returns a dict of
+    session-state values that show_job() applies once the job is done.
+    """
+    queue = job_queue()
+    settings = dict(
+        api_key=st.session_state.api_key,
+        stage_deadline=st.session_state.stage_deadline,
+        review_quorum=st.session_state.review_quorum,
+        quorum_deadline=st.session_state.quorum_deadline,
+        late_review_policy=st.session_state.late_review_policy,
+        routing_policy=st.session_state.routing_policy,
+        cache_bypass=set(st.session_state.cache_bypass),
+        run_store=run_store(),
+        run_id=st.session_state.run_id,
+        event_log=st.session_state.logs,
+        telemetry=telemetry()
+    )
+
+    async def work(job):
+        council = SwarmCouncil(on_event=job.on_event, executor=queue.executor, **settings)
+        return await stage_call(council)
+
+    st.session_state.job_error = None
+    job = queue.submit(user_key(), label, work, kind=stage)
+    st.session_state.job_id = job.id
+    # In the URL too, so a reloaded page picks the job up again
+    st.query_params['job'] = job.id
+
+def finish_job(job):
+    """Apply a finished job's result to the session, or keep its error for display"""
+    st.session_state.job_id = None
+    if 'job' in st.query_params:
+        del st.query_params['job']
+    if job.state == 'done':
+        for key, value in job.result.items():
+            st.session_state[key] = value
+    elif job.state == 'failed':
+        st.session_state.job_error = (job.kind, job.error, job.error_details)
+        if job.kind in JOB_ERROR_LABELS:
+            add_log(f"⚠️ {JOB_ERROR_LABELS[job.kind]}: {job.error}", 'error', stage=job.kind)
+    else:
+        add_log(f"⏹️ {job.label} was cancelled", 'info', stage=job.kind)
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job():
+    """Progress of the session's queued or running stage, polled until it is done
+
+    Streamed fields are drawn as they arrive (one tab per agent for fan-out
+    stages) and the progress bar advances as each agent finishes. When the
+    job is done its result is applied and the whole page reruns.
+    """
+    job = job_queue().get(st.session_state.job_id)
+    if job is None:
+        # Forgotten by the queue (e.g. the server restarted); checkpoints remain
+        st.session_state.job_id = None
+        st.rerun()
+    if job.done:
+        finish_job(job)
+        st.rerun()
+
+    snapshot = job.snapshot()
+    render, fan_out = STAGE_VIEWS[job.kind]
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        if snapshot['state'] == 'queued':
+            ahead = job_queue().position(job)
+            st.info(f"⏳ {snapshot['label']}: waiting for a free slot"
+                    + (f" ({ahead} job{'s' if ahead != 1 else ''} ahead)" if ahead else ""))
+        else:
+            if fan_out:
+                completed, total = snapshot['progress'] or (0, len(SWARM_AGENTS))
+                st.progress(completed / total)
+            status = snapshot['status']
+            if snapshot['progress'] is None:
+                status += f" ({len(SWARM_AGENTS)} agents in parallel)..." if fan_out else "..."
+            st.text(status)
+            if snapshot['updates']:
+                st.caption(usage_line(telemetry().run_summary(st.session_state.run_id)))
+    with col2:
+        if st.button("⏹️ Cancel", key='cancel_job'):
+            job_queue().cancel(job.id)
+
+    for message, raw in snapshot['warnings']:
+        st.warning(message)
+        if raw:
+            with st.expander("🔍 Raw LLM Response (for debugging)"):
+                st.code(raw[:2000] if len(raw) > 2000 else raw)
+
+    partials = snapshot['partials']
+    if fan_out:
+        tabs = st.tabs([f"{agent['icon']} {agent['name']}" for agent in SWARM_AGENTS])
+        for idx, tab in enumerate(tabs):
+            with tab:
+                if idx in partials:
+                    render(partials[idx])
+                else:
+                    st.caption("Waiting for the first tokens…")
+    elif 0 in partials:
+        render(partials[0])
+
+def show_job_error():
+    """The error of the last stage that failed, until another stage is started"""
+    stage, error, details = st.session_state.job_error
+    if stage in JOB_ERROR_LABELS:
+        st.error(f"❌ {JOB_ERROR_LABELS[stage]}: {error}")
+        st.expander("🔍 Error Details").code(details)
+    else:
+        st.error(str(error))
+
+def similar_run(user_topic):
+    """An earlier run of this user's on a near-duplicate topic whose Stage 1 and 2 could be reused, or None"""
+    if st.session_state.topic_reuse_mode == 'off':
+        return None
+    return topic_index().find(user_topic, st.session_state.topic_reuse_threshold, owner=user_key())
+
+def explore_topic(user_topic, reuse=None):
+    """Stage 1: Diverse Idea Generation, or Stage 1 and 2 taken from the run `reuse` matched"""
+    st.session_state.exploration = None
+    st.session_state.peer_reviews = None
+    st.session_state.synthesis = None
+    st.session_state.debate = None
+    st.session_state.proposal = None
+    st.session_state.late_reviews = None
+    st.session_state.topic_match = None
+    st.session_state.reused_from = None
+    st.session_state.current_topic = user_topic
+    st.session_state.logs.clear()
+    # Every exploration starts a new run; its id in the URL makes it resumable
+    st.session_state.run_id = run_store().create_run(user_topic, owner=user_key())
+    st.query_params['run'] = st.session_state.run_id
+
+    if reuse is not None and run_store().copy_stages(reuse['run_id'], st.session_state.run_id, REUSED_STAGES):
+        stages = run_store().load_run(st.session_state.run_id)['stages']
+        st.session_state.exploration = stages.get('explore')
+        st.session_state.peer_reviews = stages.get('review')
+        st.session_state.reused_from = reuse
+        add_log(f"♻️ Reusing Stage 1 and 2 of run {reuse['run_id']} ({reuse['similarity']:.0%} similar topic)",
+                'success', stage='explore')
         return
 
-    st.session_state.exploration = explorations
-    add_log('✅ Stage 1: Diverse Idea Generation complete!', 'success')
+    async def explore(council):
+        return {'exploration': await council.explore(user_topic)}
 
-    progress_bar.empty()
-    status_text.empty()
+    submit_stage('explore', "Consulting agents", explore)
 
 def peer_review_ideas():
     """Stage 2: Anonymous Peer Review"""
     if not st.session_state.exploration:
         return
+    exploration = st.session_state.exploration
 
-    add_log('👥 Stage 2: Anonymous Peer Review starting...', 'info')
-
-    import random
-    anonymized_ideas = []
-    for idx, exp in enumerate(st.session_state.exploration):
-        anonymized_ideas.append({
-            'ideaNumber': idx + 1,
-            'keyConcepts': exp['keyConcepts'],
-            'theoreticalFrameworks': exp['theoreticalFrameworks'],
-            'whatsClear': exp['whatsClear'],
-            'whatsFuzzy': exp['whatsFuzzy'],
-            'importantQuestions': exp['importantQuestions'],
-            'considerations': exp['considerations']
-        })
-
-    random.shuffle(anonymized_ideas)
-
-    ideas_summary = "\n\n".join([
-        f"""IDEA #{idea['ideaNumber']}:
-- Key Concepts: {', '.join(idea['keyConcepts'])}
-- Frameworks: {', '.join(idea['theoreticalFrameworks'])}
-- What's Clear: {idea['whatsClear']}
-- What's Fuzzy: {idea['whatsFuzzy']}
-- Important Questions: {'; '.join(idea['importantQuestions'])}
-- Considerations: {idea['considerations']}"""
-        for idea in anonymized_ideas
-    ])
-
-    reviews = []
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    for idx, agent in enumerate(SWARM_AGENTS):
-        status_text.text(f"{agent['name']} reviewing all proposals...")
-        add_log(f"{agent['name']} conducting peer review...", 'progress')
-
-        prompt = f"""You are conducting an ANONYMOUS PEER REVIEW of research exploration proposals.
-
-Below are {len(anonymized_ideas)} different proposals exploring the same research topic. Your identity as a reviewer is anonymous, and you DO NOT know who created each proposal.
-
-YOUR TASK:
-1. For EACH proposal, identify:
-   - Key STRENGTHS (what's valuable/insightful)
-   - WEAKNESSES or gaps (what's missing/unclear)
-   - MISSING ELEMENTS (what should be added)
-
-2. RANK all proposals from strongest (1) to weakest ({len(anonymized_ideas)})
-
-Be objective and constructive. Focus on the quality of ideas, not the author.
-
-PROPOSALS TO REVIEW:
-{ideas_summary}
-
-Format your review as JSON:
-{{
-  "reviews": [
-    {{
-      "ideaNumber": 1,
-      "strengths": ["strength1", "strength2"],
-      "weaknesses": ["weakness1", "weakness2"],
-      "missingElements": ["missing1", "missing2"]
-    }},
-    ... (one for each idea)
-  ],
-  "ranking": [1, 3, 2, 5, 4],
-  "overallCommentary": "brief synthesis of what patterns you see across proposals"
-}}
-
-The ranking array should list idea numbers from strongest to weakest."""
-
-        try:
-            response = call_llm(
-                f"{agent['system_prompt']} You are now acting as an anonymous peer reviewer.",
-                prompt,
-                agent['model'],
-                agent['name']
-            )
-
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                review = json.loads(json_str)
-                reviews.append({
-                    'reviewerId': agent['id'],
-                    'reviewerName': agent['name'],
-                    'icon': agent['icon'],
-                    'model': agent['model'],
-                    **review
-                })
-                add_log(f"✅ {agent['name']} peer review complete", 'success')
-        except Exception as e:
-            add_log(f"⚠️ {agent['name']} peer review failed: {str(e)}", 'error')
-
-        progress_bar.progress((idx + 1) / len(SWARM_AGENTS))
-
-    if not reviews:
-        st.error("No peer reviews generated")
-        return
-
-    st.session_state.peer_reviews = reviews
-    add_log('✅ Stage 2: Anonymous Peer Review complete!', 'success')
+    async def review(council):
+        reviews = await council.review(exploration)
+        # Reviews that missed the quorum keep running; Stage 3 picks them up
+        return {'peer_reviews': reviews, 'late_reviews': council.late_reviews}
 
-    progress_bar.empty()
-    status_text.empty()
+    submit_stage('review', "Agents reviewing all proposals", review)
 
 def synthesize_with_reviews(user_topic):
-    """Stage 3: Synthesis - FIXED with better error handling"""
+    """Stage 3: Synthesis"""
     if not st.session_state.exploration or not st.session_state.peer_reviews:
         st.error("Missing exploration or peer reviews data!")
         return
+    exploration, peer_reviews = st.session_state.exploration, st.session_state.peer_reviews
+    late_reviews, st.session_state.late_reviews = st.session_state.late_reviews, None
 
-    add_log('✨ Stage 3: Synthesis with Peer Reviews starting...', 'info')
-
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    try:
-        status_text.text("Preparing original ideas...")
-        progress_bar.progress(0.1)
-
-        original_ideas = "\n\n".join([
-            f"""{exp['agentName']} ({exp['icon']}):
-- Key Concepts: {', '.join(exp['keyConcepts'])}
-- Frameworks: {', '.join(exp['theoreticalFrameworks'])}
-- What's Clear: {exp['whatsClear']}
-- What's Fuzzy: {exp['whatsFuzzy']}
-- Questions: {'; '.join(exp['importantQuestions'])}
-- Considerations: {exp['considerations']}"""
-            for exp in st.session_state.exploration
-        ])
-
-        status_text.text("Preparing peer review critiques...")
-        progress_bar.progress(0.2)
-
-        peer_critiques_list = []
-        for review in st.session_state.peer_reviews:
-            detailed_reviews = []
-            for r in review['reviews']:
-                detailed = f"  Idea #{r['ideaNumber']}:"
-                detailed += f"\n    ✓ Strengths: {'; '.join(r['strengths'])}"
-                detailed += f"\n    ✗ Weaknesses: {'; '.join(r['weaknesses'])}"
-                detailed += f"\n    + Missing: {'; '.join(r['missingElements'])}"
-                detailed_reviews.append(detailed)
-
-            peer_critique = f"""{review['reviewerName']} ({review['icon']}) - Peer Review:
-Overall Commentary: {review['overallCommentary']}
-Ranking (strongest to weakest): {', '.join([f"Idea #{i}" for i in review['ranking']])}
-
-Detailed Reviews:
-{chr(10).join(detailed_reviews)}"""
-            peer_critiques_list.append(peer_critique)
-
-        peer_critiques = "\n\n".join(peer_critiques_list)
-
-        status_text.text("Calling synthesis model (this may take 30-60 seconds)...")
-        progress_bar.progress(0.3)
-        add_log('Calling synthesis model...', 'info')
-
-        synthesis_prompt = f"""A researcher asked about: "{user_topic}"
-
-You have access to:
-1. ORIGINAL IDEAS from 5 different expert perspectives
-2. PEER REVIEW CRITIQUES where each expert anonymously reviewed ALL ideas
-
-YOUR TASK - Create a SUPERIOR SYNTHESIS that:
-- Integrates the BEST ELEMENTS from multiple original proposals
-- Addresses WEAKNESSES identified in peer reviews
-- Combines COMPLEMENTARY INSIGHTS across perspectives
-- Fills in MISSING ELEMENTS noted by reviewers
-
-ORIGINAL IDEAS:
-{original_ideas}
-
-PEER REVIEW CRITIQUES:
-{peer_critiques}
-
-CRITICAL: You MUST respond with ONLY a valid JSON object. No explanations, no markdown, no text before or after. Start your response with {{ and end with }}.
-
-Respond with this exact JSON structure (fill in the values):
-{{
-  "clarifiedFocus": "your refined understanding here",
-  "theoreticalFoundations": ["framework1", "framework2", "framework3"],
-  "keyTensions": ["tension1", "tension2"],
-  "criticalQuestions": ["question1", "question2", "question3"],
-  "integratedPerspectives": "how perspectives complement each other",
-  "peerReviewInsights": "key insights from peer review",
-  "recommendedNextSteps": ["step1", "step2", "step3"]
-}}"""
-
-        response = call_llm(
-            "You are a JSON-only response bot. You MUST output ONLY valid JSON with no other text, no markdown formatting, no explanations. Start with { and end with }. You synthesize research perspectives into structured JSON.",
-            synthesis_prompt,
-            SYNTHESIS_MODEL,
-            'Synthesizer',
-            max_tokens=4000  # Increased for synthesis
-        )
+    async def synthesize(council):
+        council.late_reviews = late_reviews
+        synthesis = await council.synthesize(user_topic, exploration, peer_reviews)
+        reviews, synthesis = await council.refine(user_topic, peer_reviews, synthesis)
+        return {'peer_reviews': reviews, 'synthesis': synthesis}
 
-        status_text.text("Parsing response...")
-        progress_bar.progress(0.8)
-        add_log('Received response, parsing...', 'info')
-
-        if not response:
-            raise ValueError("Empty response from synthesis model")
-
-        # Enhanced JSON extraction with multiple strategies
-        json_str = None
-        synthesis = None
-        
-        # Strategy 1: Try to find JSON in markdown code block (```json ... ```)
-        import re
-        code_block_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', response, re.DOTALL)
-        if code_block_match:
-            json_str = code_block_match.group(1)
-            add_log('Found JSON in markdown code block', 'info')
-        
-        # Strategy 2: Find the largest JSON object in the response
-        if json_str is None:
-            # Find all potential JSON objects
-            json_candidates = []
-            brace_count = 0
-            start_idx = None
-            
-            for i, char in enumerate(response):
-                if char == '{':
-                    if brace_count == 0:
-                        start_idx = i
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0 and start_idx is not None:
-                        candidate = response[start_idx:i+1]
-                        json_candidates.append(candidate)
-                        start_idx = None
-            
-            # Try each candidate, prefer the largest valid one
-            for candidate in sorted(json_candidates, key=len, reverse=True):
-                try:
-                    test_parse = json.loads(candidate)
-                    # Check if it has expected synthesis fields
-                    if any(key in test_parse for key in ['clarifiedFocus', 'theoreticalFoundations', 'keyTensions']):
-                        json_str = candidate
-                        add_log(f'Found valid JSON candidate (length: {len(candidate)} chars)', 'info')
-                        break
-                except json.JSONDecodeError:
-                    continue
-        
-        # Strategy 3: Simple first/last brace extraction (original method)
-        if json_str is None:
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                add_log('Using simple brace extraction', 'info')
-        
-        if json_str is None:
-            # No JSON found at all - show debugging info
-            st.warning("⚠️ No JSON structure found in response")
-            with st.expander("🔍 Raw LLM Response (for debugging)"):
-                st.code(response[:2000] if len(response) > 2000 else response)
-            add_log('No JSON braces found in response', 'error')
-            # Set empty so fallback kicks in
-            json_str = ""
-
-        add_log(f'Extracted JSON (length: {len(json_str)} chars)', 'info')
-
-        # Try parsing with repair attempts
-        parse_attempts = [
-            ("direct", json_str),
-            ("fix_newlines", json_str.replace('\n', ' ').replace('\r', '')),
-            ("fix_escapes", json_str.replace('\\"', '"').replace('\\n', ' ')),
-        ]
-        
-        for attempt_name, attempt_str in parse_attempts:
-            try:
-                synthesis = json.loads(attempt_str)
-                add_log(f'JSON parsed successfully (method: {attempt_name})', 'info')
-                break
-            except json.JSONDecodeError as je:
-                add_log(f'Parse attempt "{attempt_name}" failed: {str(je)}', 'info')
-                continue
-        
-        if synthesis is None:
-            # FALLBACK: Create synthesis from raw text response
-            add_log('JSON parsing failed, attempting text fallback...', 'info')
-            st.warning("⚠️ LLM did not return valid JSON. Creating synthesis from text response...")
-            
-            # Show raw response for debugging
-            with st.expander("🔍 Raw LLM Response (for debugging)"):
-                st.code(response[:2000] if len(response) > 2000 else response)
-            
-            # Create a basic synthesis from the text
-            synthesis = {
-                "clarifiedFocus": response[:500] if response else "Synthesis could not be generated",
-                "theoreticalFoundations": ["See raw response for details"],
-                "keyTensions": ["JSON parsing failed - review raw response"],
-                "criticalQuestions": ["Why did the LLM not return JSON?"],
-                "integratedPerspectives": "The LLM response was not in JSON format. Please review the raw response above for insights.",
-                "peerReviewInsights": "Could not extract structured insights",
-                "recommendedNextSteps": ["Review raw response", "Try running synthesis again", "Check if model supports JSON output"]
-            }
-            add_log('Created fallback synthesis from text', 'info')
-
-        required_fields = ['clarifiedFocus', 'theoreticalFoundations', 'keyTensions',
-                          'criticalQuestions', 'integratedPerspectives', 'recommendedNextSteps']
-        missing_fields = [f for f in required_fields if f not in synthesis]
-        if missing_fields:
-            st.warning(f"⚠️ Synthesis missing fields: {', '.join(missing_fields)}")
-            add_log(f'Missing fields: {missing_fields}', 'error')
-
-        st.session_state.synthesis = synthesis
-        progress_bar.progress(1.0)
-        status_text.text("Synthesis complete!")
-        add_log('✅ Stage 3: Synthesis complete!', 'success')
-
-        progress_bar.empty()
-        status_text.empty()
-
-    except Exception as e:
-        progress_bar.empty()
-        status_text.empty()
-        error_msg = f"Synthesis error: {str(e)}"
-        st.error(f"❌ {error_msg}")
-        add_log(f"⚠️ {error_msg}", 'error')
-
-        import traceback
-        st.expander("🔍 Error Details").code(traceback.format_exc())
+    submit_stage('synthesize', "Calling synthesis model (fields appear below as they are written)", synthesize)
+
+def debate_synthesis(user_topic):
+    """More rounds of peer review and synthesis revision, until the rankings settle"""
+    if not st.session_state.synthesis:
+        return
+    exploration, peer_reviews = st.session_state.exploration, st.session_state.peer_reviews
+    synthesis, previous = st.session_state.synthesis, st.session_state.debate
+    # A further debate goes on from the rounds already held
+    rounds = len((previous or {}).get('rounds') or ()) + st.session_state.debate_rounds
+
+    async def debate(council):
+        result, revised = await council.debate(user_topic, exploration, peer_reviews, synthesis, rounds=rounds,
+                                               previous=previous)
+        return {'debate': result, 'synthesis': revised}
+
+    submit_stage('debate', "Agents debating the synthesis", debate)
 
 def generate_proposal(user_topic):
     """Stage 4: Research Proposal"""
     if not st.session_state.synthesis:
         return
-    
-    add_log('📄 Generating research proposal...', 'info')
-    
     synthesis = st.session_state.synthesis
-    prompt = f"""Based on the researcher's interest in: "{user_topic}"
-
-And the synthesized exploration showing:
-- Clarified Focus: {synthesis['clarifiedFocus']}
-- Theoretical Foundations: {', '.join(synthesis['theoreticalFoundations'])}
-- Key Tensions: {'; '.join(synthesis['keyTensions'])}
-- Critical Questions: {'; '.join(synthesis['criticalQuestions'])}
-
-Generate a concrete research proposal. Format as JSON:
-{{
-  "title": "proposed study title",
-  "researchQuestion": "specific, answerable research question",
-  "background": "brief background explaining the gap this addresses",
-  "methodology": "proposed research design and methods",
-  "expectedContribution": "what this will add to the field",
-  "feasibilityNotes": "practical considerations for implementation"
-}}"""
-    
-    try:
-        with st.spinner('Generating proposal...'):
-            response = call_llm(
-                "You are a research proposal writer who creates concrete, feasible study designs.",
-                prompt,
-                SYNTHESIS_MODEL,
-                'Proposal Writer'
-            )
-            
-            json_start = response.find('{')
-            json_end = response.rfind('}') + 1
-            if json_start >= 0 and json_end > json_start:
-                json_str = response[json_start:json_end]
-                proposal = json.loads(json_str)
-                st.session_state.proposal = proposal
-                add_log('✅ Proposal generated!', 'success')
-    except Exception as e:
-        st.error(f"Proposal generation error: {str(e)}")
-        add_log(f"⚠️ Proposal error: {str(e)}", 'error')
+
+    async def propose(council):
+        return {'proposal': await council.propose(user_topic, synthesis)}
+
+    submit_stage('propose', "Generating proposal", propose)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_consensus(run_id, rankings, _explorations, _reviews):
+    """consensus_ranking() for a run, recomputed only when some reviewer's ranking changes"""
+    return consensus_ranking(_explorations, _reviews)
+
+def review_rankings(reviews):
+    return tuple((tuple(review.get('ranking') or ()), tuple(review.get('assignedIdeas') or ())) for review in reviews)
+
+def lazy_tabs(labels, key):
+    """Tabs whose content is only built for the selected one"""
+    return st.tabs(labels, key=key, on_change='rerun')
+
+LOG_PAGE_SIZE = 50
+LOG_ICONS = {'info': 'ℹ️', 'progress': '⏳', 'success': '✅', 'error': '❌'}
+
+def log_table(records):
+    """One markdown table for a page of event records"""
+    rows = ["| Time | Stage | Agent | Event | Latency | Chars | Tokens |", "|---|---|---|---|---|---|---|"]
+    for record in records:
+        message = ' '.join(str(record['message']).split()).replace('|', '\\|')
+        latency = '' if record['latency'] is None else f"{record['latency']:.1f}s"
+        rows.append(
+            f"| {datetime.fromtimestamp(record['time']).strftime('%H:%M:%S')} | {record['stage'] or ''} | "
+            f"{record['agent'] or ''} | {LOG_ICONS.get(record['level'], '')} {message} | {latency} | "
+            f"{record['chars'] or ''} | {record['tokens'] or ''} |"
+        )
+    return "\n".join(rows)
+
+@st.fragment
+def show_activity_log():
+    event_log = st.session_state.logs
+    if not event_log:
+        return
+    log_panel = st.expander("📋 Activity Log", expanded=False, key='activity_log_open', on_change='rerun')
+    if not log_panel.open:
+        return
+    with log_panel:
+        cache_stats = response_cache().stats()
+        st.caption(
+            f"💾 Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"· {cache_stats['entries']} entries ({cache_stats['bytes'] / 1024 / 1024:.1f} MB)"
+        )
+        flight_stats = get_single_flight().stats()
+        st.caption(
+            f"🔗 In-flight sharing: {flight_stats['coalesced']} calls joined an identical request "
+            f"· {flight_stats['upstream']} requests sent · {flight_stats['in_flight']} in flight"
+        )
+        counts = event_log.counts()
+        kept = f"last {len(event_log)} of {event_log.total} events" if event_log.dropped else f"{len(event_log)} events"
+        st.caption(f"📋 {kept} · " + " · ".join(f"{LOG_ICONS[level]} {counts[level]}" for level in LEVELS))
+
+        col1, col2, col3 = st.columns([3, 1, 1])
+        with col1:
+            levels = st.segmented_control("Show", LEVELS, selection_mode='multi', default=list(LEVELS),
+                                          format_func=lambda level: f"{LOG_ICONS[level]} {level}", key='log_levels')
+        pages = event_log.page(0, LOG_PAGE_SIZE, levels)[1]
+        if st.session_state.get('log_page', 1) > pages:
+            st.session_state.log_page = pages
+        with col2:
+            page = st.number_input("Page (newest first)", min_value=1, max_value=pages, key='log_page')
+        with col3:
+            # The export is only built when the button is clicked
+            st.download_button("⬇️ Export JSONL", event_log.to_jsonl, file_name="activity_log.jsonl",
+                               mime="application/x-ndjson", on_click='ignore')
+        records = event_log.page(page - 1, LOG_PAGE_SIZE, levels)[0]
+        if records:
+            st.markdown(log_table(records))
+        else:
+            st.caption("No events at the selected levels")
+
+def telemetry_table(summary):
+    """Markdown table of a run's calls by stage and agent"""
+    rows = ["| Stage | Agent | Model | Calls | Wall | First token | Tokens in (cached)/out | Cost |",
+            "|---|---|---|---|---|---|---|---|"]
+    for row in summary['agents']:
+        wall = '–' if row['max_wall'] is None else f"{row['max_wall']:.1f}s"
+        ttft = '–' if row['max_ttft'] is None else f"{row['max_ttft']:.1f}s"
+        cost = f"${row['cost']:.4f}" if row['cost_known'] else '?'
+        tokens = f"{row['prompt_tokens']:,} ({row['cached_tokens']:,})/{row['completion_tokens']:,}"
+        rows.append(f"| {STAGES.get(row['stage'], row['stage'])} | {row['agent']} | `{row['model']}` | "
+                    f"{row['calls']} | {wall} | {ttft} | {tokens} | {cost} |")
+    return "\n".join(rows)
+
+@st.fragment
+def show_telemetry():
+    if not st.session_state.run_id:
+        return
+    summary = telemetry().run_summary(st.session_state.run_id)
+    if not summary['calls']:
+        return
+    panel = st.expander(f"📈 Run Telemetry · {usage_line(summary)}", expanded=False, key='telemetry_open',
+                        on_change='rerun')
+    if not panel.open:
+        return
+    with panel:
+        stage_walls = " · ".join(f"{STAGES.get(name, name)}: {data['wall']:.1f}s"
+                                 for name, data in summary['stages'].items() if data.get('wall') is not None)
+        st.caption(f"⏱️ Stage wall time — {stage_walls}" if stage_walls else "⏱️ No stage has finished yet")
+        st.markdown(telemetry_table(summary))
+        st.caption("Wall and first-token times are the slowest call's. Tokens come from the API's usage report "
+                   "(estimated when it sends none); costs from `MODEL_PRICES` in `swarm_council/config.py`.")
+        st.download_button("⬇️ Metrics (OpenMetrics)", telemetry().openmetrics, file_name="swarm_metrics.txt",
+                           mime="application/openmetrics-text", on_click='ignore')
+
+@st.fragment
+def show_exploration():
+    if not st.session_state.exploration:
+        return
+    st.divider()
+    st.subheader("🧠 Stage 1: Diverse Idea Generation")
+    st.caption("Each agent explores the topic from their unique perspective")
+
+    tabs = lazy_tabs([f"{agent['icon']} {agent['agentName']}" for agent in st.session_state.exploration],
+                     key='exploration_tab')
+    for tab, agent_data in zip(tabs, st.session_state.exploration):
+        if tab.open:
+            with tab:
+                render_exploration(agent_data)
+
+@st.fragment
+def show_peer_reviews():
+    if not st.session_state.peer_reviews:
+        return
+    st.divider()
+    st.subheader("👥 Stage 2: Anonymous Peer Reviews (Karpathy-style)")
+    idea_count = len(st.session_state.exploration)
+    if all(len(review.get('assignedIdeas') or range(idea_count)) == idea_count
+           for review in st.session_state.peer_reviews):
+        st.caption("Each agent reviewed ALL proposals anonymously, identifying strengths, weaknesses, and missing "
+                   "elements")
+    else:
+        st.caption("Each agent reviewed a balanced subset of the proposals anonymously, identifying strengths, "
+                   "weaknesses, and missing elements")
+
+    render_consensus(cached_consensus(st.session_state.run_id, review_rankings(st.session_state.peer_reviews),
+                                      st.session_state.exploration, st.session_state.peer_reviews))
+
+    tabs = lazy_tabs([f"{review['icon']} {review['reviewerName']}" for review in st.session_state.peer_reviews],
+                     key='review_tab')
+    for idx, (tab, review_data) in enumerate(zip(tabs, st.session_state.peer_reviews)):
+        if tab.open:
+            with tab:
+                render_peer_review(review_data, key=f"review_{idx}")
+
+@st.fragment
+def show_synthesis():
+    if not st.session_state.synthesis:
+        return
+    st.divider()
+    st.subheader("✨ Stage 3: Superior Synthesis")
+    st.caption("Integrates best elements from multiple proposals while addressing peer-identified weaknesses")
+
+    render_synthesis(st.session_state.synthesis)
+
+    if st.session_state.debate:
+        expander = st.expander("🗣️ Debate Rounds", key='debate_rounds_expander', on_change='rerun')
+        if expander.open:
+            with expander:
+                render_debate(st.session_state.debate)
+
+    st.divider()
+    if st.session_state.proposal is None and st.session_state.job_id is None:
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            proposal_disabled = not st.session_state.api_key
+            if st.button("📄 Generate Research Proposal", type="primary", disabled=proposal_disabled):
+                generate_proposal(st.session_state.current_topic)
+                st.rerun()
+        with col2:
+            if st.button(f"🗣️ Debate ({st.session_state.debate_rounds} more rounds)",
+                         disabled=not st.session_state.api_key):
+                debate_synthesis(st.session_state.current_topic)
+                st.rerun()
+        with col3:
+            if not st.session_state.api_key:
+                st.caption("⚠️ API key required")
+            else:
+                st.caption("Optional: Generate a concrete research proposal based on the synthesis, or let the "
+                           "agents debate it further first (stops early once their rankings settle)")
+
+@st.fragment
+def show_proposal():
+    if not st.session_state.proposal:
+        return
+    st.divider()
+    st.subheader("📄 Stage 4: Research Proposal (Optional)")
+
+    render_proposal(st.session_state.proposal)
+
+@st.fragment
+def performance_settings():
+    st.subheader("⏱️ Performance")
+    st.session_state.stage_deadline = st.number_input(
+        "Stage deadline (seconds)",
+        min_value=1,
+        max_value=600,
+        value=st.session_state.stage_deadline,
+        step=10,
+        help="Stage 1 and 2 agents run in parallel; agents that have not answered by this deadline are skipped"
+    )
+    st.session_state.review_quorum = st.number_input(
+        "Peer review quorum",
+        min_value=1,
+        max_value=len(SWARM_AGENTS),
+        value=st.session_state.review_quorum,
+        help="Stage 2 finishes as soon as this many reviews are in"
+    )
+    st.session_state.quorum_deadline = st.number_input(
+        "Quorum deadline (seconds)",
+        min_value=1,
+        max_value=600,
+        value=st.session_state.quorum_deadline,
+        step=10,
+        help="After this long, Stage 2 finishes with whatever reviews are in (at least one)"
+    )
+    st.session_state.late_review_policy = st.radio(
+        "Late reviews",
+        LATE_REVIEW_POLICIES,
+        index=LATE_REVIEW_POLICIES.index(st.session_state.late_review_policy),
+        format_func={'drop': 'Drop', 'refine': 'Refine synthesis with them'}.get,
+        horizontal=True,
+        help="What to do with reviews that finish after Stage 2 reached its quorum"
+    )
+    slos = ', '.join(f"{STAGES[stage].split(' (')[0]} {seconds}s"
+                     for stage, seconds in ROUTER_LATENCY_SLO_SECONDS.items())
+    st.session_state.routing_policy = st.radio(
+        "Model routing",
+        ROUTING_POLICIES,
+        index=ROUTING_POLICIES.index(st.session_state.routing_policy),
+        format_func={'static': 'As configured', 'fastest': 'Fastest', 'cheapest': 'Cheapest',
+                     'slo': 'Cheapest within SLO'}.get,
+        horizontal=True,
+        help="Which of each agent's allowed models is called first, from their recent average latency, error rate "
+             f"and cost. Latency SLOs: {slos}."
+    )
+    st.session_state.debate_rounds = st.number_input(
+        "Debate rounds",
+        min_value=1,
+        max_value=DEBATE_MAX_ROUNDS,
+        value=st.session_state.debate_rounds,
+        help="Most rounds of re-review and revision per debate; it stops early once the rankings settle"
+    )
+
+@st.fragment
+def reuse_settings():
+    st.subheader("♻️ Similar Topics")
+    st.caption("A topic close to one explored before can reuse that run's ideas and peer reviews "
+               "(Stages 1 and 2) instead of calling the models again.")
+    st.session_state.topic_reuse_mode = st.radio(
+        "Reuse",
+        TOPIC_REUSE_MODES,
+        index=TOPIC_REUSE_MODES.index(st.session_state.topic_reuse_mode),
+        format_func={'off': 'Never', 'offer': 'Ask me', 'auto': 'Automatically'}.get,
+        horizontal=True
+    )
+    st.session_state.topic_reuse_threshold = st.slider(
+        "Similarity threshold",
+        min_value=0.5,
+        max_value=1.0,
+        value=float(st.session_state.topic_reuse_threshold),
+        step=0.05,
+        disabled=st.session_state.topic_reuse_mode == 'off',
+        help="How alike two topics must be (share of words and word fragments in common) to count as the same"
+    )
+
+@st.fragment
+def cache_settings():
+    st.subheader("💾 Response Cache")
+    st.caption("Identical requests are answered from a local cache. Tick a stage to always call the models again.")
+    for stage_key, stage_label in STAGES.items():
+        bypass = st.checkbox(f"Bypass cache: {stage_label}", value=stage_key in st.session_state.cache_bypass,
+                             key=f"cache_bypass_{stage_key}")
+        if bypass:
+            st.session_state.cache_bypass.add(stage_key)
+        else:
+            st.session_state.cache_bypass.discard(stage_key)
+    if st.button("🗑️ Clear cache"):
+        response_cache().clear()
+        st.toast("Response cache cleared")
 
 # Main UI
 st.title("🧠 AI Swarm Council")
@@ -585,6 +827,11 @@ with st.sidebar:
     
     if api_key_input != st.session_state.api_key:
         st.session_state.api_key = api_key_input
+        if api_key_input:
+            # Open connections now so the first Stage 1 call skips DNS/TLS setup
+            prewarm_client(api_key_input, connections=MAX_PARALLEL_AGENTS)
+            if requested_run and requested_run != st.session_state.run_id:
+                st.rerun()  # the run in the URL can be opened now
     
     if st.session_state.api_key:
         st.success("✅ API Key Set")
@@ -607,9 +854,42 @@ with st.sidebar:
     st.caption(f"✨ Synthesis: `{SYNTHESIS_MODEL.split('/')[-1][:20]}`")
     
     st.divider()
+
+    performance_settings()
+
+    st.divider()
+
+    cache_settings()
+
+    st.divider()
+
+    reuse_settings()
+
+    st.divider()
+
+    st.subheader("🗂️ Recent Runs")
+    st.caption("Finished stages are saved as they complete. Open a run to pick it up where it stopped.")
+    recent_runs = run_store().recent_runs(limit=8, owner=user_key()) if st.session_state.api_key else []
+    if not recent_runs:
+        st.caption("No runs yet")
+    for run_id, topic, last_stage, updated in recent_runs:
+        label = ' '.join(topic.split()).replace('[', '(').replace(']', ')')
+        label = label if len(label) <= 40 else label[:40] + '…'
+        done = STAGES.get(last_stage, 'nothing yet')
+        current = ' (current)' if run_id == st.session_state.run_id else ''
+        st.caption(f"[{label}](?run={run_id}){current}  \n"
+                   f"{datetime.fromtimestamp(updated).strftime('%Y-%m-%d %H:%M')} · last: {done}")
+
+    st.divider()
     
-    st.subheader("💰 Cost Estimate")
-    st.caption("Full 4-stage process: **$0.30-0.60**")
+    st.subheader("💰 Cost")
+    run_summary = telemetry().run_summary(st.session_state.run_id) if st.session_state.run_id else None
+    if run_summary and run_summary['calls']:
+        st.caption(f"This run so far: **${run_summary['cost']:.4f}** over {run_summary['calls']} calls")
+        if not run_summary['cost_known']:
+            st.caption("Some models have no price in `MODEL_PRICES`; their calls are not counted")
+    else:
+        st.caption("Full 4-stage process: **$0.30-0.60** (estimate)")
     st.caption("Stage 1: 5 models")
     st.caption("Stage 2: 5 models (peer review)")
     st.caption("Stage 3: 1 model (synthesis)")
@@ -627,9 +907,31 @@ with st.sidebar:
 with st.expander("🔍 Detailed Model Configuration", expanded=False):
     st.markdown("**Full Agent Model Assignments:**")
     for agent in SWARM_AGENTS:
-        st.markdown(f"- {agent['icon']} **{agent['name']}**: `{agent['model']}`")
-    st.markdown(f"- ✨ **Synthesis & Proposal**: `{SYNTHESIS_MODEL}`")
-    st.caption("All models accessed via OpenRouter API")
+        fallbacks = ''.join(f" → `{model}`" for model in agent.get('fallback_models', ()))
+        st.markdown(f"- {agent['icon']} **{agent['name']}**: `{agent['model']}`{fallbacks}")
+    fallbacks = ''.join(f" → `{model}`" for model in SYNTHESIS_FALLBACK_MODELS)
+    st.markdown(f"- ✨ **Synthesis & Proposal**: `{SYNTHESIS_MODEL}`{fallbacks}")
+    st.caption("All models accessed via OpenRouter API. Models after → are fallbacks, used when the primary is "
+               "slow or failing.")
+    model_stats = get_router().snapshot()
+    if model_stats:
+        st.markdown("**Measured model performance** (moving averages used by model routing):")
+        rows = ["| Model | Stage | Latency | Error rate | Cost / 1k tokens | Calls |", "|---|---|---|---|---|---|"]
+        for model, stages in sorted(model_stats.items()):
+            for stage, entry in stages.items():
+                latency = '–' if entry['latency'] is None else f"{entry['latency']:.1f}s"
+                errors = '–' if entry['error_rate'] is None else f"{entry['error_rate']:.0%}"
+                cost = '–' if entry['cost_per_token'] is None else f"${entry['cost_per_token'] * 1000:.4f}"
+                rows.append(f"| `{model}` | {STAGES.get(stage, stage)} | {latency} | {errors} | {cost} | "
+                            f"{entry['samples']} |")
+        st.markdown("\n".join(rows))
+    decisions = get_router().decisions(limit=10)
+    if decisions:
+        st.markdown("**Recent routing decisions:**")
+        for decision in reversed(decisions):
+            st.caption(f"{datetime.fromtimestamp(decision['time']).strftime('%H:%M:%S')} · {decision['role']} "
+                       f"({STAGES.get(decision['stage'], decision['stage'])}) → `{decision['model']}` · "
+                       f"{decision['reason']}")
 
 # Process flow indicator
 st.markdown("### 🔄 AI Swarm Council Process")
@@ -662,7 +964,10 @@ with col4:
 st.divider()
 
 # Input section
-if st.session_state.exploration is None:
+if st.session_state.job_error:
+    show_job_error()
+
+if st.session_state.exploration is None and st.session_state.job_id is None:
     st.subheader("💭 What research topic interests you?")
     
     user_topic = st.text_area(
@@ -672,23 +977,50 @@ if st.session_state.exploration is None:
         key="topic_input"
     )
     
-    col1, col2 = st.columns([1, 3])
-    with col1:
-        explore_disabled = not user_topic.strip() or not st.session_state.api_key
-        if st.button("🚀 Explore with Swarm", type="primary", disabled=explore_disabled):
-            explore_topic(user_topic)
-            st.rerun()
-    
-    with col2:
-        if not st.session_state.api_key:
-            st.caption("⚠️ Please enter your OpenRouter API key in the sidebar first")
-        else:
-            st.caption("💡 Stage 1: 5 agents with different perspectives will generate unique insights from their cognitive/clinical/assessment/technology/cross-cultural lenses")
+    topic_match = st.session_state.topic_match
+    if topic_match is not None and topic_match[0] == user_topic:
+        offered_topic, match = topic_match
+        st.info(f"♻️ A similar topic was explored before ({match['similarity']:.0%} similar): "
+                f"[{match['topic']}](?run={match['run_id']})  \n"
+                "Its ideas and peer reviews can be reused, going straight to synthesis.")
+        col1, col2, col3 = st.columns([1, 1, 2])
+        with col1:
+            if st.button("♻️ Reuse Stages 1 and 2", type="primary"):
+                explore_topic(offered_topic, reuse=match)
+                st.rerun()
+        with col2:
+            if st.button("🚀 Explore from Scratch"):
+                explore_topic(offered_topic)
+                st.rerun()
+    else:
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            explore_disabled = not user_topic.strip() or not st.session_state.api_key
+            if st.button("🚀 Explore with Swarm", type="primary", disabled=explore_disabled):
+                match = similar_run(user_topic)
+                if match is not None and st.session_state.topic_reuse_mode == 'offer':
+                    st.session_state.topic_match = (user_topic, match)
+                else:
+                    explore_topic(user_topic, reuse=match)
+                st.rerun()
+
+        with col2:
+            if not st.session_state.api_key:
+                st.caption("⚠️ Please enter your OpenRouter API key in the sidebar first")
+            else:
+                st.caption("💡 Stage 1: 5 agents with different perspectives will generate unique insights from their cognitive/clinical/assessment/technology/cross-cultural lenses")
 
 else:
     st.info(f"**Your Topic:** {st.session_state.get('current_topic', 'Unknown')}")
+    reused_from = st.session_state.reused_from
+    if reused_from is not None:
+        st.caption(f"♻️ Stages 1 and 2 reused from [{reused_from['topic']}](?run={reused_from['run_id']}) "
+                   f"({reused_from['similarity']:.0%} similar)")
+
+    if st.session_state.job_id is not None:
+        show_job()
 
-    if st.session_state.exploration and not st.session_state.peer_reviews:
+    elif st.session_state.exploration and not st.session_state.peer_reviews:
         st.success("✅ Stage 1 Complete: Ideas Generated!")
         st.markdown("**Next Step:** Conduct anonymous peer review where each agent critiques all proposals")
         col1, col2 = st.columns([1, 3])
@@ -716,9 +1048,13 @@ else:
 
     st.divider()
     if st.button("🔄 Start Over with New Topic"):
-        for key in ['exploration', 'peer_reviews', 'synthesis', 'proposal', 'logs', 'current_topic']:
+        if st.session_state.job_id is not None:
+            job_queue().cancel(st.session_state.job_id)
+        for key in ['exploration', 'peer_reviews', 'synthesis', 'debate', 'proposal', 'logs', 'current_topic', 'run_id',
+                    'job_id', 'job_error', 'topic_match', 'reused_from']:
             if key in st.session_state:
                 del st.session_state[key]
+        st.query_params.clear()
         st.rerun()
 
 if 'topic_input' in st.session_state and st.session_state.topic_input:
@@ -726,164 +1062,14 @@ if 'topic_input' in st.session_state and st.session_state.topic_input:
 
 st.divider()
 
-# Display logs
-if st.session_state.logs:
-    with st.expander("📋 Activity Log", expanded=False):
-        for log in st.session_state.logs:
-            if log['type'] == 'error':
-                st.error(f"[{log['timestamp']}] {log['message']}")
-            elif log['type'] == 'success':
-                st.success(f"[{log['timestamp']}] {log['message']}")
-            else:
-                st.info(f"[{log['timestamp']}] {log['message']}")
-
-# Display exploration results
-if st.session_state.exploration:
-    st.divider()
-    st.subheader("🧠 Stage 1: Diverse Idea Generation")
-    st.caption("Each agent explores the topic from their unique perspective")
-    
-    tabs = st.tabs([f"{agent['icon']} {agent['agentName']}" 
-                    for agent in st.session_state.exploration])
-    
-    for idx, agent_data in enumerate(st.session_state.exploration):
-        with tabs[idx]:
-            st.caption(f"🤖 Model: `{agent_data.get('model', 'Unknown')}`")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Key Concepts:**")
-                for concept in agent_data['keyConcepts']:
-                    st.markdown(f"- {concept}")
-                
-                st.markdown("**Theoretical Frameworks:**")
-                st.write(", ".join(agent_data['theoreticalFrameworks']))
-            
-            with col2:
-                st.markdown("**✅ What's Clear:**")
-                st.write(agent_data['whatsClear'])
-                
-                st.markdown("**⚠️ What's Fuzzy:**")
-                st.write(agent_data['whatsFuzzy'])
-            
-            st.markdown("**❓ Important Questions:**")
-            for question in agent_data['importantQuestions']:
-                st.markdown(f"- {question}")
-            
-            st.markdown("**💡 Considerations:**")
-            st.info(agent_data['considerations'])
-
-# Display peer reviews
-if st.session_state.peer_reviews:
-    st.divider()
-    st.subheader("👥 Stage 2: Anonymous Peer Reviews (Karpathy-style)")
-    st.caption("Each agent reviewed ALL proposals anonymously, identifying strengths, weaknesses, and missing elements")
-
-    tabs = st.tabs([f"{review['icon']} {review['reviewerName']}"
-                    for review in st.session_state.peer_reviews])
-
-    for idx, review_data in enumerate(st.session_state.peer_reviews):
-        with tabs[idx]:
-            st.caption(f"🤖 Model: `{review_data.get('model', 'Unknown')}`")
-
-            st.markdown("### 📝 Overall Commentary")
-            st.info(review_data['overallCommentary'])
-
-            st.markdown("### 🏆 Ranking (Strongest to Weakest)")
-            ranking_str = " → ".join([f"Idea #{i}" for i in review_data['ranking']])
-            st.success(ranking_str)
-
-            st.markdown("### 📊 Detailed Reviews")
-            for review in review_data['reviews']:
-                with st.expander(f"Idea #{review['ideaNumber']} - Detailed Critique"):
-                    col1, col2, col3 = st.columns(3)
-
-                    with col1:
-                        st.markdown("**✅ Strengths:**")
-                        for strength in review['strengths']:
-                            st.markdown(f"- {strength}")
-
-                    with col2:
-                        st.markdown("**⚠️ Weaknesses:**")
-                        for weakness in review['weaknesses']:
-                            st.markdown(f"- {weakness}")
-
-                    with col3:
-                        st.markdown("**➕ Missing Elements:**")
-                        for missing in review['missingElements']:
-                            st.markdown(f"- {missing}")
-
-# Display synthesis
-if st.session_state.synthesis:
-    st.divider()
-    st.subheader("✨ Stage 3: Superior Synthesis")
-    st.caption("Integrates best elements from multiple proposals while addressing peer-identified weaknesses")
-    
-    synthesis = st.session_state.synthesis
-    
-    st.markdown("### 🎯 Clarified Research Focus")
-    st.write(synthesis['clarifiedFocus'])
-    
-    st.markdown("### 📚 Theoretical Foundations to Build On")
-    for framework in synthesis['theoreticalFoundations']:
-        st.markdown(f"✅ {framework}")
-    
-    st.markdown("### ⚡ Key Tensions to Resolve")
-    for tension in synthesis['keyTensions']:
-        st.markdown(f"⚠️ {tension}")
-    
-    st.markdown("### ❓ Critical Questions")
-    for idx, question in enumerate(synthesis['criticalQuestions'], 1):
-        st.markdown(f"**Q{idx}:** {question}")
-    
-    st.markdown("### 🔗 Integrated Perspectives")
-    st.write(synthesis['integratedPerspectives'])
-
-    if 'peerReviewInsights' in synthesis:
-        st.markdown("### 🔍 Peer Review Insights")
-        st.write(synthesis['peerReviewInsights'])
-
-    st.markdown("### 🚀 Recommended Next Steps")
-    for idx, step in enumerate(synthesis['recommendedNextSteps'], 1):
-        st.markdown(f"{idx}. {step}")
-    
-    st.divider()
-    if st.session_state.proposal is None:
-        col1, col2 = st.columns([1, 3])
-        with col1:
-            proposal_disabled = not st.session_state.api_key
-            if st.button("📄 Generate Research Proposal", type="primary", disabled=proposal_disabled):
-                generate_proposal(st.session_state.current_topic)
-                st.rerun()
-        with col2:
-            if not st.session_state.api_key:
-                st.caption("⚠️ API key required")
-            else:
-                st.caption("Optional: Generate a concrete research proposal based on the synthesis")
-
-# Display proposal
-if st.session_state.proposal:
-    st.divider()
-    st.subheader("📄 Stage 4: Research Proposal (Optional)")
-    
-    proposal = st.session_state.proposal
-    
-    st.markdown(f"## {proposal['title']}")
-    
-    st.markdown("### Research Question")
-    st.write(proposal['researchQuestion'])
-    
-    st.markdown("### Background")
-    st.write(proposal['background'])
-    
-    st.markdown("### Methodology")
-    st.write(proposal['methodology'])
-    
-    st.markdown("### Expected Contribution")
-    st.write(proposal['expectedContribution'])
-    
-    st.info(f"**Feasibility Notes:** {proposal['feasibilityNotes']}")
+# Results. Each section is a fragment with lazily built tabs and expanders, so
+# opening a tab or expander redraws only that section instead of the page.
+show_activity_log()
+show_telemetry()
+show_exploration()
+show_peer_reviews()
+show_synthesis()
+show_proposal()
 
 # Footer
 st.divider()
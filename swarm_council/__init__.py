@@ -0,0 +1,5 @@
+"""Core building blocks for the AI Swarm Council"""
+from .clients import configure_pool, get_base_url, get_client, prewarm_client, set_base_url, OPENROUTER_BASE_URL
+from .engine import SwarmCouncil
+from .results import (Consensus, CouncilError, CouncilResult, Debate, Exploration, LateResults, PeerReview,
+                      ProgressEvent, Proposal, Synthesis)
@@ -0,0 +1,242 @@
+"""Run the council over many topics from a JSONL file
+
+    python -m swarm_council.batch topics.jsonl -o results.jsonl --concurrency 10
+
+Each input line is a JSON object with the topic in `topic` (or `title` and
+`body`, as in requests.jsonl) and an optional `id` / `request_id`. Topics run
+concurrently and all of their model calls share one bounded worker pool, so
+--concurrency is a global limit on in-flight calls. Every finished topic is
+appended to the output file straight away; on restart, topics that already
+have an "ok" line in the output are skipped, and topics that were cut short
+resume from their last checkpointed stage (see runstore.py). With
+--reuse-threshold, a new topic close enough to one already in the run store
+starts from that run's Stage 1 and 2 (see topics.py). With --export, every
+finished topic's run is streamed into Parquet tables as well (see export.py).
+With --debate-rounds, each synthesis is debated further before the proposal.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (DEBATE_ROUNDS, LATE_REVIEW_POLICIES, LATE_REVIEW_POLICY, REVIEW_QUORUM,
+                     REVIEW_QUORUM_DEADLINE_SECONDS, ROUTING_POLICIES, ROUTING_POLICY, STAGE_DEADLINE_SECONDS,
+                     TOPIC_REUSE_THRESHOLD)
+from .engine import SwarmCouncil
+from .events import EventLog
+from .export import RunExporter
+from .runstore import get_run_store
+from .telemetry import get_telemetry
+
+
+def topic_text(record):
+    if record.get('topic'):
+        return record['topic']
+    return "\n\n".join(part for part in (record.get('title'), record.get('body')) if part)
+
+
+def topic_id(record, text):
+    for key in ('id', 'request_id', 'topic_id'):
+        if record.get(key) is not None:
+            return str(record[key])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+
+
+def run_id_for(tid, text):
+    """Checkpoint id of a topic; includes the text so an edited topic starts over"""
+    return f"batch-{tid}-{hashlib.sha1(text.encode('utf-8')).hexdigest()[:8]}"
+
+
+def load_topics(path):
+    """Read (id, topic) pairs from a JSONL file, skipping blank lines"""
+    topics = []
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            text = topic_text(record)
+            if not text:
+                raise ValueError(f"{path}:{line_no}: no topic text")
+            topics.append((topic_id(record, text), text))
+    return topics
+
+
+def completed_ids(path):
+    """Ids that already finished successfully in a previous run's output"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash; that topic simply runs again
+                continue
+            if record.get('status') == 'ok':
+                done.add(record['id'])
+    return done
+
+
+async def run_batch(topics, output_path, api_key, concurrency=10, max_topics=None, proposal=True,
+                    stage_deadline=STAGE_DEADLINE_SECONDS, review_quorum=REVIEW_QUORUM,
+                    quorum_deadline=REVIEW_QUORUM_DEADLINE_SECONDS, late_review_policy=LATE_REVIEW_POLICY,
+                    verbose=False, run_store=None, event_log=None, reuse_threshold=None,
+                    routing_policy=ROUTING_POLICY, council_factory=SwarmCouncil, exporter=None,
+                    debate_rounds=DEBATE_ROUNDS):
+    """Run every topic through the council, appending one result line per finished topic
+
+    With a run store, each topic's stages are checkpointed as they finish,
+    and with a reuse_threshold too, near-duplicates of earlier topics reuse
+    their Stage 1 and 2. With debate_rounds, each synthesis is followed by
+    up to that many debate rounds (see SwarmCouncil.debate()).
+    Log events of every topic go to `event_log` (an events.EventLog), tagged
+    with the topic's run id. With an `exporter` (an export.RunExporter) and a
+    run store, each topic's run is added to it once the topic is done.
+    Returns (succeeded, failed) counts for the topics that were run.
+    """
+    skip = completed_ids(output_path)
+    todo = [(tid, text) for tid, text in topics if tid not in skip]
+    if skip:
+        print(f"Skipping {len(topics) - len(todo)} topic(s) already completed in {output_path}", file=sys.stderr)
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    topic_slots = asyncio.Semaphore(max_topics or concurrency)
+    counts = {'ok': 0, 'error': 0}
+
+    with open(output_path, 'a', encoding='utf-8') as out:
+        async def run_one(tid, text):
+            async with topic_slots:
+                def on_event(event):
+                    if verbose and event.kind == 'log':
+                        print(f"[{tid}] {event.message}", file=sys.stderr)
+
+                council = council_factory(api_key, stage_deadline=stage_deadline, review_quorum=review_quorum,
+                                          quorum_deadline=quorum_deadline, late_review_policy=late_review_policy,
+                                          on_event=on_event, executor=executor, run_store=run_store,
+                                          run_id=run_id_for(tid, text), event_log=event_log,
+                                          reuse_threshold=reuse_threshold, routing_policy=routing_policy,
+                                          debate_rounds=debate_rounds)
+                started = time.monotonic()
+                record = {'id': tid, 'topic': text}
+                try:
+                    result = await council.run(text, proposal=proposal)
+                    record.update(status='ok', exploration=result.exploration, peerReviews=result.peer_reviews,
+                                  consensus=result.consensus, synthesis=result.synthesis, proposal=result.proposal)
+                    if result.reused_from is not None:
+                        record['reusedFrom'] = result.reused_from
+                    if result.debate is not None:
+                        record['debate'] = result.debate
+                except Exception as e:
+                    record.update(status='error', error=f"{type(e).__name__}: {e}")
+                record['elapsed'] = round(time.monotonic() - started, 2)
+                usage = council.telemetry.run_summary(council.run_id)
+                record['usage'] = {key: value for key, value in usage.items() if key != 'agents'}
+
+                # Writes happen on the event loop thread, so lines never interleave
+                out.write(json.dumps(record, ensure_ascii=False) + '\n')
+                out.flush()
+                if exporter is not None and run_store is not None:
+                    run = run_store.load_run(council.run_id)
+                    if run is not None:
+                        exporter.add(run, run_store.calls(council.run_id))
+                counts[record['status']] += 1
+                print(f"[{counts['ok'] + counts['error']}/{len(todo)}] {tid} {record['status']} "
+                      f"({record['elapsed']}s)", file=sys.stderr)
+
+        try:
+            await asyncio.gather(*(run_one(tid, text) for tid, text in todo))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return counts['ok'], counts['error']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the AI Swarm Council over topics from a JSONL file")
+    parser.add_argument('topics', help="input JSONL with one topic per line")
+    parser.add_argument('-o', '--output', required=True, help="output JSONL; results are appended as topics finish")
+    parser.add_argument('--concurrency', type=int, default=10, help="maximum model calls in flight across all topics")
+    parser.add_argument('--max-topics', type=int, default=None,
+                        help="maximum topics in progress at once (default: same as --concurrency)")
+    parser.add_argument('--no-proposal', action='store_true', help="skip Stage 4")
+    parser.add_argument('--stage-deadline', type=float, default=STAGE_DEADLINE_SECONDS,
+                        help="seconds before Stage 1/2 agents that have not answered are skipped")
+    parser.add_argument('--quorum', type=int, default=REVIEW_QUORUM,
+                        help="Stage 2 finishes once this many reviews are in (0: wait for all)")
+    parser.add_argument('--quorum-deadline', type=float, default=REVIEW_QUORUM_DEADLINE_SECONDS,
+                        help="seconds after which Stage 2 finishes with whatever reviews are in")
+    parser.add_argument('--late-reviews', choices=LATE_REVIEW_POLICIES, default=LATE_REVIEW_POLICY,
+                        help="drop reviews that miss the quorum, or refine the synthesis with them")
+    parser.add_argument('--no-checkpoints', action='store_true',
+                        help="do not checkpoint stages to the run store (a restarted topic starts over)")
+    parser.add_argument('--debate-rounds', type=int, default=DEBATE_ROUNDS,
+                        help="follow each synthesis with up to this many rounds of re-review and revision, "
+                             "stopping early once the rankings settle")
+    parser.add_argument('--routing', choices=ROUTING_POLICIES, default=ROUTING_POLICY,
+                        help="how each call's model is picked from its role's allowed models (see router.py)")
+    parser.add_argument('--reuse-threshold', type=float, default=None,
+                        help="reuse Stage 1 and 2 of an earlier run whose topic is at least this similar (0-1; "
+                             f"{TOPIC_REUSE_THRESHOLD} is a good start); needs checkpoints")
+    parser.add_argument('--event-log', default=None,
+                        help="append every log event (with agent, model, latency, size) to this JSONL file")
+    parser.add_argument('--metrics', default=None,
+                        help="write call and stage metrics in the OpenMetrics text format to this file when done")
+    parser.add_argument('--trace', default=None,
+                        help="write stage and call spans to this Chrome trace-event file (chrome://tracing, Perfetto)")
+    parser.add_argument('--api-key', default=os.environ.get('OPENROUTER_API_KEY'),
+                        help="OpenRouter API key (default: $OPENROUTER_API_KEY)")
+    parser.add_argument('--export', default=None, metavar='DIRECTORY',
+                        help="also write every finished run to Parquet tables in this directory (needs pyarrow)")
+    parser.add_argument('-v', '--verbose', action='store_true', help="print every log event")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or OPENROUTER_API_KEY)")
+    if args.export and args.no_checkpoints:
+        parser.error("--export reads runs from the run store and cannot be used with --no-checkpoints")
+    try:
+        exporter = RunExporter(args.export) if args.export else None
+    except RuntimeError as e:
+        parser.error(str(e))
+
+    topics = load_topics(args.topics)
+    if args.trace:
+        get_telemetry().trace_path = args.trace
+    try:
+        ok, failed = asyncio.run(run_batch(
+            topics, args.output, args.api_key,
+            concurrency=args.concurrency,
+            max_topics=args.max_topics,
+            proposal=not args.no_proposal,
+            stage_deadline=args.stage_deadline,
+            review_quorum=args.quorum or None,
+            quorum_deadline=args.quorum_deadline,
+            late_review_policy=args.late_reviews,
+            verbose=args.verbose,
+            run_store=None if args.no_checkpoints else get_run_store(),
+            reuse_threshold=args.reuse_threshold,
+            routing_policy=args.routing,
+            debate_rounds=args.debate_rounds,
+            # Only the file is wanted here, so the in-memory buffer is kept minimal
+            event_log=EventLog(capacity=1, jsonl_path=args.event_log) if args.event_log else None,
+            exporter=exporter
+        ))
+    finally:
+        if exporter is not None:
+            exporter.close()
+    if args.metrics:
+        with open(args.metrics, 'w', encoding='utf-8') as f:
+            f.write(get_telemetry().openmetrics())
+    print(f"Done: {ok} succeeded, {failed} failed", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,388 @@
+"""Offline benchmark of the whole council against the mock server
+
+    python -m swarm_council.benchmark --topics 8 --seed 1
+    python -m swarm_council.benchmark --topics 8 --seed 1 --rate-limit-rate 0.05 --malformed-rate 0.1
+    python -m swarm_council.benchmark --topics 2 --record cassette.jsonl --api-key $OPENROUTER_API_KEY
+    python -m swarm_council.benchmark --topics 2 --replay cassette.jsonl --replay-speed 0
+
+Topics go through every stage, explore to propose, along the production code
+path (batch runner, scheduler, hedging, parsing, telemetry), with model calls
+answered by a MockServer (see mockserver.py) on a local port. The response
+cache is bypassed and structured-output support is tracked in memory only, so
+a benchmark neither reads nor disturbs what the app has learned.
+
+The report has end-to-end and per-stage wall clock (p50/p95), throughput
+(topics per minute, calls and completion tokens per second) and the share of
+answered calls whose output parsed, per stage. Each report is appended to a
+history file together with the commit and configuration, and compared with
+the previous report for the same configuration; metrics that got worse by
+more than --tolerance are flagged (and fail the run with --fail-on-regression).
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict
+
+from .batch import load_topics, run_batch, run_id_for
+from .clients import get_base_url, set_base_url
+from .config import (LATE_REVIEW_POLICIES, LATE_REVIEW_POLICY, REVIEW_QUORUM, REVIEW_QUORUM_DEADLINE_SECONDS,
+                     ROUTING_POLICIES, ROUTING_POLICY, STAGE_DEADLINE_SECONDS, STAGES)
+from .engine import SwarmCouncil
+from .mockserver import MockServer, config_arguments, config_from_args
+from .router import ModelRouter
+from .runstore import RunStore
+from .structured import (EXPLORATION_SCHEMA, PROPOSAL_SCHEMA, REVIEW_SCHEMA, StructuredOutputSupport,
+                         get_structured_support, set_structured_support, validate)
+from .telemetry import ANSWERED_STATUSES, FREE_STATUSES, Telemetry
+
+DEFAULT_HISTORY_PATH = os.environ.get(
+    'SWARM_BENCHMARK_HISTORY',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-swarm-council', 'benchmarks.jsonl')
+)
+DEFAULT_TOLERANCE = 0.10
+
+SAMPLE_TOPICS = [
+    "How do urban heat islands change the way cities should plan public green space?",
+    "What makes open-source maintainers burn out, and which governance models prevent it?",
+    "Can retrieval-augmented models reduce hallucination in clinical question answering?",
+    "How does remote work affect the diffusion of tacit knowledge inside firms?",
+    "What limits the recycling of lithium-ion batteries at scale?",
+    "Do prediction markets improve forecasts of scientific replication?",
+    "How should small island states adapt fisheries policy to shifting fish stocks?",
+    "What role do informal caregivers play in the economics of ageing populations?",
+]
+
+# (metric, path in the report, whether higher is better, smallest change that
+# can count as a regression, so that millisecond jitter on fast stages does not)
+COMPARED_METRICS = [
+    ('e2e p50 (s)', ('e2e', 'p50'), False, 0.05),
+    ('e2e p95 (s)', ('e2e', 'p95'), False, 0.05),
+    ('total wall (s)', ('wall',), False, 0.05),
+    ('topics/min', ('throughput', 'topics_per_min'), True, 0.0),
+    ('calls/s', ('throughput', 'calls_per_sec'), True, 0.0),
+    ('parse success', ('parse', 'overall'), True, 0.01),
+    ('cached prompt share', ('prompt_cache', 'cached_share'), True, 0.01),
+] + [(f"{stage} p50 (s)", ('stages', stage, 'p50'), False, 0.05) for stage in STAGES]
+
+
+def sample_topics(count):
+    """`count` topics from SAMPLE_TOPICS, numbered variants once they run out"""
+    topics = []
+    for idx in range(count):
+        text = SAMPLE_TOPICS[idx % len(SAMPLE_TOPICS)]
+        if idx >= len(SAMPLE_TOPICS):
+            text = f"{text} (variant {idx // len(SAMPLE_TOPICS) + 1})"
+        topics.append((f"bench-{idx + 1}", text))
+    return topics
+
+
+def percentile(values, q):
+    """Linear-interpolated q-th percentile (0-100) of `values`; None when empty"""
+    values = sorted(values)
+    if not values:
+        return None
+    pos = (len(values) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(values) - 1)
+    return round(values[low] + (values[high] - values[low]) * (pos - low), 3)
+
+
+def _distribution(values):
+    return {'n': len(values), 'p50': percentile(values, 50), 'p95': percentile(values, 95),
+            'max': round(max(values), 3) if values else None}
+
+
+def _parsed(stages):
+    """Checkpointed stage outputs of one run that are valid for their schema, per stage
+
+    Checkpoints are read rather than the result line so that topics failing
+    in a later stage still count what parsed before.
+    """
+    parsed = Counter()
+    parsed['explore'] = sum(not validate(exp, EXPLORATION_SCHEMA) for exp in stages.get('explore') or ())
+    parsed['review'] = sum(not validate(review, REVIEW_SCHEMA) for review in stages.get('review') or ())
+    if stages.get('propose') and not validate(stages['propose'], PROPOSAL_SCHEMA):
+        parsed['propose'] = 1
+    return parsed
+
+
+def build_report(records, run_store, telemetry, warnings, wall, mock_stats=None):
+    """Benchmark metrics from batch result lines, their checkpoints and the calls the telemetry saw"""
+    def answered_synthesis(run_id):
+        return sum(call['stage'] == 'synthesize' and call['status'] in ANSWERED_STATUSES
+                   for call in telemetry.calls(run_id))
+
+    e2e, stage_walls = [], defaultdict(list)
+    answered, parsed, statuses = Counter(), Counter(), Counter()
+    completion_tokens = prompt_tokens = cached_tokens = 0
+    for record in records:
+        run_id = run_id_for(record['id'], record['topic'])
+        e2e.append(record['elapsed'])
+        for stage, totals in (record.get('usage') or {}).get('stages', {}).items():
+            if totals.get('wall') is not None:
+                stage_walls[stage].append(totals['wall'])
+        for call in telemetry.calls(run_id):
+            statuses[call['status']] += 1
+            completion_tokens += call['completion_tokens'] or 0
+            if call['status'] not in FREE_STATUSES:
+                prompt_tokens += call['prompt_tokens'] or 0
+                cached_tokens += call['cached_tokens'] or 0
+            if call['status'] in ANSWERED_STATUSES:
+                answered[call['stage']] += 1
+        run = run_store.load_run(run_id)
+        parsed.update(_parsed(run['stages'] if run else {}))
+        # A synthesis always comes back (refinements included); the ones that
+        # fell back to text were announced with the raw answer attached
+        parsed['synthesize'] += max(0, answered_synthesis(run_id) - warnings.get(run_id, 0))
+
+    parse = {}
+    for stage in STAGES:
+        if answered[stage]:
+            parse[stage] = {'answered': answered[stage], 'parsed': min(parsed[stage], answered[stage]),
+                            'rate': round(min(parsed[stage], answered[stage]) / answered[stage], 4)}
+    total_answered = sum(entry['answered'] for entry in parse.values())
+    parse['overall'] = round(sum(entry['parsed'] for entry in parse.values()) / total_answered, 4) \
+        if total_answered else None
+
+    calls = sum(statuses.values())
+    return {
+        'topics': len(records),
+        'succeeded': sum(record['status'] == 'ok' for record in records),
+        'failed': sum(record['status'] != 'ok' for record in records),
+        'wall': round(wall, 3),
+        'e2e': _distribution(e2e),
+        'stages': {stage: _distribution(values) for stage, values in stage_walls.items()},
+        'throughput': {
+            'topics_per_min': round(len(records) * 60 / wall, 3) if wall else None,
+            'calls_per_sec': round(calls / wall, 3) if wall else None,
+            'completion_tokens_per_sec': round(completion_tokens / wall, 1) if wall else None,
+        },
+        'calls': dict(statuses, total=calls),
+        'prompt_cache': {'prompt_tokens': prompt_tokens, 'cached_tokens': cached_tokens,
+                         'cached_share': round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None},
+        'parse': parse,
+        'mock': mock_stats or {},
+    }
+
+
+async def run_benchmark(topics, mock_config, concurrency=10, proposal=True, base_url=None, api_key='mock',
+                        stage_deadline=STAGE_DEADLINE_SECONDS, review_quorum=REVIEW_QUORUM,
+                        quorum_deadline=REVIEW_QUORUM_DEADLINE_SECONDS, late_review_policy=LATE_REVIEW_POLICY,
+                        routing_policy=ROUTING_POLICY):
+    """Run `topics` against a mock server (or `base_url`) and return the report
+
+    Each topic's council gets a random generator seeded from the mock seed and
+    its run id, so review assignments, and hence prompts, repeat across runs
+    and a replayed cassette matches. Model routing learns from this run only.
+    """
+    telemetry = Telemetry(trace_path=None)
+    run_store = RunStore(':memory:')
+    warnings = Counter()
+    router = ModelRouter(path=None)
+
+    def council_factory(key, on_event=None, run_id=None, **kwargs):
+        def count_fallbacks(event):
+            if event.kind == 'warning' and event.stage == 'synthesize' and event.raw is not None:
+                warnings[run_id] += 1
+            if on_event is not None:
+                on_event(event)
+
+        return SwarmCouncil(key, on_event=count_fallbacks, run_id=run_id, cache_bypass=STAGES, telemetry=telemetry,
+                            rng=random.Random(f"{mock_config.seed}:{run_id}"), router=router, **kwargs)
+
+    server = None if base_url else MockServer(mock_config).start()
+    previous_url = get_base_url()
+    previous_support = get_structured_support()
+    set_base_url(base_url or server.url)
+    set_structured_support(StructuredOutputSupport(path=None))
+    fd, output_path = tempfile.mkstemp(prefix='swarm-benchmark-', suffix='.jsonl')
+    os.close(fd)
+    try:
+        started = time.monotonic()
+        await run_batch(topics, output_path, api_key, concurrency=concurrency, proposal=proposal,
+                        stage_deadline=stage_deadline, review_quorum=review_quorum, quorum_deadline=quorum_deadline,
+                        late_review_policy=late_review_policy, routing_policy=routing_policy, run_store=run_store,
+                        council_factory=council_factory)
+        wall = time.monotonic() - started
+        with open(output_path, encoding='utf-8') as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    finally:
+        os.remove(output_path)
+        set_base_url(previous_url)
+        set_structured_support(previous_support)
+        if server is not None:
+            server.stop()
+    return build_report(records, run_store, telemetry, warnings, wall, server.stats() if server else None)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def fingerprint(settings):
+    """Reports are only compared with earlier ones whose settings hash the same"""
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def load_history(path):
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def append_history(path, entry):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def _lookup(report, path):
+    for key in path:
+        if not isinstance(report, dict) or key not in report:
+            return None
+        report = report[key]
+    return report
+
+
+def compare(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """(metric, baseline, current, relative change, regressed) for every metric both reports have"""
+    rows = []
+    for name, path, higher_is_better, floor in COMPARED_METRICS:
+        before, after = _lookup(baseline, path), _lookup(report, path)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else float(after > before) - float(after < before)
+        worse = -change if higher_is_better else change
+        rows.append((name, before, after, change, worse > tolerance and abs(after - before) > floor))
+    return rows
+
+
+def format_report(report):
+    lines = [
+        f"Topics: {report['succeeded']}/{report['topics']} succeeded in {report['wall']:.2f}s "
+        f"({report['throughput']['topics_per_min']} topics/min, {report['throughput']['calls_per_sec']} calls/s, "
+        f"{report['throughput']['completion_tokens_per_sec']} completion tokens/s)",
+        f"End to end: p50 {report['e2e']['p50']}s, p95 {report['e2e']['p95']}s, max {report['e2e']['max']}s",
+    ]
+    for stage, dist in report['stages'].items():
+        lines.append(f"  {stage:<11} p50 {dist['p50']}s  p95 {dist['p95']}s  max {dist['max']}s")
+    lines.append("Calls: " + ', '.join(f"{status} {count}" for status, count in sorted(report['calls'].items())))
+    cache = report.get('prompt_cache')
+    if cache and cache['prompt_tokens']:
+        lines.append(f"Prompt cache: {cache['cached_tokens']:,} of {cache['prompt_tokens']:,} prompt tokens cached "
+                     f"({cache['cached_share']:.1%})")
+    lines.append(f"Parse success: {report['parse']['overall']}")
+    for stage in STAGES:
+        entry = report['parse'].get(stage)
+        if entry:
+            lines.append(f"  {stage:<11} {entry['parsed']}/{entry['answered']} ({entry['rate']:.1%})")
+    if report['mock']:
+        lines.append("Mock server: " + ', '.join(f"{name} {count}" for name, count in sorted(report['mock'].items())))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows, baseline_entry):
+    lines = [f"Compared with {baseline_entry.get('commit') or 'unknown commit'} "
+             f"({time.strftime('%Y-%m-%d %H:%M', time.localtime(baseline_entry['time']))}):"]
+    for name, before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        lines.append(f"  {name:<20} {before:>10g} -> {after:<10g} {change:+.1%}{flag}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the AI Swarm Council offline against a mock API server")
+    parser.add_argument('--topics', type=int, default=len(SAMPLE_TOPICS),
+                        help="number of built-in sample topics to run (default: %(default)s)")
+    parser.add_argument('--topics-file', default=None, help="run the topics of this JSONL file instead")
+    parser.add_argument('--concurrency', type=int, default=10, help="maximum model calls in flight")
+    parser.add_argument('--no-proposal', action='store_true', help="skip Stage 4")
+    parser.add_argument('--stage-deadline', type=float, default=STAGE_DEADLINE_SECONDS)
+    parser.add_argument('--quorum', type=int, default=REVIEW_QUORUM, help="Stage 2 quorum (0: wait for all)")
+    parser.add_argument('--late-reviews', choices=LATE_REVIEW_POLICIES, default=LATE_REVIEW_POLICY)
+    parser.add_argument('--routing', choices=ROUTING_POLICIES, default=ROUTING_POLICY,
+                        help="model routing policy (see router.py)")
+    parser.add_argument('--base-url', default=None,
+                        help="benchmark against this OpenAI-compatible API instead of starting a mock server")
+    parser.add_argument('--api-key', default=os.environ.get('OPENROUTER_API_KEY') or 'mock',
+                        help="sent to the server; needed with --record (default: $OPENROUTER_API_KEY)")
+    parser.add_argument('--label', default=None, help="name stored with this run in the history")
+    parser.add_argument('--history', default=DEFAULT_HISTORY_PATH, help="history JSONL (default: %(default)s)")
+    parser.add_argument('--no-history', action='store_true', help="neither read nor append to the history")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="relative change counted as a regression (default: %(default)s)")
+    parser.add_argument('--fail-on-regression', action='store_true', help="exit with status 2 on any regression")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        mock_config = config_from_args(args)
+    except ValueError as e:
+        parser.error(str(e))
+    if mock_config.mode == 'record' and args.api_key == 'mock':
+        parser.error("recording needs a real API key (--api-key or OPENROUTER_API_KEY)")
+    topics = load_topics(args.topics_file) if args.topics_file else sample_topics(args.topics)
+
+    report = asyncio.run(run_benchmark(
+        topics, mock_config,
+        concurrency=args.concurrency,
+        proposal=not args.no_proposal,
+        base_url=args.base_url,
+        api_key=args.api_key,
+        stage_deadline=args.stage_deadline,
+        review_quorum=args.quorum or None,
+        late_review_policy=args.late_reviews,
+        routing_policy=args.routing,
+    ))
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+    settings = {
+        'mock': {key: value for key, value in asdict(mock_config).items() if key not in ('cassette', 'upstream')},
+        'base_url': args.base_url,
+        'topics': [text for _, text in topics],
+        'concurrency': args.concurrency,
+        'proposal': not args.no_proposal,
+        'quorum': args.quorum,
+        'late_reviews': args.late_reviews,
+    }
+    if args.routing != ROUTING_POLICY:
+        # Only when set, so histories from before routing existed keep matching
+        settings['routing'] = args.routing
+    if args.no_history or mock_config.mode == 'record':
+        return 0
+    key = fingerprint(settings)
+    baseline = next((entry for entry in reversed(load_history(args.history)) if entry.get('fingerprint') == key), None)
+    append_history(args.history, {'time': time.time(), 'commit': git_commit(), 'label': args.label,
+                                  'fingerprint': key, 'settings': settings, 'report': report})
+    if baseline is None:
+        print(f"\nNo earlier run with these settings in {args.history}; saved as the baseline", file=sys.stderr)
+        return 0
+    rows = compare(report, baseline['report'], args.tolerance)
+    print('\n' + format_comparison(rows, baseline), file=sys.stderr)
+    if args.fail_on_regression and any(regressed for *_, regressed in rows):
+        return 2
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
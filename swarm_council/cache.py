@@ -0,0 +1,125 @@
+"""Persistent, content-addressed cache of LLM responses
+
+Entries live in a small SQLite database keyed by a SHA-256 of everything that
+determines a completion (model, prompts, temperature, max_tokens). Old entries
+expire after a TTL and the least recently used ones are evicted once the cache
+grows past its size cap. One cache object is shared by the whole process.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    'SWARM_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-swarm-council', 'responses.sqlite3')
+)
+DEFAULT_TTL_SECONDS = float(os.environ.get('SWARM_CACHE_TTL', 7 * 24 * 3600))
+DEFAULT_MAX_BYTES = int(float(os.environ.get('SWARM_CACHE_MAX_MB', 200)) * 1024 * 1024)
+
+
+def cache_key(model, system_prompt, user_prompt, temperature, max_tokens):
+    """Content address for one completion request"""
+    payload = json.dumps([model, system_prompt, user_prompt, temperature, max_tokens], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LRU/TTL cache of response texts, safe to share across threads"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            ' key TEXT PRIMARY KEY,'
+            ' model TEXT NOT NULL,'
+            ' content TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)')
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss or expired entry"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT content, created FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or (self.ttl_seconds and now - row[1] > self.ttl_seconds):
+                if row is not None:
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, model, content):
+        """Store a response and evict expired / least recently used entries past the size cap"""
+        now = time.time()
+        size = len(content.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, content, size, created, last_access)'
+                ' VALUES (?, ?, ?, ?, ?, ?)',
+                (key, model, content, size, now, now)
+            )
+            self._evict(now)
+
+    def _evict(self, now):
+        if self.ttl_seconds:
+            self._conn.execute('DELETE FROM responses WHERE created < ?', (now - self.ttl_seconds,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess = total - self.max_bytes
+        freed = 0
+        victims = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY last_access'):
+            victims.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', victims)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Hit/miss counters for this process plus current size of the cache"""
+        with self._lock:
+            entries, size = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide response cache"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
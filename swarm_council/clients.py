@@ -0,0 +1,139 @@
+"""Process-wide registry of pooled OpenAI-compatible clients
+
+Streamlit re-executes streamlit_app.py on every rerun, so anything created at
+module level there is thrown away constantly. Clients live here instead: the
+import cache keeps one registry per process, shared by every session and
+worker thread, and each client keeps its keep-alive connections between calls.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+import httpx
+from openai import OpenAI
+
+OPENROUTER_BASE_URL = 'https://openrouter.ai/api/v1'
+DEFAULT_TIMEOUT = 120.0  # 2 minute timeout
+
+# Where clients connect unless told otherwise; point it at any OpenAI-compatible
+# server (e.g. the mock server used for benchmarks) via the environment or set_base_url()
+_base_url = os.environ.get('SWARM_BASE_URL') or OPENROUTER_BASE_URL
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings, overridable through the environment or configure_pool()
+_pool_settings = {
+    'max_connections': int(os.environ.get('SWARM_POOL_MAX_CONNECTIONS', 50)),
+    'max_keepalive_connections': int(os.environ.get('SWARM_POOL_MAX_KEEPALIVE', 20)),
+    'keepalive_expiry': float(os.environ.get('SWARM_POOL_KEEPALIVE_EXPIRY', 90)),
+    'http2': os.environ.get('SWARM_HTTP2', '').lower() in ('1', 'true', 'yes'),
+}
+
+_clients = {}
+_http_clients = {}
+_warmed = set()
+_lock = threading.Lock()
+
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def configure_pool(**settings):
+    """Change pool limits / HTTP/2 for clients created from now on
+
+    Existing clients are closed so the next get_client() picks up the new
+    settings.
+    """
+    unknown = set(settings) - set(_pool_settings)
+    if unknown:
+        raise ValueError(f"Unknown pool settings: {', '.join(sorted(unknown))}")
+    with _lock:
+        _pool_settings.update(settings)
+        for http_client in _http_clients.values():
+            http_client.close()
+        _clients.clear()
+        _http_clients.clear()
+        _warmed.clear()
+
+
+def key_fingerprint(api_key):
+    """Short, stable stand-in for an API key (the account it bills), safe to store and compare"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+
+
+def get_base_url():
+    return _base_url
+
+
+def set_base_url(base_url=None):
+    """Send calls made without an explicit base_url to `base_url` (None restores OpenRouter)"""
+    global _base_url
+    with _lock:
+        _base_url = base_url or OPENROUTER_BASE_URL
+
+
+def _build_client(base_url, api_key, timeout):
+    http2 = _pool_settings['http2']
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested but the 'h2' package is not installed; using HTTP/1.1")
+        http2 = False
+
+    http_client = httpx.Client(
+        http2=http2,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=_pool_settings['max_connections'],
+            max_keepalive_connections=_pool_settings['max_keepalive_connections'],
+            keepalive_expiry=_pool_settings['keepalive_expiry'],
+        ),
+    )
+    # Retries are handled by the rate-limit scheduler, which also adapts pacing
+    client = OpenAI(base_url=base_url, api_key=api_key, timeout=timeout, http_client=http_client, max_retries=0)
+    return client, http_client
+
+
+def get_client(api_key, base_url=None, timeout=DEFAULT_TIMEOUT):
+    """Return the shared client for (base_url, api_key, timeout), creating it once"""
+    base_url = base_url or _base_url
+    key = (base_url, api_key, timeout)
+    client = _clients.get(key)
+    if client is None:
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client, http_client = _build_client(base_url, api_key, timeout)
+                _clients[key] = client
+                _http_clients[key] = http_client
+    return client
+
+
+def prewarm_client(api_key, base_url=None, timeout=DEFAULT_TIMEOUT, connections=1):
+    """Open pooled connections in the background so the first real call skips DNS/TLS setup
+
+    Runs at most once per client; errors are ignored because warming is only
+    an optimisation.
+    """
+    base_url = base_url or _base_url
+    key = (base_url, api_key, timeout)
+    with _lock:
+        if key in _warmed:
+            return
+        _warmed.add(key)
+    get_client(api_key, base_url, timeout)
+    http_client = _http_clients[key]
+
+    def warm():
+        try:
+            # Any request to the host establishes a keep-alive connection in the pool
+            http_client.head(f"{base_url}/models", timeout=10.0)
+        except Exception as e:
+            logger.debug("Connection pre-warm failed: %s", e)
+
+    for _ in range(connections):
+        threading.Thread(target=warm, daemon=True).start()
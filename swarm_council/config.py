@@ -0,0 +1,200 @@
+"""Agent roster, model assignments and pipeline defaults"""
+
+# Agent configurations with model assignments
+SWARM_AGENTS = [
+    {
+        'id': 'cognitive',
+        'name': 'Cognitive Scientist',
+        'icon': '🧠',
+        'model': 'anthropic/claude-sonnet-4.5',
+        'fallback_models': ['google/gemini-3-flash-preview'],
+        'system_prompt': 'You are an expert in cognitive science and educational psychology. Help explore research topics by identifying relevant cognitive theories, mental models, and learning mechanisms.'
+    },
+    {
+        'id': 'clinical',
+        'name': 'Clinical Educator',
+        'icon': '👨‍⚕️',
+        'model': 'google/gemini-3-flash-preview',
+        'fallback_models': ['anthropic/claude-sonnet-4.5'],
+        'system_prompt': 'You are a seasoned clinical educator. Help explore research topics by considering practical implementation, feasibility, and real-world constraints.'
+    },
+    {
+        'id': 'assessment',
+        'name': 'Assessment Specialist',
+        'icon': '📊',
+        'model': 'openai/gpt-oss-120b',
+        'fallback_models': ['google/gemini-3-flash-preview'],
+        'system_prompt': 'You are an expert in educational measurement. Help explore research topics by considering how constructs might be measured, what validity issues exist, and assessment challenges.'
+    },
+    {
+        'id': 'technology',
+        'name': 'Technology Innovator',
+        'icon': '💻',
+        'model': 'anthropic/claude-sonnet-4.5',
+        'fallback_models': ['google/gemini-3-flash-preview'],
+        'system_prompt': 'You are an educational technologist. Help explore research topics by identifying relevant technologies, novel methods, and innovative approaches.'
+    },
+    {
+        'id': 'crosscultural',
+        'name': 'Cross-Cultural Researcher',
+        'icon': '🌍',
+        'model': 'z-ai/glm-4.7',
+        'fallback_models': ['google/gemini-3-flash-preview'],
+        'system_prompt': 'You are focused on equity and global perspectives. Help explore research topics by considering cultural contexts, power dynamics, and generalizability across diverse populations.'
+    }
+]
+
+# Synthesis and proposal model
+SYNTHESIS_MODEL = 'anthropic/claude-sonnet-4.5'
+SYNTHESIS_FALLBACK_MODELS = ['google/gemini-3-flash-preview']
+
+TEMPERATURE = 0.7
+
+# Pipeline stages and their display labels
+STAGES = {
+    'explore': 'Stage 1 (ideas)',
+    'review': 'Stage 2 (peer review)',
+    'synthesize': 'Stage 3 (synthesis)',
+    'debate': 'Debate (extra rounds)',
+    'propose': 'Stage 4 (proposal)',
+}
+
+# Prices in USD per million tokens (prompt, completion), as listed on
+# openrouter.ai/models; call costs are computed from these. Models missing
+# here are reported without a cost.
+MODEL_PRICES = {
+    'anthropic/claude-sonnet-4.5': (3.00, 15.00),
+    'google/gemini-3-flash-preview': (0.50, 3.00),
+    'openai/gpt-oss-120b': (0.05, 0.25),
+    'z-ai/glm-4.7': (0.40, 1.75),
+}
+# USD per million prompt tokens read from the provider's prompt cache; models
+# not listed are charged the full prompt price for them
+CACHED_PROMPT_PRICES = {
+    'anthropic/claude-sonnet-4.5': 0.30,
+    'google/gemini-3-flash-preview': 0.05,
+    'z-ai/glm-4.7': 0.11,
+}
+
+# Model prefixes whose providers cache a prompt prefix only when it ends in a
+# cache_control breakpoint; the others cache repeated prefixes automatically
+PROMPT_CACHE_CONTROL_MODELS = ('anthropic/', 'google/')
+
+# Providers only cache prompt prefixes of at least PROMPT_CACHE_MIN_TOKENS, and
+# only once a request has been prefilled. Stage 2 reviewers that would send
+# the same prompt to the same model may wait up to PROMPT_CACHE_WARMUP_SECONDS
+# for the first one's first token, so they read the prefix from the cache
+# (0 sends them all at once). They only wait when the prefill time the cache
+# would save them, measured over at least PREFILL_MIN_SAMPLES streamed calls
+# to the model, is longer than the wait; otherwise they start at once and
+# read whatever the provider has cached by then.
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_WARMUP_SECONDS = 10
+PREFILL_MIN_SAMPLES = 8
+
+# Stage 1 and Stage 2 send every agent call at once through a bounded pool
+MAX_PARALLEL_AGENTS = 5
+
+# Default per-stage deadline for the Stage 1 / Stage 2 fan-out
+STAGE_DEADLINE_SECONDS = 180
+
+# Stage 2 quorum: synthesis may start once REVIEW_QUORUM reviews are in, or
+# once REVIEW_QUORUM_DEADLINE_SECONDS have passed with at least one (None
+# disables either trigger). Reviews still running then are either dropped or
+# folded into the synthesis by a refinement pass ('drop' / 'refine').
+REVIEW_QUORUM = 4
+REVIEW_QUORUM_DEADLINE_SECONDS = 90
+LATE_REVIEW_POLICY = 'refine'
+LATE_REVIEW_POLICIES = ('drop', 'refine')
+
+# Sparse peer review: once a council has at least SPARSE_REVIEW_MIN_IDEAS
+# ideas, each reviewer ranks a subset of about SPARSE_REVIEW_SIZE of them
+# (enlarged only as needed so every pair of ideas is compared by someone)
+SPARSE_REVIEW_MIN_IDEAS = 8
+SPARSE_REVIEW_SIZE = 5
+
+# Debate: after the synthesis, up to DEBATE_ROUNDS more rounds in which the
+# reviewers re-rank and critique the ideas and the synthesis is revised (0
+# turns it off; the app allows up to DEBATE_MAX_ROUNDS). Each round sends only
+# what changed in the previous one, at most DEBATE_MAX_NEW_POINTS new critique
+# points per idea, with a running summary whose ideas are condensed to
+# IDEA_LEVELS[DEBATE_IDEA_LEVEL] (see prompts.py). The debate stops once no
+# more than DEBATE_CONVERGENCE_DISTANCE of idea pairs changed order in the
+# consensus ranking since the round before.
+DEBATE_ROUNDS = 0
+DEBATE_MAX_ROUNDS = 5
+DEBATE_MAX_NEW_POINTS = 6
+DEBATE_IDEA_LEVEL = 2
+DEBATE_CONVERGENCE_DISTANCE = 0.1
+
+# Input token budget (system + user prompt) for Stage 2 and Stage 3 prompts.
+# Prompts over budget are condensed step by step (long text clipped, lists
+# shortened, low-value sections dropped) until they fit.
+PROMPT_TOKEN_BUDGET = 16_000
+MODEL_PROMPT_TOKEN_BUDGETS = {}
+
+# Client-side rate limits: requests/min, tokens/min and the starting in-flight
+# limit per model. Provider entries apply to all of a provider's models
+# together; limits advertised in API response headers take precedence.
+DEFAULT_RATE_LIMIT = {'rpm': 120, 'tpm': 400_000, 'concurrency': 8}
+PROVIDER_RATE_LIMITS = {}
+MODEL_RATE_LIMITS = {}
+
+# Retries for rate-limited and transient failures (exponential backoff with full jitter)
+RETRY_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+
+# Hedged requests: once a model has gone longer than this percentile of its
+# observed time-to-first-output, the next model in its fallback chain is
+# started too and the first to answer wins
+HEDGE_PERCENTILE = 0.95
+HEDGE_MIN_SAMPLES = 5       # below this, HEDGE_DEFAULT_DELAY is used
+HEDGE_DEFAULT_DELAY = 45.0
+HEDGE_MIN_DELAY = 2.0
+
+# Per-provider circuit breaker
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_COOLDOWN_SECONDS = 60.0
+
+# Near-duplicate topic reuse: a new topic whose similarity (Jaccard over word
+# and character shingles, found through a MinHash/LSH index of past runs) to
+# an earlier run's topic is at least TOPIC_REUSE_THRESHOLD can take that run's
+# Stage 1 and Stage 2 results instead of running them again. The app offers
+# the match ('offer'), takes it without asking ('auto') or never looks ('off').
+TOPIC_REUSE_THRESHOLD = 0.8
+TOPIC_REUSE_MODE = 'offer'
+TOPIC_REUSE_MODES = ('off', 'offer', 'auto')
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+
+# Adaptive model routing. Each role may use the models of its chain (an
+# agent's 'model' and 'fallback_models', unless it lists 'allowed_models';
+# SYNTHESIS_MODEL and SYNTHESIS_FALLBACK_MODELS for the synthesizer). The
+# router keeps EWMA latency, error rate and cost per token for every model and
+# stage, and before each call orders the chain by the routing policy:
+#   'static'   - as configured
+#   'fastest'  - lowest average latency first
+#   'cheapest' - lowest cost per token first
+#   'slo'      - the cheapest model whose average latency meets the stage's
+#                ROUTER_LATENCY_SLO_SECONDS, or the fastest when none does
+# Models over ROUTER_MAX_ERROR_RATE, or behind an open circuit breaker, go last.
+ROUTING_POLICY = 'static'
+ROUTING_POLICIES = ('static', 'fastest', 'cheapest', 'slo')
+ROUTER_EWMA_ALPHA = 0.2
+ROUTER_MAX_ERROR_RATE = 0.5
+ROUTER_LATENCY_SLO_SECONDS = {'explore': 60, 'review': 90, 'synthesize': 120, 'debate': 90, 'propose': 90}
+ROUTER_DEFAULT_SLO_SECONDS = 120
+
+# Adaptive max_tokens. Once a model has answered a stage OUTPUT_TOKENS_MIN_SAMPLES
+# times, its calls there ask for the OUTPUT_TOKENS_PERCENTILE of its recent
+# completion lengths times OUTPUT_TOKENS_HEADROOM, kept within
+# [OUTPUT_TOKENS_MIN, OUTPUT_TOKENS_MAX]; until then the stage's fixed limit
+# applies. An answer cut off at the limit is continued from where it stopped,
+# up to CONTINUATION_MAX_ROUNDS times, instead of being asked for again.
+OUTPUT_TOKENS_PERCENTILE = 0.95
+OUTPUT_TOKENS_HEADROOM = 1.25
+OUTPUT_TOKENS_MIN = 256
+OUTPUT_TOKENS_MAX = 8192
+OUTPUT_TOKENS_MIN_SAMPLES = 5
+CONTINUATION_MAX_ROUNDS = 2
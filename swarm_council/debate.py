@@ -0,0 +1,99 @@
+"""Bookkeeping for multi-round debate: what changed between rounds, and when to stop
+
+After the synthesis, the reviewers can go around again, re-ranking the ideas
+and critiquing them in the light of the synthesis, and the synthesizer then
+revises it. Resending every earlier critique each round would make every
+round costlier than the one before. Instead each round gets a running summary
+of fixed size (the ideas, condensed; the consensus ranking; the current
+synthesis) and only what changed in the round before: ideas that moved in the
+ranking and critique points nobody had raised yet (at most
+DEBATE_MAX_NEW_POINTS per idea). Every round then costs about the same, so
+tokens and latency grow linearly with the number of rounds.
+
+The debate stops early once the consensus ranking settles: when the share of
+idea pairs ordered differently than in the round before (normalized Kendall
+tau distance) is at most DEBATE_CONVERGENCE_DISTANCE.
+"""
+import re
+
+from .config import DEBATE_MAX_NEW_POINTS
+
+# Critique lists of a review, in the order they are shown
+POINT_KINDS = ('strengths', 'weaknesses', 'missingElements')
+
+
+def ranking_distance(before, after):
+    """Share of idea pairs the two rankings (idea numbers, best first) order differently
+
+    Ideas missing from either ranking are left out; 0.0 when fewer than two
+    ideas are in both.
+    """
+    common = [idea for idea in before if idea in set(after)]
+    if len(common) < 2:
+        return 0.0
+    position = {idea: pos for pos, idea in enumerate(after)}
+    pairs = discordant = 0
+    for i, first in enumerate(common):
+        for second in common[i + 1:]:
+            pairs += 1
+            discordant += position[first] > position[second]
+    return discordant / pairs
+
+
+def rank_changes(before, after):
+    """[{ideaNumber, from, to}] for the ideas whose consensus rank changed, in new rank order"""
+    old = {idea: rank for rank, idea in enumerate(before, 1)}
+    return [{'ideaNumber': idea, 'from': old[idea], 'to': rank}
+            for rank, idea in enumerate(after, 1) if idea in old and old[idea] != rank]
+
+
+def _point_key(text):
+    return ' '.join(re.findall(r"[a-z0-9]+", str(text).lower()))
+
+
+def new_points(reviews, seen, limit=DEBATE_MAX_NEW_POINTS):
+    """Critique points in `reviews` that are not in `seen`, at most `limit` per idea
+
+    Points are taken round-robin (every reviewer's first strength, weakness
+    and missing element before anyone's second), so one long review cannot
+    fill an idea's quota. Returns [{ideaNumber, kind, text}] ordered by idea;
+    the points returned are added to `seen` (a set of (ideaNumber, kind,
+    normalized text)). Points over the limit are left out of `seen`, so a
+    later round can still bring them up.
+    """
+    candidates = []
+    for reviewer, review in enumerate(reviews):
+        for idea_review in review.get('reviews') or ():
+            for kind_order, kind in enumerate(POINT_KINDS):
+                for position, text in enumerate(idea_review.get(kind) or ()):
+                    candidates.append((position, kind_order, reviewer, idea_review.get('ideaNumber'), kind, text))
+    points = []
+    per_idea = {}
+    for _, _, _, number, kind, text in sorted(candidates, key=lambda candidate: candidate[:3]):
+        key = (number, kind, _point_key(text))
+        if not key[2] or key in seen or per_idea.get(number, 0) >= limit:
+            continue
+        seen.add(key)
+        per_idea[number] = per_idea.get(number, 0) + 1
+        points.append({'ideaNumber': number, 'kind': kind, 'text': str(text)})
+    return sorted(points, key=lambda point: (not isinstance(point['ideaNumber'], int), point['ideaNumber'] or 0,
+                                             POINT_KINDS.index(point['kind'])))
+
+
+def seen_points(reviews, rounds=()):
+    """(Stage 2's points as the first round's changes, the `seen` set after them and `rounds`)
+
+    Stage 2's points go through new_points() like any round's, so the first
+    debate round sees at most DEBATE_MAX_NEW_POINTS of them per idea.
+    """
+    seen = set()
+    first = new_points(reviews, seen)
+    for debate_round in rounds:
+        for point in debate_round.get('newPoints') or ():
+            seen.add((point['ideaNumber'], point['kind'], _point_key(point['text'])))
+    return first, seen
+
+
+def changed_fields(before, after):
+    """Synthesis fields whose value differs between two versions"""
+    return [key for key in after if before.get(key) != after[key]]
@@ -0,0 +1,879 @@
+"""Headless council pipeline: the four stages as async methods
+
+SwarmCouncil knows nothing about Streamlit. Each stage returns typed results
+and reports progress through an on_event(ProgressEvent) callback. Model calls
+are blocking, so they run on worker threads; their events are handed back to
+the event loop thread before on_event is called, which lets a UI draw
+progress from the thread that awaits the stage.
+
+    council = SwarmCouncil(api_key, on_event=print)
+    result = asyncio.run(council.run("How does AI affect clinical reasoning?"))
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (DEBATE_CONVERGENCE_DISTANCE, DEBATE_ROUNDS, LATE_REVIEW_POLICIES, LATE_REVIEW_POLICY,
+                     MAX_PARALLEL_AGENTS, PROMPT_CACHE_MIN_TOKENS, PROMPT_CACHE_WARMUP_SECONDS, REVIEW_QUORUM,
+                     REVIEW_QUORUM_DEADLINE_SECONDS, ROUTING_POLICIES, ROUTING_POLICY, STAGE_DEADLINE_SECONDS, STAGES,
+                     SWARM_AGENTS, SYNTHESIS_FALLBACK_MODELS, SYNTHESIS_MODEL)
+from .clients import key_fingerprint
+from .debate import changed_fields, new_points, rank_changes, ranking_distance, seen_points
+from .jsonstream import IncrementalJSONParser
+from .llm import call_llm, full_prompt
+from .parsing import extract_json, parse_synthesis
+from .prompts import (EXPLORATION_SYSTEM_PROMPT, PROPOSAL_SYSTEM_PROMPT, REVIEW_SYSTEM_PROMPT,
+                      SYNTHESIS_SYSTEM_PROMPT, agent_prompt, anonymize_ideas, debate_changes, debate_review_prompt,
+                      debate_revision_prompt, debate_summary, exploration_prompt, fit_review_prompt,
+                      fit_synthesis_prompt, peer_critiques, proposal_prompt, refinement_prompt)
+from .ranking import consensus_ranking, review_assignments
+from .results import CouncilError, CouncilResult, LateResults, ProgressEvent
+from .router import allowed_models, get_router
+from .structured import EXPLORATION_SCHEMA, PROPOSAL_SCHEMA, REVIEW_SCHEMA, SYNTHESIS_SCHEMA, validate
+from .telemetry import ANSWERED_STATUSES, get_telemetry
+from .tokens import count_tokens, output_lengths, prefill_times, prompt_budget
+from .topics import REUSED_STAGES, get_topic_index
+
+logger = logging.getLogger(__name__)
+
+
+def _snapshot(fields):
+    # Workers keep appending to the parser's lists; hand listeners a stable copy
+    return {key: list(value) if isinstance(value, list) else value for key, value in fields.items()}
+
+
+def _report_problems(value, schema, what, log):
+    # Partial results are still used (renderers tolerate missing fields); say what is off
+    problems = validate(value, schema)
+    if problems:
+        more = f" (+{len(problems) - 3} more)" if len(problems) > 3 else ''
+        log(f"⚠️ {what} does not fully match the expected format: {'; '.join(problems[:3])}{more}", 'error')
+
+
+def _traced(name):
+    """Record a stage method as a telemetry span of the council's run"""
+    def decorate(method):
+        @functools.wraps(method)
+        async def traced(self, *args, **kwargs):
+            with self.telemetry.span(name, run=self.run_id):
+                return await method(self, *args, **kwargs)
+        return traced
+    return decorate
+
+
+def _setting(event, on_token):
+    """on_token that also sets `event` on the first delta"""
+    def setting(delta):
+        event.set()
+        on_token(delta)
+    return setting
+
+
+def _combined(answered):
+    """The usage of the answer, summed over its parts when it was continued after hitting max_tokens"""
+    if not answered:
+        return None
+    usage = answered[-1]
+    parts = [record for record in answered if record['model'] == usage['model'] and record['status'] == 'ok']
+    if len(parts) < 2:
+        return usage
+    combined = dict(parts[0])
+    for key in ('wall', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'cost'):
+        values = [record[key] for record in parts]
+        combined[key] = None if None in values else sum(values)
+    return combined
+
+
+class SwarmCouncil:
+    """Runs the explore → review → synthesize → propose pipeline"""
+
+    def __init__(self, api_key, agents=None, synthesis_model=SYNTHESIS_MODEL,
+                 synthesis_fallback_models=SYNTHESIS_FALLBACK_MODELS, max_parallel=MAX_PARALLEL_AGENTS,
+                 stage_deadline=STAGE_DEADLINE_SECONDS, review_quorum=REVIEW_QUORUM,
+                 quorum_deadline=REVIEW_QUORUM_DEADLINE_SECONDS, late_review_policy=LATE_REVIEW_POLICY,
+                 cache_bypass=(), on_event=None, rng=None, executor=None, run_store=None, run_id=None,
+                 event_log=None, telemetry=None, reuse_threshold=None, routing_policy=ROUTING_POLICY,
+                 router=None, debate_rounds=DEBATE_ROUNDS):
+        if late_review_policy not in LATE_REVIEW_POLICIES:
+            raise ValueError(f"late_review_policy must be one of {LATE_REVIEW_POLICIES}")
+        if routing_policy not in ROUTING_POLICIES:
+            raise ValueError(f"routing_policy must be one of {ROUTING_POLICIES}")
+        self.api_key = api_key
+        self.agents = list(agents if agents is not None else SWARM_AGENTS)
+        self.synthesis_model = synthesis_model
+        self.synthesis_fallback_models = list(synthesis_fallback_models)
+        self.max_parallel = max_parallel
+        self.stage_deadline = stage_deadline
+        self.review_quorum = review_quorum
+        self.quorum_deadline = quorum_deadline
+        self.late_review_policy = late_review_policy
+        # Reviews still running when Stage 2 returned on its quorum; refine()
+        # folds them into the synthesis. Callers running stages on separate
+        # councils (the UI) carry this over themselves.
+        self.late_reviews = None
+        self.cache_bypass = set(cache_bypass)
+        self.on_event = on_event
+        self.rng = rng or random.Random()
+        # A shared executor bounds model calls across councils (e.g. a batch run);
+        # without one each stage gets its own short-lived pool
+        self.executor = executor
+        # With a run store and run id, stage outputs and model calls are
+        # checkpointed as they complete and run() resumes from them
+        self.run_store = run_store
+        self.run_id = run_id
+        # Runs belong to the account that started them (see runstore.py)
+        self.owner = key_fingerprint(api_key)
+        # Log and warning events are recorded here straight from the thread
+        # that raised them (see events.EventLog)
+        self.event_log = event_log
+        self.telemetry = telemetry or get_telemetry()
+        # run() takes Stage 1 and 2 from an earlier run in the run store whose
+        # topic is at least this similar (see topics.py); None never looks
+        self.reuse_threshold = reuse_threshold
+        # Every call's models are ordered by this policy from the router's
+        # latency, error and cost stats (see router.py)
+        self.routing_policy = routing_policy
+        self.router = router or get_router()
+        # run() follows the synthesis with up to this many debate rounds (see debate())
+        self.debate_rounds = debate_rounds
+        self._loop = None
+        self._loop_thread = None
+        self._context = None
+
+    # -- events -------------------------------------------------------------
+
+    def _bind_loop(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        # Listeners may depend on context variables of the awaiting task (Streamlit does)
+        self._context = contextvars.copy_context()
+        return self._loop
+
+    def _emit(self, event):
+        if self.event_log is not None and event.kind in ('log', 'warning'):
+            self.event_log.record(event, run=self.run_id)
+        if self.on_event is None:
+            return
+        if self._loop is not None and threading.get_ident() != self._loop_thread:
+            try:
+                self._loop.call_soon_threadsafe(self.on_event, event, context=self._context)
+            except RuntimeError:
+                # The loop is gone (e.g. a straggler finishing after its stage's deadline)
+                pass
+        else:
+            self.on_event(event)
+
+    def _logger(self, stage, agent=None):
+        def log(message, log_type='info'):
+            self._emit(ProgressEvent(stage, 'log', message=message, level=log_type, agent=agent))
+        return log
+
+    def _warner(self, stage):
+        def warn(message, raw=None):
+            self._emit(ProgressEvent(stage, 'warning', message=message, level='error', raw=raw))
+        return warn
+
+    def _partial_emitter(self, stage, agent=None, agent_index=None):
+        parser = IncrementalJSONParser()
+
+        def on_token(delta):
+            if parser.feed(delta):
+                self._emit(ProgressEvent(stage, 'partial', agent=agent, agent_index=agent_index,
+                                         fields=_snapshot(parser.fields)))
+        return on_token
+
+    # -- persistence --------------------------------------------------------
+
+    def _recording(self):
+        return self.run_store is not None and self.run_id is not None
+
+    def _checkpoint(self, stage, output):
+        if not self._recording():
+            return
+        try:
+            self.run_store.save_stage(self.run_id, stage, output)
+        except sqlite3.Error as e:
+            # A full disk shouldn't cost the user the stage they just paid for
+            logger.warning("Could not checkpoint %s for run %s: %s", stage, self.run_id, e)
+
+    def _route(self, stage, role, models, log):
+        """The models `role` may use, best first under the routing policy; the choice is logged"""
+        models, reason = self.router.route(self.routing_policy, stage, role, models)
+        if self.routing_policy != 'static':
+            log(f"🧭 Routing {role} to {models[0]} ({reason})", 'info')
+        return models
+
+    def _cache_warm_ups(self, routes, prompts, log, drops_late):
+        """agent id -> (event it sets on its first token, (event it waits for, agent it waits for))
+
+        The first agent to send a cacheable prompt to a model leads; the
+        others sending the same prompt to the same model follow it. Sent at
+        once, their prefills of the shared prefix compete for the same
+        provider, so the group waits only when the prefill time the cache
+        would save them (followers x prefix tokens x the model's measured
+        seconds per token, see tokens.PrefillTimes) is longer than the wait
+        (the leader's expected time to first token). Without measurements, or
+        when late reviews are dropped (followers would often miss the quorum),
+        everyone starts at once.
+        """
+        dropping = drops_late and self.review_quorum and self.review_quorum < len(self.agents)
+        if not PROMPT_CACHE_WARMUP_SECONDS or dropping:
+            return {}
+        groups = {}
+        for agent in self.agents:
+            prompt = prompts[agent['id']]
+            if count_tokens(prompt) >= PROMPT_CACHE_MIN_TOKENS:
+                groups.setdefault((routes[agent['id']][0], prompt), []).append(agent)
+        warm_ups = {}
+        for (model, prompt), (leader, *followers) in groups.items():
+            fit = prefill_times.fit(model)
+            if not followers or fit is None:
+                continue
+            fixed, per_token = fit
+            prefix_tokens = count_tokens(REVIEW_SYSTEM_PROMPT) + count_tokens(prompt)
+            leader_ttft = fixed + (prefix_tokens + count_tokens(agent_prompt(leader, reviewer=True))) * per_token
+            if len(followers) * prefix_tokens * per_token <= leader_ttft:
+                continue
+            warmed = threading.Event()
+            warm_ups[leader['id']] = (warmed, None)
+            for agent in followers:
+                warm_ups[agent['id']] = (None, (warmed, leader))
+        followers = sum(follow is not None for _, follow in warm_ups.values())
+        if followers:
+            log(f"♨️ {followers} reviewer(s) wait for the first call to their model to warm its prompt cache",
+                'info')
+        return warm_ups
+
+    def _synthesis_models(self, stage, role, log):
+        return self._route(stage, role, [self.synthesis_model, *self.synthesis_fallback_models], log)
+
+    def _call(self, stage, agent_name, system_prompt, user_prompt, model, agent_prompt=None, **kwargs):
+        """call_llm with this council's API key; see _answer()"""
+        return self._answer(stage, agent_name, system_prompt, user_prompt, model, agent_prompt, **kwargs)[0]
+
+    def _answer(self, stage, agent_name, system_prompt, user_prompt, model, agent_prompt=None, **kwargs):
+        """(response, the model that wrote it) from call_llm with this council's API key
+
+        The model is `model` unless a fallback answered instead. Every attempt
+        goes to telemetry; each answered call is logged with its latency,
+        usage and cost, and recorded in the run store when there is a run.
+        max_tokens adapts to the lengths of the stage's past answers (see
+        tokens.OutputLengths); an answer continued after hitting it is logged
+        and recorded as one call.
+        """
+        answered = []
+        answered_by = model
+        # Without streaming the first token arrives with the whole answer
+        streamed = kwargs.get('on_token') is not None
+
+        def on_usage(attempt_model, usage):
+            record = self.telemetry.record_call(self.run_id, stage, agent_name, attempt_model, **usage)
+            self.router.observe(stage, attempt_model, usage['status'], usage['wall'], record['cost'],
+                                (usage['prompt_tokens'] or 0) + (usage['completion_tokens'] or 0))
+            if usage['status'] in ANSWERED_STATUSES:
+                answered.append(record)
+            if streamed and usage['status'] == 'ok' and usage['prompt_tokens']:
+                prefill_times.record(attempt_model, usage['prompt_tokens'] - (usage['cached_tokens'] or 0),
+                                     usage['ttft'])
+
+        def on_model(winner):
+            nonlocal answered_by
+            answered_by = winner
+
+        response = None
+        try:
+            response = call_llm(system_prompt, user_prompt, model, agent_name, self.api_key, on_usage=on_usage,
+                                output_limits=output_lengths.for_stage(stage), agent_prompt=agent_prompt,
+                                on_model=on_model, **kwargs)
+            return response, answered_by
+        finally:
+            # Losing hedges may report after the winner; the usage is the winner's
+            usage = _combined([record for record in answered if record['model'] == answered_by] or answered)
+            if response and usage is not None:
+                self._log_usage(stage, agent_name, response, usage)
+            if self._recording():
+                # Cache hits, coalesced and failed calls carry no usage; estimate it
+                prompt_tokens = usage and usage['prompt_tokens']
+                if prompt_tokens is None:
+                    prompt_tokens = count_tokens(system_prompt) + count_tokens(full_prompt(user_prompt, agent_prompt))
+                completion_tokens = usage and usage['completion_tokens']
+                if completion_tokens is None and response:
+                    completion_tokens = count_tokens(response)
+                try:
+                    self.run_store.record_call(
+                        self.run_id, stage, agent_name, usage['model'] if usage else model, system_prompt,
+                        full_prompt(user_prompt, agent_prompt), response, elapsed=usage and usage['wall'],
+                        prompt_tokens=prompt_tokens, completion_tokens=completion_tokens
+                    )
+                except sqlite3.Error as e:
+                    logger.warning("Could not record a call for run %s: %s", self.run_id, e)
+
+    def _log_usage(self, stage, agent_name, response, usage):
+        details = [] if usage['ttft'] is None else [f"first token {usage['ttft']:.1f}s"]
+        if usage['completion_tokens'] is not None:
+            details.append(f"{usage['prompt_tokens']}+{usage['completion_tokens']} tokens")
+        if usage['cached_tokens']:
+            details.append(f"{usage['cached_tokens']} prompt tokens cached")
+        if usage['cost']:
+            details.append(f"${usage['cost']:.4f}")
+        if usage['status'] == 'coalesced':
+            details.append("shared an identical request in flight")
+        suffix = f" ({', '.join(details)})" if details else ''
+        self._emit(ProgressEvent(
+            stage, 'log', message=f"⏱️ {agent_name} answered in {usage['wall']:.1f}s{suffix}",
+            metrics={'agent': agent_name, 'model': usage['model'], 'latency': usage['wall'], 'chars': len(response),
+                     'tokens': usage['completion_tokens'], 'ttft': usage['ttft'], 'cost': usage['cost']}
+        ))
+
+    # -- execution ----------------------------------------------------------
+
+    async def _fan_out(self, stage, work, quorum=None, quorum_deadline=None):
+        """Run work(agent, log, on_token) for every agent at once
+
+        Results keep agent order, with None for agents that failed or missed
+        the stage deadline, so stage latency is set by the slowest agent.
+
+        With a quorum the stage instead returns once `quorum` agents have
+        produced a result, or once quorum_deadline seconds have passed with at
+        least one. Calls still running then are not cancelled; they are
+        returned as LateResults (None when nothing was left running).
+        Returns (results, late).
+        """
+        loop = self._bind_loop()
+        total = len(self.agents)
+        results = [None] * total
+        executor = self.executor or ThreadPoolExecutor(max_workers=max(1, min(self.max_parallel, total)))
+        futures = {}
+        for idx, agent in enumerate(self.agents):
+            call = executor.submit(work, agent, self._logger(stage, agent), self._partial_emitter(stage, agent, idx))
+            futures[asyncio.wrap_future(call, loop=loop)] = (idx, call)
+
+        log = self._logger(stage)
+        pending = set(futures)
+        completed = 0
+        late = None
+        try:
+            started = loop.time()
+            stop_at = started + self.stage_deadline
+            quorum_at = None if quorum_deadline is None else started + quorum_deadline
+            while pending:
+                now = loop.time()
+                if now >= stop_at:
+                    break
+                succeeded = sum(result is not None for result in results)
+                if succeeded and ((quorum and succeeded >= quorum) or (quorum_at is not None and now >= quorum_at)):
+                    log(f"🗳️ Quorum reached with {succeeded}/{total} agents; {len(pending)} still running", 'info')
+                    late = LateResults(
+                        futures=[futures[future][1] for future in sorted(pending, key=lambda f: futures[f][0])],
+                        deadline=time.monotonic() + stop_at - now
+                    )
+                    return results, late
+                timeout = stop_at - now
+                if quorum_at is not None and now < quorum_at:
+                    timeout = min(timeout, quorum_at - now)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    idx = futures[future][0]
+                    agent = self.agents[idx]
+                    try:
+                        results[idx] = future.result()
+                    except Exception as e:
+                        log(f"⚠️ {agent['name']} failed: {str(e)}", 'error')
+                    completed += 1
+                    self._emit(ProgressEvent(
+                        stage, 'agent_done' if results[idx] is not None else 'agent_failed',
+                        message=f"{agent['name']} finished ({completed}/{total})",
+                        agent=agent, agent_index=idx, completed=completed, total=total
+                    ))
+
+            for future in sorted(pending, key=lambda f: futures[f][0]):
+                name = self.agents[futures[future][0]]['name']
+                log(f"⏱️ {name} missed the {self.stage_deadline}s stage deadline", 'error')
+                future.cancel()
+        except asyncio.CancelledError:
+            # The stage itself was cancelled (e.g. its job was abandoned): calls
+            # still queued on a shared executor are dropped rather than run for no one
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            if executor is not self.executor:
+                # Don't wait for stragglers. Late calls (and any still queued
+                # behind them) are left to run; otherwise results are discarded.
+                executor.shutdown(wait=False, cancel_futures=late is None)
+        return results, late
+
+    async def _run_single(self, stage, work):
+        """Run work(log, on_token) for a single-model stage on a worker thread"""
+        loop = self._bind_loop()
+        executor = self.executor or ThreadPoolExecutor(max_workers=1)
+        try:
+            return await loop.run_in_executor(
+                executor, work, self._logger(stage), self._partial_emitter(stage)
+            )
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+
+    async def _review_round(self, stage, prompts, routes, assigned, log, drops_late):
+        """Every agent reviews at once with its prompts[agent id]; returns _fan_out()'s (results, late)
+
+        routes are each agent's models, best first, and assigned the idea
+        numbers each was asked to rank. drops_late says whether reviews
+        missing the quorum will be dropped (see _cache_warm_ups()).
+        """
+        # Reviewers sending the same prompt to the same model go after the
+        # first one has been prefilled, when its prefix is in the provider's cache
+        warm_ups = self._cache_warm_ups(routes, prompts, log, drops_late)
+        use_cache = stage not in self.cache_bypass
+
+        def work(agent, agent_log, on_token):
+            warmed, follow = warm_ups.get(agent['id'], (None, None))
+            if follow is not None:
+                event, leader = follow
+                agent_log(f"{agent['name']} waits for {leader['name']} to warm the prompt cache...", 'progress')
+                event.wait(PROMPT_CACHE_WARMUP_SECONDS)
+            if warmed is not None:
+                on_token = _setting(warmed, on_token)
+            agent_log(f"{agent['name']} conducting peer review...", 'progress')
+            model, *fallback_models = routes[agent['id']]
+            try:
+                response, answered_by = self._answer(
+                    stage, agent['name'], REVIEW_SYSTEM_PROMPT, prompts[agent['id']], model,
+                    agent_prompt=agent_prompt(agent, reviewer=True), log=agent_log, on_token=on_token,
+                    use_cache=use_cache, fallback_models=fallback_models, schema=REVIEW_SCHEMA)
+                review = extract_json(response, REVIEW_SCHEMA)
+                if review is not None:
+                    _report_problems(review, REVIEW_SCHEMA, f"{agent['name']}'s review", agent_log)
+                    agent_log(f"✅ {agent['name']} peer review complete", 'success')
+                    return {
+                        'reviewerId': agent['id'],
+                        'reviewerName': agent['name'],
+                        'icon': agent['icon'],
+                        'model': answered_by,
+                        'assignedIdeas': assigned[agent['id']],
+                        **review
+                    }
+            except Exception as e:
+                agent_log(f"⚠️ {agent['name']} peer review failed: {str(e)}", 'error')
+            finally:
+                if warmed is not None:
+                    warmed.set()
+            return None
+
+        return await self._fan_out(stage, work, quorum=self.review_quorum, quorum_deadline=self.quorum_deadline)
+
+    # -- stages -------------------------------------------------------------
+
+    @_traced('explore')
+    async def explore(self, topic):
+        """Stage 1: Diverse Idea Generation"""
+        stage = 'explore'
+        self._bind_loop()
+        log = self._logger(stage)
+        log('🧠 Stage 1: Diverse Idea Generation starting...', 'info')
+        use_cache = stage not in self.cache_bypass
+
+        def work(agent, agent_log, on_token):
+            agent_log(f"Consulting {agent['name']}...", 'progress')
+            model, *fallback_models = self._route(stage, agent['name'], allowed_models(agent), agent_log)
+            try:
+                response, answered_by = self._answer(
+                    stage, agent['name'], EXPLORATION_SYSTEM_PROMPT, exploration_prompt(topic), model,
+                    agent_prompt=agent_prompt(agent), log=agent_log, on_token=on_token, use_cache=use_cache,
+                    fallback_models=fallback_models, schema=EXPLORATION_SCHEMA)
+                analysis = extract_json(response, EXPLORATION_SCHEMA)
+                if analysis is not None:
+                    _report_problems(analysis, EXPLORATION_SCHEMA, f"{agent['name']}'s analysis", agent_log)
+                    agent_log(f"✅ {agent['name']} analysis complete", 'success')
+                    return {
+                        'agentId': agent['id'],
+                        'agentName': agent['name'],
+                        'icon': agent['icon'],
+                        'model': answered_by,
+                        **analysis
+                    }
+            except Exception:
+                agent_log(f"⚠️ {agent['name']} analysis failed", 'error')
+            return None
+
+        results, _ = await self._fan_out(stage, work)
+        explorations = [r for r in results if r is not None]
+        if not explorations:
+            raise CouncilError("No analyses generated")
+
+        self._checkpoint(stage, explorations)
+        log('✅ Stage 1: Diverse Idea Generation complete!', 'success')
+        return explorations
+
+    @_traced('review')
+    async def review(self, explorations):
+        """Stage 2: Anonymous Peer Review"""
+        stage = 'review'
+        self._bind_loop()
+        if not explorations:
+            raise CouncilError("Missing exploration data!")
+        log = self._logger(stage)
+        log('👥 Stage 2: Anonymous Peer Review starting...', 'info')
+
+        anonymized = anonymize_ideas(explorations)
+        self.rng.shuffle(anonymized)
+        # Large councils review sparsely: each reviewer ranks a balanced subset
+        subsets, coverage = review_assignments(len(anonymized), len(self.agents), rng=self.rng)
+        if subsets and len(subsets[0]) < len(anonymized):
+            log(f"Sparse review: each reviewer ranks {len(subsets[0])} of {len(anonymized)} ideas "
+                f"({coverage:.0%} of idea pairs compared)", 'info')
+
+        # Each reviewer's prompt fits its own model's budget; idea fragments are
+        # rendered once and shared
+        prompts = {}
+        assigned = {}
+        routes = {}
+        for agent, subset in zip(self.agents, subsets):
+            ideas = [anonymized[i] for i in subset]
+            assigned[agent['id']] = sorted(idea['ideaNumber'] for idea in ideas)
+            routes[agent['id']] = self._route(stage, agent['name'], allowed_models(agent), log)
+            budget = prompt_budget(routes[agent['id']][0])
+            prompt, level, tokens = fit_review_prompt(
+                ideas, budget, REVIEW_SYSTEM_PROMPT + agent_prompt(agent, reviewer=True))
+            prompts[agent['id']] = prompt
+            if level:
+                log(f"Condensed {agent['name']}'s review prompt to {tokens:,} tokens "
+                    f"(budget {budget:,}, level {level})", 'info')
+            if tokens > budget:
+                log(f"⚠️ {agent['name']}'s review prompt is still {tokens:,} tokens, over the {budget:,} budget",
+                    'error')
+
+        results, late = await self._review_round(stage, prompts, routes, assigned, log,
+                                                 drops_late=self.late_review_policy == 'drop')
+        reviews = [r for r in results if r is not None]
+        if not reviews:
+            raise CouncilError("No peer reviews generated")
+
+        self.late_reviews = None
+        if late is not None:
+            if self.late_review_policy == 'refine':
+                self.late_reviews = late
+                log(f"{len(late.futures)} late review(s) will be folded into the synthesis if they finish in time",
+                    'info')
+            else:
+                for call in late.futures:
+                    call.cancel()
+                log(f"Dropping {len(late.futures)} late review(s)", 'info')
+
+        self._checkpoint(stage, reviews)
+        log('✅ Stage 2: Anonymous Peer Review complete!', 'success')
+        return reviews
+
+    @_traced('synthesize')
+    async def synthesize(self, topic, explorations, reviews):
+        """Stage 3: Synthesis of the original ideas and every peer critique"""
+        stage = 'synthesize'
+        self._bind_loop()
+        if not explorations or not reviews:
+            raise CouncilError("Missing exploration or peer reviews data!")
+        log = self._logger(stage)
+        log('✨ Stage 3: Synthesis with Peer Reviews starting...', 'info')
+
+        model, *fallback_models = self._synthesis_models(stage, 'Synthesizer', log)
+        budget = prompt_budget(model)
+        prompt, levels, tokens = fit_synthesis_prompt(topic, explorations, reviews, budget,
+                                                      consensus=consensus_ranking(explorations, reviews))
+        if levels != (0, 0):
+            log(f"Condensed synthesis prompt to {tokens:,} tokens (budget {budget:,}; "
+                f"ideas level {levels[0]}, critiques level {levels[1]})", 'info')
+        if tokens > budget:
+            log(f"⚠️ Synthesis prompt is still {tokens:,} tokens, over the {budget:,} budget", 'error')
+        log('Calling synthesis model...', 'info')
+
+        def work(stage_log, on_token):
+            return self._call(stage, 'Synthesizer', SYNTHESIS_SYSTEM_PROMPT, prompt, model,
+                              max_tokens=4000,  # Increased for synthesis
+                              log=stage_log, on_token=on_token, use_cache=stage not in self.cache_bypass,
+                              fallback_models=fallback_models, schema=SYNTHESIS_SCHEMA)
+
+        response = await self._run_single(stage, work)
+        log('Received response, parsing...', 'info')
+        if not response:
+            raise CouncilError("Empty response from synthesis model")
+
+        synthesis = parse_synthesis(response, log, self._warner(stage))
+        self._checkpoint(stage, synthesis)
+        log('✅ Stage 3: Synthesis complete!', 'success')
+        return synthesis
+
+    @_traced('refine')
+    async def refine(self, topic, reviews, synthesis):
+        """Stage 3 follow-up: fold reviews that missed the Stage 2 quorum into the synthesis
+
+        Waits for self.late_reviews until their deadline. Returns
+        (reviews, synthesis) with any late reviews appended; both are
+        unchanged when no late review arrived.
+        """
+        stage = 'synthesize'
+        loop = self._bind_loop()
+        late, self.late_reviews = self.late_reviews, None
+        if late is None or not late.futures:
+            return reviews, synthesis
+        log = self._logger(stage)
+        log(f"Waiting for {len(late.futures)} late review(s)...", 'progress')
+
+        waiting = [asyncio.wrap_future(call, loop=loop) for call in late.futures]
+        done, pending = await asyncio.wait(waiting, timeout=max(0.0, late.deadline - time.monotonic()))
+        for future in pending:
+            future.cancel()
+        arrived = [future.result() for future in waiting
+                   if future in done and not future.cancelled() and future.exception() is None
+                   and future.result() is not None]
+        if pending:
+            log(f"⏱️ {len(pending)} late review(s) missed the {self.stage_deadline}s stage deadline", 'error')
+        if not arrived:
+            return reviews, synthesis
+        reviews = reviews + arrived
+        self._checkpoint('review', reviews)
+
+        log(f'✨ Refining synthesis with {len(arrived)} late review(s)...', 'info')
+        prompt = refinement_prompt(topic, synthesis, peer_critiques(arrived))
+        model, *fallback_models = self._synthesis_models(stage, 'Synthesizer', log)
+
+        def work(stage_log, on_token):
+            return self._call(stage, 'Synthesizer', SYNTHESIS_SYSTEM_PROMPT, prompt, model,
+                              max_tokens=4000,
+                              log=stage_log, on_token=on_token, use_cache=stage not in self.cache_bypass,
+                              fallback_models=fallback_models, schema=SYNTHESIS_SCHEMA)
+
+        try:
+            response = await self._run_single(stage, work)
+        except Exception as e:
+            # The synthesis is already saved; the refinement is optional
+            log(f"⚠️ Refinement failed ({e}); keeping the original synthesis", 'error')
+            return reviews, synthesis
+        if not response:
+            log('⚠️ Empty refinement response; keeping the original synthesis', 'error')
+            return reviews, synthesis
+        # Fields the revision left out keep their original values
+        refined = {**synthesis, **parse_synthesis(response, log, self._warner(stage))}
+        self._checkpoint(stage, refined)
+        log('✅ Synthesis refined with late reviews!', 'success')
+        return reviews, refined
+
+    @_traced('debate')
+    async def debate(self, topic, explorations, reviews, synthesis, rounds=None, previous=None):
+        """Further rounds of peer review and synthesis revision, until the rankings settle
+
+        Each round the reviewers get a running summary (the condensed ideas,
+        the consensus ranking and the synthesis) and only what changed in the
+        round before; they rank their Stage 2 ideas again and add points
+        nobody has raised yet. The synthesizer then revises the synthesis with
+        that round's changes. Rounds do not wait for reviews that miss the
+        quorum. Stops after `rounds` rounds (default self.debate_rounds), or
+        once the consensus ranking moves by no more than
+        DEBATE_CONVERGENCE_DISTANCE (see debate.py). `previous` is a
+        checkpointed Debate whose rounds are continued.
+        Returns (debate, synthesis).
+        """
+        stage = 'debate'
+        self._bind_loop()
+        if not explorations or not reviews or not synthesis:
+            raise CouncilError("Missing exploration, peer review or synthesis data!")
+        rounds = self.debate_rounds if rounds is None else rounds
+        log = self._logger(stage)
+        debate = {'rounds': list((previous or {}).get('rounds') or ()), 'maxRounds': rounds, 'stopped': None}
+
+        # The first round's changes are Stage 2's points; later rounds' are the round before's
+        points, seen = seen_points(reviews, debate['rounds'])
+        if debate['rounds']:
+            last = debate['rounds'][-1]
+            consensus, moves, points, revised = (last['consensus'], last['rankChanges'], last['newPoints'],
+                                                 last['revisedFields'])
+            log(f"♻️ Resuming the debate after round {last['round']}", 'info')
+        else:
+            consensus, moves, revised = consensus_ranking(explorations, reviews), [], []
+            log(f'🗣️ Debate: up to {rounds} more round(s) of review and revision...', 'info')
+
+        anonymized = anonymize_ideas(explorations)
+        names = {idea['ideaNumber']: exp['agentName'] for idea, exp in zip(anonymized, explorations)}
+        # Reviewers keep the ideas they ranked in Stage 2; the others get a fresh assignment
+        earlier = {review.get('reviewerId'): review.get('assignedIdeas') for review in reviews}
+        subsets, _ = review_assignments(len(anonymized), len(self.agents), rng=self.rng)
+        assigned = {agent['id']: sorted(earlier.get(agent['id']) or (anonymized[i]['ideaNumber'] for i in subset))
+                    for agent, subset in zip(self.agents, subsets)}
+        use_cache = stage not in self.cache_bypass
+
+        while len(debate['rounds']) < rounds:
+            number = len(debate['rounds']) + 1
+            log(f"🗣️ Debate round {number} starting...", 'info')
+            summary = debate_summary(topic, anonymized, consensus, synthesis)
+            changes = debate_changes(moves, points, revised)
+            prompts = {}
+            routes = {}
+            prompt_tokens = 0
+            for agent in self.agents:
+                routes[agent['id']] = self._route(stage, agent['name'], allowed_models(agent), log)
+                prompts[agent['id']] = debate_review_prompt(summary, changes, assigned[agent['id']], number)
+                prompt_tokens += count_tokens(REVIEW_SYSTEM_PROMPT) + count_tokens(
+                    full_prompt(prompts[agent['id']], agent_prompt(agent, reviewer=True)))
+
+            results, late = await self._review_round(stage, prompts, routes, assigned, log, drops_late=True)
+            if late is not None:
+                for call in late.futures:
+                    call.cancel()
+                log(f"Not waiting for {len(late.futures)} late review(s) this round", 'info')
+            round_reviews = [r for r in results if r is not None]
+            if not round_reviews:
+                log(f"⚠️ No reviews in debate round {number}; ending the debate", 'error')
+                debate['stopped'] = 'no reviews'
+                break
+
+            round_consensus = consensus_ranking(explorations, round_reviews)
+            movement = ranking_distance(consensus['ranking'], round_consensus['ranking'])
+            moves = rank_changes(consensus['ranking'], round_consensus['ranking'])
+            points = new_points(round_reviews, seen)
+            consensus = round_consensus
+            revised = []
+            if moves or points:
+                log(f"✨ Revising the synthesis with round {number}'s changes...", 'info')
+                prompt = debate_revision_prompt(topic, synthesis, debate_changes(moves, points, names=names), number)
+                prompt_tokens += count_tokens(SYNTHESIS_SYSTEM_PROMPT) + count_tokens(prompt)
+                model, *fallback_models = self._synthesis_models(stage, 'Synthesizer', log)
+
+                def work(stage_log, on_token):
+                    return self._call(stage, 'Synthesizer', SYNTHESIS_SYSTEM_PROMPT, prompt, model,
+                                      max_tokens=4000,
+                                      log=stage_log, on_token=on_token, use_cache=use_cache,
+                                      fallback_models=fallback_models, schema=SYNTHESIS_SCHEMA)
+
+                response = await self._run_single(stage, work)
+                if response:
+                    # Fields the revision left out keep their values
+                    revision = {**synthesis, **parse_synthesis(response, log, self._warner(stage))}
+                    revised = changed_fields(synthesis, revision)
+                    synthesis = revision
+                    self._checkpoint('synthesize', synthesis)
+                else:
+                    log('⚠️ Empty revision response; keeping the synthesis', 'error')
+
+            debate['rounds'].append({
+                'round': number,
+                'reviews': round_reviews,
+                'consensus': consensus,
+                'movement': round(movement, 3),
+                'rankChanges': moves,
+                'newPoints': points,
+                'revisedFields': revised,
+                'promptTokens': prompt_tokens,
+            })
+            log(f"Round {number}: {movement:.0%} of idea pairs reordered, {len(points)} new point(s), "
+                f"{len(revised)} synthesis field(s) revised, {prompt_tokens:,} prompt tokens", 'info')
+            if movement <= DEBATE_CONVERGENCE_DISTANCE:
+                debate['stopped'] = 'converged'
+                log(f"🤝 Rankings settled after round {number}; ending the debate", 'success')
+            self._checkpoint(stage, debate)
+            if debate['stopped']:
+                break
+
+        if debate['stopped'] is None:
+            debate['stopped'] = 'max rounds'
+        self._checkpoint(stage, debate)
+        log(f"✅ Debate complete after {len(debate['rounds'])} round(s)!", 'success')
+        return debate, synthesis
+
+    @_traced('propose')
+    async def propose(self, topic, synthesis):
+        """Stage 4: Research Proposal"""
+        stage = 'propose'
+        self._bind_loop()
+        if not synthesis:
+            raise CouncilError("Missing synthesis data!")
+        log = self._logger(stage)
+        log('📄 Generating research proposal...', 'info')
+
+        prompt = proposal_prompt(topic, synthesis)
+        model, *fallback_models = self._synthesis_models(stage, 'Proposal Writer', log)
+
+        def work(stage_log, on_token):
+            return self._call(stage, 'Proposal Writer', PROPOSAL_SYSTEM_PROMPT, prompt, model,
+                              log=stage_log, on_token=on_token, use_cache=stage not in self.cache_bypass,
+                              fallback_models=fallback_models, schema=PROPOSAL_SCHEMA)
+
+        response = await self._run_single(stage, work)
+        proposal = extract_json(response, PROPOSAL_SCHEMA)
+        if proposal is None:
+            raise CouncilError("No JSON found in proposal response")
+        _report_problems(proposal, PROPOSAL_SCHEMA, "The proposal", log)
+        self._checkpoint(stage, proposal)
+        log('✅ Proposal generated!', 'success')
+        return proposal
+
+    def reuse_similar(self, topic):
+        """Checkpoint Stage 1 and 2 of the closest earlier run on a similar topic as this run's
+
+        Returns the match ({run_id, topic, similarity}), or None when there
+        is no run store, no reuse_threshold or no earlier run close enough.
+        """
+        if not self._recording() or self.reuse_threshold is None:
+            return None
+        match = get_topic_index(self.run_store).find(topic, self.reuse_threshold, exclude=self.run_id,
+                                                      owner=self.owner)
+        # The matched run may have been deleted since it was indexed
+        if match is None or not self.run_store.copy_stages(match['run_id'], self.run_id, REUSED_STAGES):
+            return None
+        self._logger('explore')(
+            f"♻️ Reusing Stage 1 and 2 of run {match['run_id']} ({match['similarity']:.0%} similar topic: "
+            f"{match['topic']!r})", 'success'
+        )
+        return match
+
+    async def run(self, topic, proposal=True):
+        """All stages back to back, with debate rounds after the synthesis when debate_rounds is set
+
+        With a run store and run id, stages already checkpointed for the run
+        are loaded instead of being run again. A new run with reuse_threshold
+        set starts from a near-duplicate earlier run's Stage 1 and 2 when
+        there is one (see reuse_similar()).
+        """
+        saved = {}
+        reused_from = None
+        if self._recording():
+            self.run_store.create_run(topic, self.run_id, self.owner)
+            run = self.run_store.load_run(self.run_id, self.owner)
+            if run is None:
+                raise CouncilError(f"Run {self.run_id} belongs to another API key")
+            saved = run['stages']
+            if saved:
+                done = ', '.join(stage for stage in STAGES if stage in saved)
+                self._logger('explore')(f"♻️ Resuming run {self.run_id}: {done} already done", 'info')
+            else:
+                reused_from = self.reuse_similar(topic)
+                if reused_from is not None:
+                    saved = self.run_store.load_run(self.run_id, self.owner)['stages']
+
+        result = CouncilResult(topic=topic, reused_from=reused_from)
+        result.exploration = saved.get('explore') or await self.explore(topic)
+        result.peer_reviews = saved.get('review') or await self.review(result.exploration)
+        result.synthesis = saved.get('synthesize')
+        if not result.synthesis:
+            result.synthesis = await self.synthesize(topic, result.exploration, result.peer_reviews)
+            result.peer_reviews, result.synthesis = await self.refine(topic, result.peer_reviews, result.synthesis)
+        if self.debate_rounds:
+            result.debate = saved.get('debate')
+            # A debate cut short by its round limit goes on when more rounds are asked for now
+            if (not result.debate or not result.debate.get('stopped')
+                    or (result.debate['stopped'] == 'max rounds'
+                        and len(result.debate['rounds']) < self.debate_rounds)):
+                result.debate, result.synthesis = await self.debate(topic, result.exploration, result.peer_reviews,
+                                                                    result.synthesis, previous=result.debate)
+        if result.debate and result.debate['rounds']:
+            # The debated rankings are the ones the revised synthesis and the proposal rest on
+            result.consensus = result.debate['rounds'][-1]['consensus']
+        else:
+            result.consensus = consensus_ranking(result.exploration, result.peer_reviews)
+        if proposal:
+            result.proposal = saved.get('propose') or await self.propose(topic, result.synthesis)
+        return result
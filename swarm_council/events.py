@@ -0,0 +1,147 @@
+"""Bounded, thread-safe log of structured council events
+
+EventLog keeps the most recent events in a fixed-size ring buffer, so memory
+stays flat however long a session runs, and can be appended to from any
+thread (agents log from worker threads without hopping to the event loop).
+Every record is a flat JSON-friendly dict: seq, time, run, stage, level,
+message, agent, model, latency, chars and tokens. With a JSONL path each
+record is also appended to that file as it is logged, which keeps the full
+history that the ring buffer drops.
+"""
+import collections
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAPACITY = int(os.environ.get('SWARM_EVENT_LOG_CAPACITY', 1000))
+DEFAULT_JSONL_PATH = os.environ.get('SWARM_EVENT_LOG_PATH') or None
+
+FIELDS = ('seq', 'time', 'run', 'stage', 'level', 'message', 'agent', 'model', 'latency', 'chars', 'tokens')
+LEVELS = ('info', 'progress', 'success', 'error')
+
+
+class EventLog:
+    """Ring buffer of the last `capacity` events, optionally mirrored to a JSONL file"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, jsonl_path=DEFAULT_JSONL_PATH):
+        self.capacity = capacity
+        self.jsonl_path = jsonl_path
+        self._records = collections.deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._seq = 0
+        # seq of the last event before the last clear(); seq keeps counting so
+        # the JSONL file's numbering stays unique
+        self._cleared_at = 0
+        self._file = None
+
+    def append(self, stage, message, level='info', agent=None, model=None, latency=None, chars=None,
+               tokens=None, run=None):
+        """Log one event; returns its record"""
+        with self._lock:
+            self._seq += 1
+            record = {
+                'seq': self._seq,
+                'time': time.time(),
+                'run': run,
+                'stage': stage,
+                'level': level,
+                'message': message,
+                'agent': agent,
+                'model': model,
+                'latency': None if latency is None else round(latency, 3),
+                'chars': chars,
+                'tokens': tokens,
+            }
+            self._records.append(record)
+            if self.jsonl_path:
+                self._write(record)
+        return record
+
+    def record(self, event, run=None):
+        """Log a ProgressEvent of kind 'log' or 'warning'"""
+        metrics = event.metrics or {}
+        agent = event.agent or {}
+        return self.append(
+            event.stage, event.message, event.level,
+            agent=metrics.get('agent') or agent.get('name'),
+            model=metrics.get('model') or agent.get('model'),
+            latency=metrics.get('latency'),
+            chars=metrics.get('chars'),
+            tokens=metrics.get('tokens'),
+            run=run,
+        )
+
+    def _write(self, record):
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.jsonl_path)), exist_ok=True)
+                self._file = open(self.jsonl_path, 'a', encoding='utf-8', buffering=1)
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        except OSError as e:
+            # Keep logging in memory; a full disk shouldn't stop the council
+            logger.warning("Could not write event log %s: %s", self.jsonl_path, e)
+            self.jsonl_path = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._records)
+
+    def __iter__(self):
+        return iter(self.records())
+
+    @property
+    def total(self):
+        """Events logged since the last clear(), including those the ring buffer has dropped"""
+        with self._lock:
+            return self._seq - self._cleared_at
+
+    @property
+    def dropped(self):
+        with self._lock:
+            return self._seq - self._cleared_at - len(self._records)
+
+    def records(self, levels=None):
+        """Buffered records, oldest first, optionally only those at the given levels"""
+        with self._lock:
+            records = list(self._records)
+        if levels is not None:
+            levels = set(levels)
+            records = [record for record in records if record['level'] in levels]
+        return records
+
+    def page(self, number, size=50, levels=None, newest_first=True):
+        """One page (0-based) of buffered records and the number of pages"""
+        records = self.records(levels)
+        if newest_first:
+            records.reverse()
+        pages = max(1, -(-len(records) // size))
+        number = min(max(number, 0), pages - 1)
+        return records[number * size:(number + 1) * size], pages
+
+    def counts(self):
+        """Buffered records per level"""
+        return collections.Counter(record['level'] for record in self.records())
+
+    def to_jsonl(self):
+        """Buffered records as JSONL text"""
+        return ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in self.records())
+
+    def export(self, path):
+        """Write the buffered records to a JSONL file"""
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_jsonl())
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+            self._cleared_at = self._seq
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
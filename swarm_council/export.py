@@ -0,0 +1,330 @@
+"""Columnar export of runs for analytics (Parquet or Arrow IPC)
+
+Runs in the run store are written out as five normalized tables:
+
+  - runs: one row per run, with its synthesis and proposal fields
+  - agent_outputs: one row per Stage 1 analysis (idea_number is the number
+    reviewers saw it under)
+  - reviews: one row per reviewer and idea critiqued
+  - rankings: one row per reviewer and idea ranked, rank 1 being the strongest
+  - calls: one row per recorded model call, with its usage and timing
+
+Reviews and rankings have a `round` column: 0 for Stage 2, n for debate round
+n (see debate.py).
+
+RunExporter streams: rows are buffered per table and written as a row group
+(a record batch for Arrow) every `row_group_size` rows, so exporting
+thousands of runs keeps only one row group per table in memory. Each export
+writes one part file per table under <directory>/<table>/, so exporting again
+(e.g. only the runs created since the last export) adds files next to the
+earlier ones. Parquet files are zstd-compressed; Arrow IPC files are left
+uncompressed so load_table() can memory-map them without copying.
+
+pyarrow is optional: it is only needed here.
+
+    python -m swarm_council.export exports/ --since 2026-01-01
+"""
+import argparse
+import datetime
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from .runstore import RunStore, get_run_store
+from .structured import EXPLORATION_SCHEMA, PROPOSAL_SCHEMA, SYNTHESIS_SCHEMA
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+TABLES = ('runs', 'agent_outputs', 'reviews', 'rankings', 'calls')
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+ROW_GROUP_SIZE = 10_000
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Exporting runs needs pyarrow (pip install pyarrow)")
+
+
+def _snake(name):
+    return re.sub(r'(?<!^)(?=[A-Z])', '_', name).lower()
+
+
+def _arrow_type(schema):
+    if schema.get('type') == 'array':
+        return pa.list_(_arrow_type(schema['items']))
+    if schema.get('type') == 'integer':
+        return pa.int32()
+    return pa.string()
+
+
+def _schema_fields(json_schema, prefix=''):
+    """(JSON field, column name, arrow type) for every property of a stage schema"""
+    return [(name, prefix + _snake(name), _arrow_type(subschema))
+            for name, subschema in json_schema['properties'].items()]
+
+
+def _coerce(value, arrow_type):
+    # Partial or fallback outputs do not always match their schema
+    if value is None:
+        return None
+    if pa.types.is_list(arrow_type):
+        if not isinstance(value, list):
+            return None
+        return [_coerce(item, arrow_type.value_type) for item in value]
+    if pa.types.is_integer(arrow_type):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _timestamp(seconds):
+    return None if seconds is None else int(round(seconds * 1000))
+
+
+def _schemas(prompts=False):
+    timestamp = pa.timestamp('ms', tz='UTC')
+    synthesis = _schema_fields(SYNTHESIS_SCHEMA, 'synthesis_')
+    proposal = _schema_fields(PROPOSAL_SCHEMA, 'proposal_')
+    exploration = _schema_fields(EXPLORATION_SCHEMA)
+    calls = [
+        ('run_id', pa.string()), ('stage', pa.string()), ('agent', pa.string()), ('model', pa.string()),
+        ('ok', pa.bool_()), ('prompt_tokens', pa.int64()), ('completion_tokens', pa.int64()),
+        ('completion_chars', pa.int64()), ('elapsed', pa.float64()), ('created', timestamp),
+    ]
+    if prompts:
+        calls += [('system_prompt', pa.string()), ('user_prompt', pa.string())]
+    return {
+        'runs': pa.schema([
+            ('run_id', pa.string()), ('topic', pa.string()), ('created', timestamp), ('updated', timestamp),
+            ('last_stage', pa.string()), ('ideas', pa.int32()), ('reviewers', pa.int32()),
+            *[(column, arrow_type) for _, column, arrow_type in synthesis + proposal],
+        ]),
+        'agent_outputs': pa.schema([
+            ('run_id', pa.string()), ('idea_number', pa.int32()), ('agent_id', pa.string()),
+            ('agent_name', pa.string()), ('model', pa.string()),
+            *[(column, arrow_type) for _, column, arrow_type in exploration],
+        ]),
+        'reviews': pa.schema([
+            ('run_id', pa.string()), ('round', pa.int32()), ('reviewer_id', pa.string()),
+            ('reviewer_name', pa.string()), ('model', pa.string()), ('idea_number', pa.int32()),
+            ('strengths', pa.list_(pa.string())), ('weaknesses', pa.list_(pa.string())),
+            ('missing_elements', pa.list_(pa.string())), ('overall_commentary', pa.string()),
+        ]),
+        'rankings': pa.schema([
+            ('run_id', pa.string()), ('round', pa.int32()), ('reviewer_id', pa.string()),
+            ('reviewer_name', pa.string()), ('model', pa.string()), ('idea_number', pa.int32()), ('rank', pa.int32()),
+        ]),
+        'calls': pa.schema(calls),
+    }
+
+
+def _run_rows(run, calls=(), prompts=False):
+    """table -> rows of one run, as loaded by RunStore.load_run() with RunStore.calls()"""
+    run_id = run['id']
+    stages = run['stages']
+    explorations = stages.get('explore') or []
+    reviews = stages.get('review') or []
+    debate = stages.get('debate') if isinstance(stages.get('debate'), dict) else {}
+    synthesis = stages.get('synthesize') if isinstance(stages.get('synthesize'), dict) else {}
+    proposal = stages.get('propose') if isinstance(stages.get('propose'), dict) else {}
+
+    row = {'run_id': run_id, 'topic': run['topic'], 'created': _timestamp(run['created']),
+           'updated': _timestamp(run['updated']), 'last_stage': run['last_stage'],
+           'ideas': len(explorations), 'reviewers': len(reviews)}
+    for source, fields in ((synthesis, _schema_fields(SYNTHESIS_SCHEMA, 'synthesis_')),
+                           (proposal, _schema_fields(PROPOSAL_SCHEMA, 'proposal_'))):
+        for name, column, arrow_type in fields:
+            row[column] = _coerce(source.get(name), arrow_type)
+    rows = {name: [] for name in TABLES}
+    rows['runs'].append(row)
+
+    exploration_fields = _schema_fields(EXPLORATION_SCHEMA)
+    for idea_number, exploration in enumerate(explorations, 1):
+        row = {'run_id': run_id, 'idea_number': idea_number, 'agent_id': exploration.get('agentId'),
+               'agent_name': exploration.get('agentName'), 'model': exploration.get('model')}
+        for name, column, arrow_type in exploration_fields:
+            row[column] = _coerce(exploration.get(name), arrow_type)
+        rows['agent_outputs'].append(row)
+
+    strings = pa.list_(pa.string())
+    rounds = [(0, reviews)] + [(entry.get('round'), entry.get('reviews') or [])
+                               for entry in debate.get('rounds') or [] if isinstance(entry, dict)]
+    for round_number, review in ((number, review) for number, round_reviews in rounds for review in round_reviews):
+        reviewer = {'run_id': run_id, 'round': round_number, 'reviewer_id': review.get('reviewerId'),
+                    'reviewer_name': review.get('reviewerName'), 'model': review.get('model')}
+        commentary = _coerce(review.get('overallCommentary'), pa.string())
+        # A review without critiques still keeps its commentary, under no idea
+        for critique in review.get('reviews') or [{}]:
+            if not isinstance(critique, dict):
+                continue
+            rows['reviews'].append({
+                **reviewer, 'idea_number': _coerce(critique.get('ideaNumber'), pa.int32()),
+                'strengths': _coerce(critique.get('strengths'), strings),
+                'weaknesses': _coerce(critique.get('weaknesses'), strings),
+                'missing_elements': _coerce(critique.get('missingElements'), strings),
+                'overall_commentary': commentary,
+            })
+        for rank, idea_number in enumerate(review.get('ranking') or [], 1):
+            rows['rankings'].append({**reviewer, 'idea_number': _coerce(idea_number, pa.int32()), 'rank': rank})
+
+    for call in calls:
+        row = {'run_id': run_id, 'created': _timestamp(call['created']),
+               **{key: call[key] for key in ('stage', 'agent', 'model', 'ok', 'prompt_tokens', 'completion_tokens',
+                                             'completion_chars', 'elapsed')}}
+        if prompts:
+            prompt = call.get('prompt') or {}
+            row.update(system_prompt=prompt.get('system'), user_prompt=prompt.get('user'))
+        rows['calls'].append(row)
+    return rows
+
+
+class RunExporter:
+    """Streams runs into one file per table, a row group at a time; use as a context manager or close()"""
+
+    def __init__(self, directory, format='parquet', row_group_size=ROW_GROUP_SIZE, prompts=False):
+        _require_pyarrow()
+        if format not in FORMATS:
+            raise ValueError(f"format must be one of {tuple(FORMATS)}")
+        self.directory = directory
+        self.format = format
+        self.row_group_size = row_group_size
+        self.prompts = prompts
+        self.counts = Counter()
+        self._schemas = _schemas(prompts)
+        self._file_name = f"part-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}{FORMATS[format]}"
+        self._buffers = {name: [] for name in TABLES}
+        self._writers = {}
+        self._lock = threading.Lock()
+
+    def path(self, table):
+        return os.path.join(self.directory, table, self._file_name)
+
+    def _writer(self, table):
+        writer = self._writers.get(table)
+        if writer is None:
+            path = self.path(table)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            schema = self._schemas[table]
+            if self.format == 'parquet':
+                writer = pq.ParquetWriter(path, schema, compression='zstd')
+            else:
+                writer = pa.ipc.new_file(path, schema)
+            self._writers[table] = writer
+        return writer
+
+    def _flush(self, table):
+        rows = self._buffers[table]
+        if rows:
+            self._writer(table).write_batch(pa.RecordBatch.from_pylist(rows, schema=self._schemas[table]))
+            self._buffers[table] = []
+
+    def add(self, run, calls=()):
+        """Add one run (RunStore.load_run()) and its call records (RunStore.calls())"""
+        with self._lock:
+            for table, rows in _run_rows(run, calls, self.prompts).items():
+                self._buffers[table].extend(rows)
+                self.counts[table] += len(rows)
+                if len(self._buffers[table]) >= self.row_group_size:
+                    self._flush(table)
+
+    def close(self):
+        """Write what is buffered and finish the files; every table gets one, empty or not"""
+        with self._lock:
+            for table in TABLES:
+                self._flush(table)
+                self._writer(table).close()
+            self._writers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def export_runs(directory, run_store=None, since=0.0, run_ids=None, format='parquet', row_group_size=ROW_GROUP_SIZE,
+                prompts=False):
+    """Export runs from the run store (those created after `since`, or `run_ids`); returns rows per table"""
+    run_store = run_store or get_run_store()
+    with RunExporter(directory, format, row_group_size, prompts) as exporter:
+        for run_id in run_store.run_ids(since) if run_ids is None else run_ids:
+            run = run_store.load_run(run_id)
+            if run is not None:
+                exporter.add(run, run_store.calls(run_id))
+    return dict(exporter.counts)
+
+
+def load_table(directory, table, columns=None, filters=None):
+    """One exported table from every part file under `directory`, memory-mapped
+
+    Only `columns` are read when given; `filters` is a pyarrow.compute
+    expression, e.g. pc.field('stage') == 'review'. Parquet files are read
+    through a memory map and only the row groups the filter can match are
+    decoded; Arrow files are mapped without copying.
+    """
+    _require_pyarrow()
+    table_dir = os.path.join(directory, table)
+    names = sorted(name for name in os.listdir(table_dir) if name.endswith(tuple(FORMATS.values())))
+    parts = []
+    for name in names:
+        path = os.path.join(table_dir, name)
+        if name.endswith(FORMATS['parquet']):
+            part = pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+        else:
+            part = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+            if columns is not None:
+                part = part.select(columns)
+            if filters is not None:
+                part = part.filter(filters)
+        parts.append(part)
+    if not parts:
+        raise FileNotFoundError(f"No exported {table} files in {table_dir}")
+    return pa.concat_tables(parts, promote_options='permissive') if len(parts) > 1 else parts[0]
+
+
+def load_tables(directory, tables=TABLES, columns=None):
+    """table -> load_table() for every table; columns, if given, maps tables to the columns wanted"""
+    return {table: load_table(directory, table, (columns or {}).get(table)) for table in tables}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export runs from the run store as Parquet or Arrow tables")
+    parser.add_argument('directory', help="output directory; one subdirectory per table")
+    parser.add_argument('--format', choices=tuple(FORMATS), default='parquet')
+    parser.add_argument('--since', default=None,
+                        help="only runs created after this date/time (ISO 8601, e.g. 2026-01-01)")
+    parser.add_argument('--runs-path', default=None, help="run store to export (default: SWARM_RUNS_PATH)")
+    parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE,
+                        help="rows per row group (default: %(default)s)")
+    parser.add_argument('--prompts', action='store_true', help="include every call's prompts in the calls table")
+    args = parser.parse_args(argv)
+
+    since = 0.0
+    if args.since:
+        try:
+            since = datetime.datetime.fromisoformat(args.since).timestamp()
+        except ValueError:
+            parser.error(f"--since expects an ISO 8601 date, got {args.since!r}")
+    if pa is None:
+        parser.error("exporting runs needs pyarrow (pip install pyarrow)")
+
+    run_store = RunStore(args.runs_path) if args.runs_path else get_run_store()
+    counts = export_runs(args.directory, run_store, since=since, format=args.format,
+                         row_group_size=args.row_group_size, prompts=args.prompts)
+    print(f"Exported {counts.get('runs', 0)} run(s) to {args.directory}: "
+          + ', '.join(f"{table} {counts.get(table, 0)}" for table in TABLES), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
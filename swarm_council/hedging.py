@@ -0,0 +1,256 @@
+"""Tail-latency control: hedged requests, fallback chains and circuit breakers
+
+hedged() runs a call against the first model of a fallback chain. If no output
+has arrived once the primary passes its observed latency percentile, the next
+model is started as a hedge. Whichever produces output first wins and the
+others are cancelled. Only streamed attempts can really be cancelled (their
+connection is closed); a non-streaming request runs to the end and is billed
+whether it wins or not, so those calls are not hedged, only failed over. A
+model that fails before producing anything is replaced by the next one
+straight away, and one that fails after it started answering counts as a
+failure for its circuit breaker. Per-provider circuit breakers stop traffic to
+endpoints that keep failing and let a single probe through after a cooldown.
+A probe that neither succeeds nor fails (it lost the hedge, returned nothing or
+was abandoned by the consumer) hands the probe slot back for the next call.
+"""
+import queue
+import threading
+import time
+from collections import deque
+
+from .config import (BREAKER_COOLDOWN_SECONDS, BREAKER_FAILURE_THRESHOLD, HEDGE_DEFAULT_DELAY, HEDGE_MIN_DELAY,
+                     HEDGE_MIN_SAMPLES, HEDGE_PERCENTILE)
+from .ratelimit import provider_of
+
+
+def _noop_log(message, log_type='info'):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    """Every model in the chain sits behind an open circuit breaker"""
+
+
+class LatencyTracker:
+    """Rolling window of time-to-first-output per model
+
+    Attempts cancelled before their first output (hedge losers) are recorded
+    as censored samples: their latency is only known to be at least the time
+    they ran. Dropping them would fit the hedge delay to the fast tail only.
+    """
+
+    def __init__(self, window=100):
+        self._samples = {}
+        self._window = window
+        self._lock = threading.Lock()
+
+    def record(self, model, seconds, censored=False):
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append((seconds, censored))
+
+    def percentile(self, model, q):
+        """q-th quantile (0-1) of the recorded latencies, or None without enough samples
+
+        Kaplan-Meier estimate over observed and censored samples. When the
+        censored samples leave the quantile undetermined, the longest time
+        recorded is returned as a lower bound.
+        """
+        with self._lock:
+            # At equal times observed samples come first: they were still at risk
+            samples = sorted(self._samples.get(model, ()), key=lambda sample: (sample[0], sample[1]))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        survival = 1.0
+        for at_risk, (seconds, censored) in zip(range(len(samples), 0, -1), samples):
+            if censored:
+                continue
+            survival *= 1 - 1 / at_risk
+            if 1 - survival >= q:
+                return seconds
+        return samples[-1][0]
+
+    def hedge_delay(self, model):
+        observed = self.percentile(model, HEDGE_PERCENTILE)
+        return HEDGE_DEFAULT_DELAY if observed is None else max(HEDGE_MIN_DELAY, observed)
+
+
+class CircuitBreaker:
+    """Closed → open after consecutive failures → half-open probe after a cooldown"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, cooldown=BREAKER_COOLDOWN_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half_open'
+        return 'open'
+
+    def admit(self):
+        """'closed' or 'probe' when a call may go through, None while the circuit is open
+
+        The caller of a 'probe' must end it with record_success(),
+        record_failure() or release_probe().
+        """
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return 'closed'
+            if state == 'half_open' and not self._probing:
+                self._probing = True
+                return 'probe'
+            return None
+
+    def allow(self):
+        return self.admit() is not None
+
+    def release_probe(self):
+        """End a probe that neither succeeded nor failed; the next call may probe again"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+latency = LatencyTracker()
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(model):
+    provider = provider_of(model)
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker()
+        return _breakers[provider]
+
+
+def breaker_states():
+    with _breakers_lock:
+        return {provider: breaker.state for provider, breaker in _breakers.items()}
+
+
+def hedged(models, attempt, agent_name='', log=_noop_log, on_winner=None, hedge=True):
+    """Yield text deltas from whichever model in `models` produces output first
+
+    attempt(model, cancel) must return an iterator of deltas and stop early
+    once the threading.Event `cancel` is set. on_winner(model) is called once
+    the model that answers is known, before its first delta is yielded. With
+    hedge False a slow model is never raced, only replaced once it fails or
+    returns nothing: for attempts that cannot stop early.
+    """
+    events = queue.Queue()
+    remaining = list(models)
+    running = {}
+    winner = None
+    last_error = None
+
+    def start_next(reason=None):
+        while remaining:
+            model = remaining.pop(0)
+            admitted = breaker_for(model).admit()
+            if admitted is None:
+                log(f"🔌 Skipping {model} for {agent_name}: circuit open for {provider_of(model)}", 'error')
+                continue
+            if reason:
+                log(f"🛡️ {reason}; starting {model} for {agent_name}", 'progress')
+            cancel = threading.Event()
+            running[model] = (cancel, time.monotonic(), admitted == 'probe')
+            threading.Thread(target=run, args=(model, cancel), daemon=True).start()
+            return True
+        return False
+
+    def stop(model, censored):
+        """Cancel a running attempt that has produced no output"""
+        cancel, started, probe = running.pop(model)
+        cancel.set()
+        if censored:
+            latency.record(model, time.monotonic() - started, censored=True)
+        if probe:
+            breaker_for(model).release_probe()
+
+    def run(model, cancel):
+        try:
+            for delta in attempt(model, cancel):
+                if cancel.is_set():
+                    break
+                if delta:
+                    events.put(('delta', model, delta))
+            events.put(('done', model, None))
+        except Exception as e:
+            events.put(('error', model, e))
+
+    if not start_next():
+        raise CircuitOpenError(f"No available model for {agent_name}: every provider's circuit is open")
+
+    try:
+        while running:
+            hedge_at = None
+            if hedge and winner is None and remaining:
+                # The next hedge is timed from the most recently started attempt
+                latest, (_, started, _) = list(running.items())[-1]
+                hedge_at = started + latency.hedge_delay(latest)
+            timeout = None if hedge_at is None else max(0.0, hedge_at - time.monotonic())
+            try:
+                kind, model, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                start_next(f"{latest} passed its p{int(HEDGE_PERCENTILE * 100)} latency")
+                continue
+
+            if model not in running:
+                continue  # a cancelled loser
+            started = running[model][1]
+
+            if kind == 'delta':
+                if winner is None:
+                    winner = model
+                    latency.record(model, time.monotonic() - started)
+                    breaker_for(model).record_success()
+                    for other in list(running):
+                        if other != model:
+                            stop(other, censored=True)
+                    if model != models[0]:
+                        log(f"⚡ {agent_name} answered by fallback model {model}", 'info')
+                    if on_winner is not None:
+                        on_winner(model)
+                yield payload
+            elif kind == 'done':
+                if model == winner:
+                    del running[model]
+                    return
+                stop(model, censored=False)
+                if winner is None and not running and not start_next(f"{model} returned nothing"):
+                    return
+            else:
+                del running[model]
+                last_error = payload
+                breaker_for(model).record_failure()
+                if model == winner:
+                    raise payload
+                if not running and not start_next(f"{model} failed ({type(payload).__name__})"):
+                    raise last_error
+    finally:
+        # Also reached when the consumer stops early: cancel whatever is still running
+        for model in list(running):
+            if model == winner:
+                running.pop(model)[0].set()
+            else:
+                stop(model, censored=True)
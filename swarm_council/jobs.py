@@ -0,0 +1,280 @@
+"""Process-wide queue of council stages, run in the background
+
+Streamlit runs each session's script on its own thread; running a stage
+there ties the thread up for the whole stage and puts no limit on how many
+stages (and model calls) the server runs at once. Instead, stages are
+submitted here as jobs and the page polls them for progress.
+
+All jobs run on one event loop in a background thread, and their model calls
+share one bounded worker pool, so MAX_INFLIGHT_CALLS caps calls in flight
+across every session. At most MAX_RUNNING_JOBS jobs run at once, and at most
+MAX_JOBS_PER_USER per user. Waiting jobs are started round-robin across users,
+so one user queueing many jobs does not hold everyone else up. A job nobody
+has polled for ABANDON_SECONDS (its tab was closed) is cancelled; stages are
+checkpointed as they finish, so the run can still be resumed later.
+"""
+import asyncio
+import collections
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+MAX_RUNNING_JOBS = int(os.environ.get('SWARM_MAX_JOBS', 8))
+MAX_JOBS_PER_USER = int(os.environ.get('SWARM_MAX_JOBS_PER_USER', 2))
+MAX_INFLIGHT_CALLS = int(os.environ.get('SWARM_MAX_INFLIGHT_CALLS', 32))
+ABANDON_SECONDS = float(os.environ.get('SWARM_JOB_ABANDON_SECONDS', 120))
+KEEP_FINISHED_SECONDS = 600
+REAP_INTERVAL_SECONDS = 5
+
+STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+
+class Job:
+    """One submitted stage and what the page needs to draw its progress
+
+    `kind` is free for the submitter (the app puts the stage there). work(job)
+    returns the coroutine to run; its result ends up in `result`,
+    or the exception it raised in `error`. on_event() is the council's event
+    listener: it keeps the latest streamed fields per agent, the progress of
+    fan-out stages and any warnings, for snapshot() to hand to the page.
+    """
+
+    def __init__(self, user, label, work, kind=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.user = user
+        self.label = label
+        self.kind = kind
+        self.work = work
+        self.state = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.error_details = None
+        self.status = label
+        self.progress = None
+        self.partials = {}
+        self.warnings = []
+        self.updates = 0
+        self.last_seen = time.monotonic()
+        self._task = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def touch(self):
+        """Note that someone is still waiting for this job"""
+        self.last_seen = time.monotonic()
+
+    def on_event(self, event):
+        with self._lock:
+            if event.kind == 'warning':
+                self.warnings.append((event.message, event.raw))
+            elif event.kind == 'partial':
+                fields = {'model': event.agent['model'], **event.fields} if event.agent else event.fields
+                self.partials[event.agent_index or 0] = fields
+            elif event.kind in ('agent_done', 'agent_failed'):
+                self.progress = (event.completed, event.total)
+                self.status = event.message
+            elif not (event.kind == 'log' and event.metrics):
+                return
+            # Answered calls (logs with metrics) change the run's cost and token totals
+            self.updates += 1
+
+    def snapshot(self):
+        """A consistent copy of the job's progress"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'label': self.label,
+                'kind': self.kind,
+                'state': self.state,
+                'status': self.status,
+                'progress': self.progress,
+                'partials': dict(self.partials),
+                'warnings': list(self.warnings),
+                'updates': self.updates,
+                'created': self.created,
+                'started': self.started,
+                'finished': self.finished,
+            }
+
+
+class JobQueue:
+    """Runs jobs on a background event loop under global and per-user limits, fairly across users"""
+
+    def __init__(self, max_running=MAX_RUNNING_JOBS, per_user=MAX_JOBS_PER_USER, max_calls=MAX_INFLIGHT_CALLS,
+                 abandon_after=ABANDON_SECONDS, keep_finished=KEEP_FINISHED_SECONDS):
+        self.max_running = max_running
+        self.per_user = per_user
+        self.abandon_after = abandon_after
+        self.keep_finished = keep_finished
+        # Shared by every council the jobs create: the global bound on model calls in flight
+        self.executor = ThreadPoolExecutor(max_workers=max_calls, thread_name_prefix='swarm-call')
+        self._jobs = {}
+        # user -> their waiting jobs; a user whose job is started moves to the back
+        self._waiting = collections.OrderedDict()
+        self._running = collections.Counter()
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._serve, name='swarm-jobs', daemon=True)
+        self._thread.start()
+
+    def _serve(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_later(REAP_INTERVAL_SECONDS, self._reap)
+        self._loop.run_forever()
+
+    def submit(self, user, label, work, kind=None):
+        """Queue work(job) -> coroutine for `user`; returns the Job"""
+        job = Job(user, label, work, kind)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._waiting.setdefault(user, collections.deque()).append(job)
+        self._loop.call_soon_threadsafe(self._dispatch)
+        return job
+
+    def get(self, job_id):
+        """The job with this id (None once it has been forgotten); getting a job counts as polling it"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            job.touch()
+        return job
+
+    def position(self, job):
+        """How many waiting jobs will start before `job` (0 when it is next or not waiting)"""
+        with self._lock:
+            if job.state != 'queued':
+                return 0
+            queues = [list(queue) for queue in self._waiting.values()]
+        if not queues:
+            return 0
+        # Round-robin order: every user's first job, then every user's second, ...
+        order = [queue[rank] for rank in range(max(map(len, queues))) for queue in queues if rank < len(queue)]
+        return order.index(job)
+
+    def cancel(self, job_id):
+        """Cancel a waiting or running job"""
+        self._loop.call_soon_threadsafe(self._cancel, job_id)
+
+    def stats(self):
+        """Running and waiting jobs, in total and per user"""
+        with self._lock:
+            return {
+                'running': sum(self._running.values()),
+                'waiting': sum(len(queue) for queue in self._waiting.values()),
+                'users': {user: {'running': self._running[user], 'waiting': len(self._waiting.get(user, ()))}
+                          for user in set(self._running) | set(self._waiting)},
+            }
+
+    def shutdown(self):
+        """Cancel every job and stop the loop and the worker pool"""
+        try:
+            asyncio.run_coroutine_threadsafe(self._cancel_all(), self._loop).result(timeout=5)
+        except Exception as e:
+            logger.warning("Jobs did not all stop cleanly: %s", e)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # The methods below run on the queue's event loop
+
+    def _next_job(self):
+        with self._lock:
+            if sum(self._running.values()) >= self.max_running:
+                return None
+            for user in list(self._waiting):
+                if self._running[user] >= self.per_user:
+                    continue
+                queue = self._waiting.pop(user)
+                job = queue.popleft()
+                if queue:
+                    self._waiting[user] = queue
+                self._running[user] += 1
+                job.state = 'running'
+                job.started = time.time()
+                return job
+        return None
+
+    def _dispatch(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            job._task = self._loop.create_task(self._run(job))
+
+    async def _run(self, job):
+        try:
+            job.result = await job.work(job)
+            job.state = 'done'
+        except asyncio.CancelledError:
+            job.state = 'cancelled'
+        except Exception as e:
+            job.error = e
+            job.error_details = traceback.format_exc()
+            job.state = 'failed'
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._running[job.user] -= 1
+                if not self._running[job.user]:
+                    del self._running[job.user]
+            self._dispatch()
+
+    def _cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return
+            if job.state == 'queued':
+                queue = self._waiting.get(job.user)
+                queue.remove(job)
+                if not queue:
+                    del self._waiting[job.user]
+                job.state = 'cancelled'
+                job.finished = time.time()
+                return
+        job._task.cancel()
+
+    async def _cancel_all(self):
+        for job_id in list(self._jobs):
+            self._cancel(job_id)
+        tasks = [job._task for job in list(self._jobs.values()) if job._task is not None]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _reap(self):
+        now = time.monotonic()
+        for job in list(self._jobs.values()):
+            if not job.done and now - job.last_seen > self.abandon_after:
+                logger.info("Cancelling job %s (%s): not polled for %.0fs", job.id, job.label, now - job.last_seen)
+                self._cancel(job.id)
+        wall = time.time()
+        with self._lock:
+            for job_id, job in list(self._jobs.items()):
+                if job.done and job.finished and wall - job.finished > self.keep_finished:
+                    del self._jobs[job_id]
+        self._loop.call_later(REAP_INTERVAL_SECONDS, self._reap)
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
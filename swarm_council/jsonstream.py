@@ -0,0 +1,158 @@
+"""Incremental parser that surfaces JSON fields while a response is still streaming
+
+The models answer with one top-level JSON object, possibly wrapped in prose or
+a ```json fence. IncrementalJSONParser is fed text deltas and fills `fields`
+with every top-level field as soon as its value closes; items of top-level
+arrays (e.g. keyTensions, reviews) are appended one by one as each item closes.
+"""
+import json
+import re
+
+_STRUCTURAL = re.compile(r'[{}\[\]",:]')
+_STRING_END = re.compile(r'["\\]')
+
+
+class IncrementalJSONParser:
+    """Feed text deltas, read completed top-level fields from `fields`"""
+
+    def __init__(self):
+        self.fields = {}
+        self.closed = set()
+        self.done = False
+        self._buf = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._string_start = None
+        self._key = None
+        self._expect_key = False
+        self._value_start = None
+        self._array_field = None
+        self._item_begin = None
+        self._item_done = False
+
+    def feed(self, text):
+        """Consume a delta; return the keys whose values changed"""
+        self._buf += text
+        changed = []
+        buf = self._buf
+        while not self.done and self._pos < len(buf):
+            if self._in_string:
+                match = _STRING_END.search(buf, self._pos)
+                if match is None:
+                    self._pos = len(buf)
+                    break
+                if match.group() == '\\':
+                    if match.end() >= len(buf):
+                        # Escape sequence split across deltas; wait for more text
+                        self._pos = match.start()
+                        break
+                    self._pos = match.end() + 1
+                    continue
+                self._pos = match.end()
+                self._in_string = False
+                self._close_string(changed)
+                continue
+
+            if self._depth == 0:
+                start = buf.find('{', self._pos)
+                if start < 0:
+                    self._pos = len(buf)
+                    break
+                self._depth = 1
+                self._expect_key = True
+                self._pos = start + 1
+                continue
+
+            match = _STRUCTURAL.search(buf, self._pos)
+            if match is None:
+                self._pos = len(buf)
+                break
+            char = match.group()
+            idx = match.start()
+            self._pos = match.end()
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = idx
+            elif char in '{[':
+                if self._depth == 1 and char == '[' and self._key is not None:
+                    self._array_field = self._key
+                    self.fields[self._key] = []
+                    changed.append(self._key)
+                    self._start_item(self._pos)
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 2 and self._array_field is not None:
+                    self._append_item(self._pos, changed)
+                elif self._depth == 1 and char == ']' and self._array_field is not None:
+                    self._append_item(idx, changed)
+                    self._array_field = None
+                    self._close_value(self._pos, changed)
+                elif self._depth == 1 and char == '}' and self._value_start is not None:
+                    self._close_value(self._pos, changed)
+                elif self._depth == 0:
+                    self._close_value(idx, changed)
+                    self.done = True
+            elif char == ',':
+                if self._depth == 1:
+                    self._close_value(idx, changed)
+                    self._expect_key = True
+                elif self._depth == 2 and self._array_field is not None:
+                    self._append_item(idx, changed)
+                    self._start_item(self._pos)
+            elif char == ':' and self._depth == 1 and self._key is not None:
+                self._value_start = self._pos
+        return changed
+
+    def _close_string(self, changed):
+        if self._depth == 1 and self._expect_key:
+            self._key = self._loads(self._buf[self._string_start:self._pos])
+            self._expect_key = False
+            self._value_start = None
+        elif self._depth == 1 and self._value_start is not None:
+            self._close_value(self._pos, changed)
+        elif self._depth == 2 and self._array_field is not None:
+            # A string item inside a top-level array is complete once it closes
+            self._append_item(self._pos, changed)
+
+    def _start_item(self, begin):
+        self._item_begin = begin
+        self._item_done = False
+
+    def _append_item(self, end, changed):
+        # Strings and objects are appended when they close; the following
+        # separator must not append them a second time
+        if self._item_done:
+            return
+        self._item_done = True
+        text = self._buf[self._item_begin:end].strip()
+        if not text:
+            return
+        value = self._loads(text)
+        if value is not _INVALID:
+            self.fields[self._array_field].append(value)
+            changed.append(self._array_field)
+
+    def _close_value(self, end, changed):
+        if self._key is None or self._value_start is None or self._key in self.closed:
+            self._value_start = None
+            return
+        value = self._loads(self._buf[self._value_start:end].strip())
+        self._value_start = None
+        if value is _INVALID:
+            return
+        self.fields[self._key] = value
+        self.closed.add(self._key)
+        changed.append(self._key)
+
+    @staticmethod
+    def _loads(text):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return _INVALID
+
+
+_INVALID = object()
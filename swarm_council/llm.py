@@ -0,0 +1,470 @@
+"""Model calls through the pooled OpenRouter clients
+
+Nothing here touches Streamlit: progress and errors are reported through an
+optional log(message, log_type) callback, so the same calls work from the UI,
+worker threads and batch jobs. Timing and token usage of every attempt are
+reported through an optional on_usage(model, usage) callback (see telemetry.py).
+
+An answer that stops at its max_tokens is continued: the model gets its own
+partial answer back and is asked to go on from there, so a long JSON answer
+is completed rather than thrown away and asked for again.
+
+An agent_prompt (the agent's perspective) is sent after the user prompt, so
+that the system and user prompts, shared by all agents of a stage, form a
+common prefix that providers can answer from their prompt caches. Models
+listed in PROMPT_CACHE_CONTROL_MODELS need an explicit cache_control
+breakpoint at the end of that prefix; the others cache prefixes on their own.
+"""
+import json
+import time
+
+import openai
+
+from .cache import cache_key, get_cache
+from .clients import get_client, key_fingerprint
+from .config import CONTINUATION_MAX_ROUNDS, PROMPT_CACHE_CONTROL_MODELS, TEMPERATURE
+from .hedging import hedged
+from .parsing import extract_json
+from .ratelimit import get_scheduler
+from .singleflight import Flight, get_single_flight
+from .structured import get_structured_support, honors, rejects_response_format, response_format, validate
+from .tokens import count_tokens
+
+
+CONTINUE_PROMPT = ("Your answer was cut off. Continue it exactly where it stopped, without repeating anything "
+                   "and without any preamble.")
+# How much of a continuation is checked for text repeating the end of the answer so far
+OVERLAP_WINDOW = 400
+MIN_OVERLAP = 8
+
+
+def _noop_log(message, log_type='info'):
+    pass
+
+
+def log_llm_error(error, model, agent_name, log=_noop_log):
+    """Log an LLM failure with a hint for the common causes"""
+    error_msg = str(error)
+    log(f"Error from {agent_name}: {error_msg}", 'error')
+    # Show more details for common errors
+    if "timeout" in error_msg.lower():
+        log(f"The model {model} timed out. Consider using a faster model.", 'error')
+    elif "rate" in error_msg.lower():
+        log("Rate limit still hit after retries. Please wait and try again.", 'error')
+    elif "credits" in error_msg.lower() or "balance" in error_msg.lower():
+        log("Insufficient credits on OpenRouter. Please add funds.", 'error')
+
+
+def _cached_tokens(usage):
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None)
+
+
+def _usage(started, first_token, prompt_estimate, completion_text, usage, status, finish_reason=None):
+    """What on_usage receives: timings and token counts, estimated when the API sent no usage
+
+    cached_tokens is the part of prompt_tokens read from the provider's prompt
+    cache, None when the provider did not say.
+    """
+    return {
+        'started': started,
+        'wall': time.monotonic() - started,
+        'ttft': None if first_token is None else first_token - started,
+        'prompt_tokens': usage.prompt_tokens if usage else prompt_estimate,
+        'completion_tokens': usage.completion_tokens if usage else count_tokens(completion_text),
+        'cached_tokens': _cached_tokens(usage),
+        'estimated': usage is None,
+        'status': status,
+        'finish_reason': finish_reason,
+    }
+
+
+def full_prompt(user_prompt, agent_prompt=None):
+    """The user message as one text: the shared prompt, then the agent's own part"""
+    return f"{user_prompt}\n\n{agent_prompt}" if agent_prompt else user_prompt
+
+
+def uses_cache_control(model):
+    return model.startswith(PROMPT_CACHE_CONTROL_MODELS)
+
+
+def _messages(system_prompt, user_prompt, continuation=None, agent_prompt=None, cache_control=False):
+    if agent_prompt and cache_control:
+        # The breakpoint caches everything before it: the system prompt and the shared user prompt
+        user_content = [
+            {"type": "text", "text": user_prompt, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": agent_prompt},
+        ]
+    else:
+        user_content = full_prompt(user_prompt, agent_prompt)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_content}
+    ]
+    if continuation:
+        messages += [{"role": "assistant", "content": continuation}, {"role": "user", "content": CONTINUE_PROMPT}]
+    return messages
+
+
+def _skip_overlap(previous, deltas):
+    """Yield a continuation's deltas without any opening text that repeats the end of `previous`"""
+    deltas = iter(deltas)
+    head = ''
+    for delta in deltas:
+        head += delta
+        if len(head) >= OVERLAP_WINDOW:
+            break
+    overlap = next((size for size in range(min(len(head), len(previous)), MIN_OVERLAP - 1, -1)
+                    if previous.endswith(head[:size])), 0)
+    if head[overlap:]:
+        yield head[overlap:]
+    yield from deltas
+
+
+def _create_kwargs(model, system_prompt, user_prompt, max_tokens, response_format=None, continuation=None,
+                   agent_prompt=None, **extra):
+    kwargs = dict(
+        model=model,
+        messages=_messages(system_prompt, user_prompt, continuation, agent_prompt, uses_cache_control(model)),
+        max_tokens=max_tokens,
+        temperature=TEMPERATURE,
+        **extra
+    )
+    if response_format is not None:
+        kwargs['response_format'] = response_format
+    return kwargs
+
+
+def stream_llm(system_prompt, user_prompt, model, agent_name, api_key, max_tokens=2000, log=_noop_log,
+               cancel=None, response_format=None, on_usage=None, continuation=None, agent_prompt=None):
+    """Streaming mode of call_llm: yield text deltas as they arrive
+
+    Setting the threading.Event `cancel` closes the stream after the current
+    chunk. With `continuation` (a partial answer) the model is asked to go on
+    from where that answer stopped. agent_prompt is sent after user_prompt.
+    """
+    started = time.monotonic()
+    first_token = None
+    prompt_estimate = (count_tokens(system_prompt) + count_tokens(full_prompt(user_prompt, agent_prompt))
+                       + count_tokens(continuation or ''))
+    parts = []
+    usage = None
+    finish_reason = None
+    status = 'cancelled'
+    try:
+        if not api_key:
+            raise ValueError("API key not provided. Please enter your OpenRouter API key.")
+
+        # Shared, pooled client: reuses keep-alive connections across calls, threads and sessions
+        client = get_client(api_key)
+
+        log(f"Calling {agent_name} with model {model}...", 'info')
+
+        def create():
+            nonlocal started
+            # Latency is measured from when the request is sent, not from
+            # when the rate limiter was first asked
+            started = time.monotonic()
+            return client.chat.completions.with_raw_response.create(
+                **_create_kwargs(model, system_prompt, user_prompt, max_tokens, response_format, continuation,
+                                 agent_prompt, stream=True, stream_options={'include_usage': True})
+            )
+
+        scheduler = get_scheduler()
+        account = key_fingerprint(api_key)
+        # Closing the scheduler's stream closes the response and frees its concurrency slot
+        stream = scheduler.stream(model, prompt_estimate, create, agent_name, log, account)
+
+        received = 0
+        try:
+            for chunk in stream:
+                if cancel is not None and cancel.is_set():
+                    log(f"Cancelled {agent_name} on {model}", 'info')
+                    return
+                if getattr(chunk, 'usage', None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                finish_reason = getattr(chunk.choices[0], 'finish_reason', None) or finish_reason
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first_token is None:
+                        first_token = time.monotonic()
+                    received += len(delta)
+                    parts.append(delta)
+                    yield delta
+        finally:
+            stream.close()
+        status = 'ok'
+        scheduler.record_completion(model, usage.completion_tokens if usage else received // 4, account)
+
+        if not received:
+            log(f"Warning: Empty response from {agent_name}", 'error')
+        else:
+            log(f"Received {received} chars from {agent_name}", 'info')
+    except Exception as e:
+        status = 'error'
+        log_llm_error(e, model, agent_name, log)
+        raise e
+    finally:
+        if on_usage is not None:
+            on_usage(model, _usage(started, first_token, prompt_estimate, ''.join(parts), usage, status,
+                                   finish_reason))
+
+
+def request_llm(system_prompt, user_prompt, model, agent_name, api_key, max_tokens=2000, log=_noop_log,
+                response_format=None, on_usage=None, continuation=None, agent_prompt=None):
+    """Non-streaming request; returns the full response text"""
+    started = time.monotonic()
+    prompt_estimate = (count_tokens(system_prompt) + count_tokens(full_prompt(user_prompt, agent_prompt))
+                       + count_tokens(continuation or ''))
+    content = None
+    usage = None
+    finish_reason = None
+    status = 'error'
+    try:
+        if not api_key:
+            raise ValueError("API key not provided. Please enter your OpenRouter API key.")
+
+        # Shared, pooled client: reuses keep-alive connections across calls, threads and sessions
+        client = get_client(api_key)
+
+        log(f"Calling {agent_name} with model {model}...", 'info')
+
+        def create():
+            nonlocal started
+            started = time.monotonic()
+            return client.chat.completions.with_raw_response.create(
+                **_create_kwargs(model, system_prompt, user_prompt, max_tokens, response_format, continuation,
+                                 agent_prompt)
+            )
+
+        scheduler = get_scheduler()
+        account = key_fingerprint(api_key)
+        raw = scheduler.call(model, prompt_estimate, create, agent_name, log, account)
+        response = raw.parse()
+        usage = getattr(response, 'usage', None)
+
+        content = response.choices[0].message.content
+        finish_reason = getattr(response.choices[0], 'finish_reason', None)
+        status = 'ok'
+        scheduler.record_completion(
+            model, usage.completion_tokens if usage else count_tokens(content or ''), account
+        )
+        if not content:
+            log(f"Warning: Empty response from {agent_name}", 'error')
+            return ""
+
+        log(f"Received {len(content)} chars from {agent_name}", 'info')
+        return content
+    except Exception as e:
+        log_llm_error(e, model, agent_name, log)
+        raise e
+    finally:
+        if on_usage is not None:
+            # Without streaming the first token arrives with the whole answer
+            finished = time.monotonic() if status == 'ok' else None
+            on_usage(model, _usage(started, finished, prompt_estimate, content or '', usage, status, finish_reason))
+
+
+def call_llm(system_prompt, user_prompt, model, agent_name, api_key, max_tokens=2000, log=_noop_log,
+             on_token=None, use_cache=True, fallback_models=(), schema=None, on_usage=None, output_limits=None,
+             agent_prompt=None, on_model=None):
+    """Call LLM via OpenRouter API
+
+    With on_token the response is streamed and on_token(delta) is called for
+    every chunk; the full text is still returned. Identical requests are
+    answered from the persistent response cache unless use_cache is False.
+    Only finished answers are stored (not cut off, and valid for `schema` if
+    one is given), filed under the model that actually wrote them.
+    fallback_models are hedged against / failed over to when `model` is slow
+    or failing (see hedging.py). With a JSON `schema`, models that honor
+    structured output are asked for it (see structured.py). on_usage(model,
+    usage) is called once per attempt, cache hits included, with its timings
+    and token counts. A call identical to one already in flight (from any
+    thread or session) shares that request instead of making its own, even
+    with use_cache False: it still gets a fresh answer (see singleflight.py).
+    If the shared request fails before any output, the call is made again
+    with this caller's own api_key.
+    With output_limits (see tokens.StageOutputLengths) each attempt asks for
+    the max_tokens its model's past answers call for, max_tokens being the
+    default, and the length of its answer is recorded; answers cut off at the
+    limit are continued either way. agent_prompt, the part of the prompt only
+    this agent gets, is sent after user_prompt (see the module docstring).
+    on_model(model) is called with the model whose answer is returned, which
+    may be a fallback.
+    """
+    key = None
+    if use_cache:
+        key = cache_key(model, system_prompt, full_prompt(user_prompt, agent_prompt), TEMPERATURE, max_tokens)
+        started = time.monotonic()
+        cached = get_cache().get(key)
+        if cached is not None:
+            log(f"💾 Cache hit for {agent_name} ({model})", 'info')
+            if on_usage is not None:
+                on_usage(model, {'started': started, 'wall': time.monotonic() - started, 'ttft': None,
+                                 'prompt_tokens': None, 'completion_tokens': None, 'estimated': False,
+                                 'status': 'cached'})
+            if on_token is not None:
+                on_token(cached)
+            if on_model is not None:
+                on_model(model)
+            return cached
+
+    flight_key = (
+        key or cache_key(model, system_prompt, full_prompt(user_prompt, agent_prompt), TEMPERATURE, max_tokens),
+        tuple(fallback_models),
+        None if schema is None else json.dumps(schema, sort_keys=True),
+    )
+    single_flight = get_single_flight()
+    flight, leads = single_flight.join(flight_key)
+    if not leads:
+        content = _follow(flight, model, agent_name, log, on_token, on_usage, on_model)
+        if content is not None:
+            return content
+        # The leader's error may be its API key's own (rejected, out of credits, rate limited): ask with ours.
+        # This request is not registered, so nothing else joins it
+        log(f"🔗 The request {agent_name} joined failed; sending its own", 'info')
+        flight = Flight()
+
+    def record_usage(attempt_model, usage):
+        if on_usage is not None:
+            on_usage(attempt_model, usage)
+
+    def on_winner(winner):
+        # Followers report the model that actually answered, which may be a fallback
+        flight.model = winner
+        if on_model is not None:
+            on_model(winner)
+
+    def call(attempt_model, cancel, fmt, limit, report, continuation=None):
+        if on_token is not None:
+            return stream_llm(system_prompt, user_prompt, attempt_model, agent_name, api_key, limit, log,
+                              cancel, fmt, report, continuation, agent_prompt)
+        return iter([request_llm(system_prompt, user_prompt, attempt_model, agent_name, api_key, limit, log,
+                                 fmt, report, continuation, agent_prompt)])
+
+    support = get_structured_support() if schema is not None else None
+    finish_reasons = {}
+
+    def attempt(attempt_model, cancel):
+        fmt = response_format(schema) if support is not None and support.should_request(attempt_model) else None
+        limit = max_tokens if output_limits is None else output_limits.limit(attempt_model, max_tokens)
+        received = []
+        outcome = {'finish_reason': None, 'tokens': 0}
+
+        def report(usage_model, usage):
+            if usage['status'] == 'ok':
+                outcome['finish_reason'] = usage['finish_reason']
+                outcome['tokens'] += usage['completion_tokens'] or 0
+            record_usage(usage_model, usage)
+
+        def run(fmt, continuation=None):
+            deltas = call(attempt_model, cancel, fmt, limit, report, continuation)
+            if continuation is not None:
+                deltas = _skip_overlap(continuation, deltas)
+            for delta in deltas:
+                received.append(delta)
+                yield delta
+
+        try:
+            yield from run(fmt)
+        except openai.BadRequestError as e:
+            if fmt is None or received or not rejects_response_format(e):
+                raise
+            support.reject(attempt_model)
+            log(f"{attempt_model} rejected structured output; asking for plain JSON instead", 'info')
+            fmt = None
+            yield from run(None)
+
+        rounds = 0
+        while outcome['finish_reason'] == 'length' and not cancel.is_set():
+            if rounds == CONTINUATION_MAX_ROUNDS:
+                log(f"⚠️ {agent_name}'s answer from {attempt_model} is still cut off after {rounds} "
+                    f"continuation(s)", 'error')
+                break
+            rounds += 1
+            log(f"✂️ {agent_name}'s answer hit the {limit:,}-token limit on {attempt_model}; continuing it", 'info')
+            outcome['finish_reason'] = None
+            # Without response_format: a schema-constrained model would start a new object
+            yield from run(None, ''.join(received))
+
+        if cancel.is_set():
+            return
+        finish_reasons[attempt_model] = outcome['finish_reason']
+        if fmt is not None:
+            support.record(attempt_model, honors(''.join(received), schema))
+        if output_limits is not None:
+            output_limits.record(attempt_model, outcome['tokens'])
+
+    chunks = []
+    error = None
+    try:
+        # A losing non-streaming request would still run to the end and be billed
+        for delta in hedged([model, *fallback_models], attempt, agent_name, log, on_winner,
+                            hedge=on_token is not None):
+            chunks.append(delta)
+            flight.publish(delta)
+            if on_token is not None:
+                on_token(delta)
+        content = ''.join(chunks)
+        answered_by = flight.model or model
+        if key is not None and finish_reasons.get(answered_by) == 'stop' and _complete(content, schema):
+            if answered_by != model:
+                # Filed under the model that wrote it: asking `model` again may well get its own answer
+                key = cache_key(answered_by, system_prompt, full_prompt(user_prompt, agent_prompt), TEMPERATURE,
+                                max_tokens)
+            get_cache().put(key, answered_by, content)
+        return content
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        single_flight.land(flight_key, flight, error)
+
+
+def _complete(content, schema):
+    """Whether an answer is worth caching: non-empty and, with a schema, valid JSON for it"""
+    if not content:
+        return False
+    if schema is None:
+        return True
+    value = extract_json(content, schema)
+    return value is not None and not validate(value, schema)
+
+
+def _follow(flight, model, agent_name, log, on_token, on_usage, on_model=None):
+    """Wait on an identical request already in flight, streaming its deltas as they arrive
+
+    Returns None, reporting nothing, when the leader failed before producing
+    any output: the caller then makes its own request. A failure after
+    output was shared is raised, since the deltas have been passed on.
+    """
+    log(f"🔗 {agent_name} joined an identical request already in flight ({model})", 'info')
+    started = time.monotonic()
+    first_token = None
+    chunks = []
+    status = 'error'
+    try:
+        for delta in flight.follow():
+            if first_token is None:
+                first_token = time.monotonic()
+            chunks.append(delta)
+            if on_token is not None:
+                on_token(delta)
+        status = 'coalesced'
+        if on_model is not None:
+            on_model(flight.model or model)
+        return ''.join(chunks)
+    except Exception:
+        if chunks:
+            raise
+        status = None
+        return None
+    finally:
+        if on_usage is not None and status is not None:
+            # Nothing was sent on this call's behalf, so it carries no tokens or cost of its own
+            on_usage(flight.model or model, {'started': started, 'wall': time.monotonic() - started,
+                                             'ttft': None if first_token is None else first_token - started,
+                                             'prompt_tokens': None, 'completion_tokens': None, 'estimated': False,
+                                             'status': status})
@@ -0,0 +1,741 @@
+"""Local OpenAI-compatible chat completions server for offline benchmarks
+
+MockServer answers POST .../chat/completions like OpenRouter does, streamed
+(server-sent events, with a final usage chunk when asked for) or not, so the
+whole council can run without network access or API spend. It has three modes:
+
+- synthetic: answers are generated to fit the stage's JSON schema (taken from
+  response_format, or recognised from the field names the prompt asks for),
+  after a time to first token drawn from a configurable distribution and at a
+  configurable token rate;
+- record: requests are proxied to a real upstream and every answer, with its
+  usage and timing, is appended to a JSONL cassette;
+- replay: answers come from a cassette, keyed on the request, with their
+  recorded timing.
+
+Rate limits (429 with retry-after), stalled requests (the connection is
+dropped after a delay) and malformed JSON answers can be injected at given
+rates in synthetic and replay mode. A synthetic answer cut off at max_tokens
+can be continued: sent back as an assistant message, it is answered with
+the rest of the answer. Prompt prefixes are cached like providers do it:
+a request starting with a prefix of at least 1024 tokens seen before (up to
+the cache_control breakpoint, for the models that need one) reports those
+tokens as cached, and with a prefill rate set only uncached prompt tokens
+add to the time to first token. A prefix is cached once its request has
+been prefilled, so identical requests sent at once all miss. Latency
+distributions are written as 'fixed:SECONDS', 'uniform:LOW,HIGH', 'exp:MEAN'
+or 'lognormal:MEDIAN,SIGMA'.
+
+Run it standalone and point the app at it with SWARM_BASE_URL:
+
+    python -m swarm_council.mockserver --port 8765 --ttft lognormal:0.8,0.5
+    SWARM_BASE_URL=http://127.0.0.1:8765/v1 streamlit run streamlit_app.py
+"""
+import argparse
+import collections
+import hashlib
+import http.server
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import httpx
+
+from .clients import OPENROUTER_BASE_URL
+from .config import PROMPT_CACHE_CONTROL_MODELS
+from .structured import EXPLORATION_SCHEMA, PROPOSAL_SCHEMA, REVIEW_SCHEMA, SYNTHESIS_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+MODES = ('synthetic', 'record', 'replay')
+# Cut-off synthetic answers kept so they can be continued
+MAX_TRUNCATED = 256
+# Prompt prefixes are cached in blocks of this many characters, from MIN_CACHED_CHARS on
+PREFIX_BLOCK_CHARS = 512
+MIN_CACHED_CHARS = 4096
+MAX_CACHED_PREFIXES = 4096
+MALFORMED_KINDS = ('truncated', 'prose', 'trailing_comma')
+SCHEMAS = (EXPLORATION_SCHEMA, REVIEW_SCHEMA, SYNTHESIS_SCHEMA, PROPOSAL_SCHEMA)
+
+CHARS_PER_TOKEN = 4
+CHUNK_TOKENS = 4
+
+_WORDS = (
+    'adaptive', 'agent', 'analysis', 'boundary', 'causal', 'coherence', 'context', 'contrast', 'data', 'design',
+    'dynamics', 'evidence', 'framework', 'hypothesis', 'inference', 'interaction', 'mechanism', 'method',
+    'model', 'network', 'outcome', 'pattern', 'perspective', 'policy', 'practice', 'process', 'question',
+    'scale', 'signal', 'structure', 'system', 'tension', 'theory', 'trade-off', 'uncertainty', 'validity',
+)
+_IDEA = re.compile(r'IDEA #(\d+)')
+
+_DISTRIBUTIONS = {
+    'fixed': (1, lambda rng, seconds: seconds),
+    'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+    'exp': (1, lambda rng, mean: rng.expovariate(1.0 / mean) if mean > 0 else 0.0),
+    'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0),
+}
+
+
+def parse_latency(spec):
+    """sample(rng) -> seconds for a distribution spec such as 'lognormal:0.8,0.5'"""
+    name, _, args = spec.partition(':')
+    if name not in _DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution {name!r}; use one of {', '.join(_DISTRIBUTIONS)}")
+    arity, draw = _DISTRIBUTIONS[name]
+    try:
+        values = [float(value) for value in args.split(',')] if args else []
+    except ValueError:
+        raise ValueError(f"Latency parameters must be numbers: {spec!r}") from None
+    if len(values) != arity:
+        raise ValueError(f"{name} takes {arity} parameter(s): {spec!r}")
+    return lambda rng: max(0.0, draw(rng, *values))
+
+
+@dataclass
+class MockConfig:
+    """How the mock server answers; rates are probabilities per request"""
+    mode: str = 'synthetic'
+    ttft: str = 'lognormal:0.8,0.5'
+    tokens_per_second: float = 80.0
+    model_ttft: dict = field(default_factory=dict)  # model -> latency spec overriding `ttft`
+    rate_limit_rate: float = 0.0
+    retry_after: float = 0.5
+    timeout_rate: float = 0.0
+    stall_seconds: float = 5.0
+    malformed_rate: float = 0.0
+    answer_words: int = 12
+    seed: Optional[int] = None
+    cassette: Optional[str] = None
+    upstream: str = OPENROUTER_BASE_URL
+    replay_speed: float = 1.0  # recorded timings are multiplied by this; 0 replays instantly
+    replay_miss: str = 'error'  # or 'synthetic': generate an answer for requests not on the cassette
+    prompt_cache: bool = True
+    prefill_tokens_per_second: float = 0.0  # 0: prompt length does not add to the time to first token
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def request_key(body):
+    """Cassette key: what determines a model's answer, ignoring transport options"""
+    return _digest({name: body.get(name) for name in ('model', 'messages', 'max_tokens', 'temperature',
+                                                      'response_format')})
+
+
+def loose_key(body):
+    """Fallback cassette key: same model, system prompt, last paragraph and expected output
+
+    Later prompts embed earlier answers in arrival order (and a review quorum
+    decides which ones), so they rarely repeat exactly between runs. The last
+    paragraph of the prompt is where each agent's perspective goes.
+    """
+    messages = body.get('messages') or ()
+    system = [_content_text(message.get('content')) for message in messages if message.get('role') == 'system']
+    user = [_content_text(message.get('content')) for message in messages if message.get('role') == 'user']
+    tail = user[-1].rsplit('\n\n', 1)[-1] if user else ''
+    return _digest({'model': body.get('model'), 'system': system, 'tail': tail,
+                    'fields': sorted(schema_for(body)['properties'])})
+
+
+def _content_text(content):
+    """A message's text, whether its content is a string or a list of parts"""
+    if isinstance(content, list):
+        return ''.join(str(part.get('text') or '') for part in content if isinstance(part, dict))
+    return str(content or '')
+
+
+def _prompt_layout(body):
+    """(prompt text, length of its prefix up to the last cache_control breakpoint or None)"""
+    text = ''
+    breakpoint = None
+    for idx, message in enumerate(body.get('messages') or ()):
+        if idx:
+            text += '\n'
+        content = message.get('content')
+        for part in content if isinstance(content, list) else [{'text': content}]:
+            if not isinstance(part, dict):
+                continue
+            text += str(part.get('text') or '')
+            if part.get('cache_control'):
+                breakpoint = len(text)
+    return text, breakpoint
+
+
+def _prompt_text(body):
+    return _prompt_layout(body)[0]
+
+
+def schema_for(body):
+    """The JSON schema a request wants: its response_format, else the one whose fields the prompt names"""
+    json_schema = (body.get('response_format') or {}).get('json_schema') or {}
+    if json_schema.get('schema'):
+        return json_schema['schema']
+    text = _prompt_text(body)
+    return max(SCHEMAS, key=lambda schema: sum(f'"{name}"' in text for name in schema['properties']))
+
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(_WORDS) for _ in range(rng.randint(max(1, words // 2), max(1, words))))
+
+
+def fake_value(schema, rng, ideas=(1, 2, 3), words=12, name=None):
+    """A value valid for `schema`; review arrays cover exactly the idea numbers the prompt showed"""
+    kind = schema.get('type')
+    if kind == 'object':
+        return {key: fake_value(sub, rng, ideas, words, key) for key, sub in schema.get('properties', {}).items()}
+    if kind == 'array':
+        items = schema.get('items', {'type': 'string'})
+        if name == 'ranking':
+            ranking = list(ideas)
+            rng.shuffle(ranking)
+            return ranking
+        if 'ideaNumber' in items.get('properties', {}):
+            return [dict(fake_value(items, rng, ideas, words), ideaNumber=number) for number in ideas]
+        return [fake_value(items, rng, ideas, words) for _ in range(rng.randint(2, 4))]
+    if kind == 'integer':
+        return rng.randint(1, 10)
+    if kind == 'number':
+        return round(rng.random(), 3)
+    if kind == 'boolean':
+        return rng.random() < 0.5
+    return _sentence(rng, words)
+
+
+def malform(text, kind):
+    """Damage a JSON answer the way models do: cut off, prose only, or with a trailing comma"""
+    if kind == 'truncated':
+        return text[:max(1, len(text) * 2 // 3)]
+    if kind == 'prose':
+        return re.sub(r'[{}\[\]":,]', ' ', text)
+    if kind == 'trailing_comma':
+        end = text.rfind('}')
+        return text[:end].rstrip() + ',\n' + text[end:] if end > 0 else text
+    raise ValueError(f"Unknown malformation {kind!r}")
+
+
+class Cassette:
+    """Recorded answers, appended to a JSONL file as they are recorded
+
+    Answers are looked up by request_key(); requests that were never recorded
+    exactly get one recorded for a request with the same loose_key(), in turn.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._exact = collections.defaultdict(list)
+        self._loose = collections.defaultdict(list)
+        self._loose_served = collections.Counter()
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        except FileNotFoundError:
+            pass
+
+    def _index(self, entry):
+        self._exact[entry['key']].append(entry)
+        if entry.get('loose_key'):
+            self._loose[entry['loose_key']].append(entry)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entries) for entries in self._exact.values())
+
+    def get(self, key, loose=None, occurrence=0):
+        """(entry, 'exact' or 'loose') for a request, or (None, None)
+
+        The `occurrence`-th identical request gets the `occurrence`-th
+        recording of it, cycling.
+        """
+        with self._lock:
+            entries = self._exact.get(key)
+            if entries:
+                return entries[occurrence % len(entries)], 'exact'
+            entries = self._loose.get(loose)
+            if entries:
+                served = self._loose_served[loose]
+                self._loose_served[loose] += 1
+                return entries[served % len(entries)], 'loose'
+        return None, None
+
+    def add(self, entry):
+        with self._lock:
+            self._index(entry)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+class _Disconnect(Exception):
+    """The client went away (cancelled or hedged call); stop answering"""
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'SwarmMock/1.0'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def do_HEAD(self):
+        # Connection pre-warming
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        if not self.path.rstrip('/').endswith('/models'):
+            return self._error(404, f"No route for GET {self.path}")
+        models = sorted(self.server.mock.models_seen())
+        self._json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model'} for model in models]})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self._error(404, f"No route for POST {self.path}")
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            body = json.loads(raw)
+        except ValueError:
+            return self._error(400, "Request body is not JSON")
+        try:
+            self.server.mock.handle(self, body, raw)
+        except _Disconnect:
+            self.close_connection = True
+
+    # Response helpers used by MockServer.handle
+
+    def _write(self, data):
+        try:
+            self.wfile.write(data)
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise _Disconnect() from e
+
+    def _json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self._write(data)
+
+    def _error(self, status, message, headers=None):
+        self._json(status, {'error': {'message': message, 'code': status}}, headers)
+
+    def _start_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+    def _event(self, data):
+        payload = (data if isinstance(data, str) else json.dumps(data)).encode('utf-8')
+        self._chunk(b'data: ' + payload + b'\n\n')
+
+    def _chunk(self, data):
+        self._write(f"{len(data):x}\r\n".encode('ascii') + data + b'\r\n')
+
+    def _end_events(self):
+        self._write(b'0\r\n\r\n')
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class MockServer:
+    """An OpenAI-compatible server on a background thread; use as a context manager or start()/stop()"""
+
+    def __init__(self, config=None, host='127.0.0.1', port=0):
+        self.config = config or MockConfig()
+        if self.config.mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        if self.config.mode != 'synthetic' and not self.config.cassette:
+            raise ValueError(f"{self.config.mode} mode needs a cassette path")
+        self._ttft = parse_latency(self.config.ttft)
+        self._model_ttft = {model: parse_latency(spec) for model, spec in self.config.model_ttft.items()}
+        self.cassette = Cassette(self.config.cassette) if self.config.cassette else None
+        self._upstream = httpx.Client(timeout=None) if self.config.mode == 'record' else None
+        self._seed_rng = random.Random(self.config.seed)
+        self._seen = collections.Counter()
+        self._stats = collections.Counter()
+        self._models = set()
+        self._truncated = collections.OrderedDict()
+        self._prefixes = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        """Base URL to give an OpenAI client (ends in /v1)"""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='swarm-mock-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._upstream is not None:
+            self._upstream.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve_forever(self):
+        try:
+            self._httpd.serve_forever()
+        finally:
+            self._httpd.server_close()
+
+    def stats(self):
+        """Requests served, faults injected and cassette hits/misses so far"""
+        with self._lock:
+            return dict(self._stats)
+
+    def models_seen(self):
+        with self._lock:
+            return set(self._models)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _rng(self, key):
+        """Per-request randomness: with a seed, the n-th identical request always behaves the same"""
+        with self._lock:
+            occurrence = self._seen[key]
+            self._seen[key] += 1
+            self._models.add(key[1])
+            seed = self._seed_rng.random() if self.config.seed is None else self.config.seed
+        return random.Random(f"{seed}:{key[0]}:{occurrence}"), occurrence
+
+    def handle(self, handler, body, raw):
+        key = request_key(body)
+        model = body.get('model') or 'unknown'
+        rng, occurrence = self._rng((key, model))
+        self._count('requests')
+        if self.config.mode == 'record':
+            try:
+                return self._record(handler, body, raw, key)
+            except httpx.HTTPError as e:
+                self._count('upstream_errors')
+                return handler._error(502, f"Upstream request failed: {e}")
+
+        if rng.random() < self.config.rate_limit_rate:
+            self._count('rate_limited')
+            return handler._error(429, "Rate limit exceeded (mock)", {'retry-after': f"{self.config.retry_after:g}"})
+        if rng.random() < self.config.timeout_rate:
+            self._count('stalled')
+            time.sleep(self.config.stall_seconds)
+            # Drop the connection without answering, like a proxy timing out
+            handler.close_connection = True
+            return
+
+        prompt_tokens = max(1, len(_prompt_text(body)) // CHARS_PER_TOKEN)
+        cached_tokens, prefixes = self._prompt_cache(body, model)
+        entry = None
+        if self.config.mode == 'replay':
+            entry, match = self.cassette.get(key, loose_key(body), occurrence)
+            if entry is None:
+                self._count('replay_misses')
+                if self.config.replay_miss != 'synthetic':
+                    return handler._error(404, f"No cassette entry for this {model} request")
+            else:
+                self._count(f"replay_{match}")
+
+        if entry is not None:
+            content = entry['content']
+            finish_reason = entry.get('finish_reason') or 'stop'
+            usage = entry.get('usage') or {}
+            ttft = entry.get('ttft', 0.0) * self.config.replay_speed
+            generation = max(0.0, entry.get('wall', 0.0) * self.config.replay_speed - ttft)
+        else:
+            content, finish_reason = self._synthesize(body, rng)
+            usage = {}
+            sampler = self._model_ttft.get(model, self._ttft)
+            ttft = sampler(rng)
+            if self.config.prefill_tokens_per_second:
+                ttft += (prompt_tokens - cached_tokens) / self.config.prefill_tokens_per_second
+            generation = len(content) / CHARS_PER_TOKEN / self.config.tokens_per_second
+
+        if rng.random() < self.config.malformed_rate:
+            kind = rng.choice(MALFORMED_KINDS)
+            self._count(f"malformed_{kind}")
+            content = malform(content, kind)
+
+        usage = {
+            'prompt_tokens': usage.get('prompt_tokens') or prompt_tokens,
+            'completion_tokens': usage.get('completion_tokens') or max(1, len(content) // CHARS_PER_TOKEN),
+            'prompt_tokens_details': {'cached_tokens': cached_tokens},
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        self._answer(handler, body, model, content, finish_reason, usage, ttft, generation,
+                     lambda: self._cache_prefixes(prefixes))
+
+    def _prompt_cache(self, body, model):
+        """(prompt tokens of this request found in the prefix cache, its prefixes to cache once prefilled)"""
+        if not self.config.prompt_cache:
+            return 0, []
+        text, breakpoint = _prompt_layout(body)
+        if model.startswith(PROMPT_CACHE_CONTROL_MODELS):
+            text = text[:breakpoint or 0]
+        digest = hashlib.sha256(model.encode('utf-8'))
+        keys = []
+        for start in range(0, len(text) - PREFIX_BLOCK_CHARS + 1, PREFIX_BLOCK_CHARS):
+            digest.update(text[start:start + PREFIX_BLOCK_CHARS].encode('utf-8'))
+            keys.append(digest.hexdigest())
+        with self._lock:
+            hit = max((blocks for blocks, key in enumerate(keys, 1) if key in self._prefixes), default=0)
+        cached = hit * PREFIX_BLOCK_CHARS
+        if cached < MIN_CACHED_CHARS:
+            return 0, keys
+        self._count('prompt_cache_hits')
+        return cached // CHARS_PER_TOKEN, keys
+
+    def _cache_prefixes(self, keys):
+        with self._lock:
+            for key in keys:
+                self._prefixes[key] = True
+                self._prefixes.move_to_end(key)
+            while len(self._prefixes) > MAX_CACHED_PREFIXES:
+                self._prefixes.popitem(last=False)
+
+    def _synthesize(self, body, rng):
+        partial = next((message.get('content') for message in reversed(body.get('messages') or ())
+                        if message.get('role') == 'assistant'), None)
+        if partial is not None:
+            self._count('continuations')
+            with self._lock:
+                content = self._truncated.pop(partial, partial)
+            return self._cut(body, content[len(partial):], partial)
+        schema = schema_for(body)
+        ideas = sorted({int(number) for number in _IDEA.findall(_prompt_text(body))}) or [1, 2, 3]
+        content = json.dumps(fake_value(schema, rng, ideas, self.config.answer_words), indent=2)
+        if not body.get('response_format') and rng.random() < 0.3:
+            # Models asked for JSON in the prompt alone often fence it
+            content = f"Here is my analysis:\n```json\n{content}\n```"
+        return self._cut(body, content)
+
+    def _cut(self, body, content, prefix=''):
+        """(content, finish_reason) with content cut off at the request's max_tokens"""
+        limit = body.get('max_tokens')
+        if not limit or len(content) <= limit * CHARS_PER_TOKEN:
+            return content, 'stop'
+        self._count('truncated')
+        head = content[:limit * CHARS_PER_TOKEN]
+        with self._lock:
+            self._truncated[prefix + head] = prefix + content
+            while len(self._truncated) > MAX_TRUNCATED:
+                self._truncated.popitem(last=False)
+        return head, 'length'
+
+    def _answer(self, handler, body, model, content, finish_reason, usage, ttft, generation, prefilled=None):
+        completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        time.sleep(ttft)
+        if prefilled is not None:
+            prefilled()
+        if not body.get('stream'):
+            time.sleep(generation)
+            return handler._json(200, {
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': finish_reason}],
+                'usage': usage,
+            })
+
+        def chunk(delta, reason=None):
+            return {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': reason}]}
+
+        step = CHUNK_TOKENS * CHARS_PER_TOKEN
+        pieces = [content[i:i + step] for i in range(0, len(content), step)] or ['']
+        pause = generation / len(pieces)
+        handler._start_events()
+        handler._event(chunk({'role': 'assistant', 'content': ''}))
+        for piece in pieces:
+            handler._event(chunk({'content': piece}))
+            time.sleep(pause)
+        handler._event(chunk({}, finish_reason))
+        if (body.get('stream_options') or {}).get('include_usage'):
+            handler._event({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                            'model': model, 'choices': [], 'usage': usage})
+        handler._event('[DONE]')
+        handler._end_events()
+
+    def _record(self, handler, body, raw, key):
+        url = f"{self.config.upstream.rstrip('/')}/chat/completions"
+        headers = {'Content-Type': 'application/json'}
+        if handler.headers.get('Authorization'):
+            headers['Authorization'] = handler.headers['Authorization']
+        started = time.monotonic()
+        first_token = None
+        parts = []
+        usage = None
+        finish_reason = None
+        if not body.get('stream'):
+            response = self._upstream.post(url, content=raw, headers=headers)
+            if response.status_code != 200:
+                return self._relay_error(handler, response)
+            payload = response.json()
+            first_token = time.monotonic()
+            choice = (payload.get('choices') or [{}])[0]
+            parts.append((choice.get('message') or {}).get('content') or '')
+            finish_reason = choice.get('finish_reason')
+            usage = payload.get('usage')
+            handler._json(200, payload)
+        else:
+            with self._upstream.stream('POST', url, content=raw, headers=headers) as response:
+                if response.status_code != 200:
+                    response.read()
+                    return self._relay_error(handler, response)
+                handler._start_events()
+                for line in response.iter_lines():
+                    handler._chunk((line + '\n').encode('utf-8'))
+                    if not line.startswith('data:') or line[5:].strip() == '[DONE]':
+                        continue
+                    try:
+                        event = json.loads(line[5:])
+                    except ValueError:
+                        continue
+                    usage = event.get('usage') or usage
+                    for choice in event.get('choices') or ():
+                        delta = (choice.get('delta') or {}).get('content')
+                        if delta:
+                            first_token = first_token or time.monotonic()
+                            parts.append(delta)
+                        finish_reason = choice.get('finish_reason') or finish_reason
+                handler._end_events()
+        finished = time.monotonic()
+        self.cassette.add({
+            'key': key,
+            'loose_key': loose_key(body),
+            'model': body.get('model'),
+            'content': ''.join(parts),
+            'finish_reason': finish_reason,
+            'usage': {name: (usage or {}).get(name) for name in ('prompt_tokens', 'completion_tokens')},
+            'ttft': round((first_token or finished) - started, 4),
+            'wall': round(finished - started, 4),
+            'recorded': time.time(),
+        })
+        self._count('recorded')
+
+    def _relay_error(self, handler, response):
+        self._count('upstream_errors')
+        headers = {name: response.headers[name] for name in ('retry-after', 'retry-after-ms')
+                   if name in response.headers}
+        try:
+            payload = response.json()
+        except ValueError:
+            payload = {'error': {'message': response.text[:500], 'code': response.status_code}}
+        handler._json(response.status_code, payload, headers)
+
+
+def config_arguments(parser):
+    """Add the MockConfig options to an argparse parser (shared with the benchmark CLI)"""
+    group = parser.add_argument_group('mock server')
+    group.add_argument('--ttft', default=MockConfig.ttft,
+                       help="time-to-first-token distribution, e.g. fixed:0.5, uniform:0.2,1.5, exp:0.7, "
+                            "lognormal:0.8,0.5 (default: %(default)s)")
+    group.add_argument('--model-ttft', action='append', default=[], metavar='MODEL=SPEC',
+                       help="latency distribution for one model (repeatable)")
+    group.add_argument('--tokens-per-second', type=float, default=MockConfig.tokens_per_second,
+                       help="completion speed once the first token is out (default: %(default)s)")
+    group.add_argument('--rate-limit-rate', type=float, default=0.0, help="share of requests answered with 429")
+    group.add_argument('--retry-after', type=float, default=MockConfig.retry_after,
+                       help="retry-after seconds sent with 429s (default: %(default)s)")
+    group.add_argument('--timeout-rate', type=float, default=0.0,
+                       help="share of requests that stall and then drop the connection")
+    group.add_argument('--stall-seconds', type=float, default=MockConfig.stall_seconds,
+                       help="how long stalled requests hang (default: %(default)s)")
+    group.add_argument('--malformed-rate', type=float, default=0.0,
+                       help=f"share of answers damaged ({', '.join(MALFORMED_KINDS)})")
+    group.add_argument('--seed', type=int, default=None, help="make latencies and faults reproducible")
+    group.add_argument('--record', metavar='CASSETTE',
+                       help="proxy to --upstream and append every answer to this JSONL cassette")
+    group.add_argument('--replay', metavar='CASSETTE', help="answer from this cassette")
+    group.add_argument('--replay-speed', type=float, default=1.0,
+                       help="multiply recorded timings by this; 0 replays instantly (default: %(default)s)")
+    group.add_argument('--replay-miss', choices=('error', 'synthetic'), default='error',
+                       help="what to do with requests not on the cassette (default: %(default)s)")
+    group.add_argument('--upstream', default=OPENROUTER_BASE_URL, help="API to record from (default: %(default)s)")
+    group.add_argument('--prefill-tokens-per-second', type=float, default=0.0,
+                       help="add uncached prompt tokens at this rate to the time to first token (default: off)")
+    group.add_argument('--no-prompt-cache', action='store_true', help="report no prompt tokens as cached")
+    return group
+
+
+def config_from_args(args):
+    """Build a MockConfig from arguments added by config_arguments()"""
+    if args.record and args.replay:
+        raise ValueError("--record and --replay are exclusive")
+    model_ttft = {}
+    for item in args.model_ttft:
+        model, sep, spec = item.partition('=')
+        if not sep:
+            raise ValueError(f"--model-ttft expects MODEL=SPEC, got {item!r}")
+        model_ttft[model] = spec
+    return MockConfig(
+        mode='record' if args.record else 'replay' if args.replay else 'synthetic',
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        model_ttft=model_ttft,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        timeout_rate=args.timeout_rate,
+        stall_seconds=args.stall_seconds,
+        malformed_rate=args.malformed_rate,
+        seed=args.seed,
+        cassette=args.record or args.replay,
+        upstream=args.upstream,
+        replay_speed=args.replay_speed,
+        replay_miss=args.replay_miss,
+        prompt_cache=not args.no_prompt_cache,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve an OpenAI-compatible mock of the chat completions API.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    config_arguments(parser)
+    args = parser.parse_args(argv)
+    try:
+        config = config_from_args(args)
+        server = MockServer(config, args.host, args.port)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Mock server ({config.mode}) listening on {server.url}")
+    print(json.dumps({name: value for name, value in asdict(config).items() if value not in (None, {}, 0.0)}))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.stats()))
+
+
+if __name__ == '__main__':
+    main()
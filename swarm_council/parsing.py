@@ -0,0 +1,102 @@
+"""Pulling the JSON payload out of model responses
+
+json_objects() scans a response once, letting json's C decoder (raw_decode)
+consume each complete object in place and skipping past it, so prose, code
+fences and stray braces around the payload cost nothing extra. Candidates are
+scored against the stage's schema and the best one wins.
+"""
+import json
+import re
+
+from .structured import SYNTHESIS_SCHEMA, coverage, validate
+
+SYNTHESIS_FIELDS = list(SYNTHESIS_SCHEMA['required'])
+
+# strict=False accepts raw newlines and tabs inside strings, which models emit often
+_decoder = json.JSONDecoder(strict=False)
+_TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+
+
+def _noop_log(message, log_type='info'):
+    pass
+
+
+def _noop_warn(message, raw=None):
+    pass
+
+
+def json_objects(text):
+    """Yield every top-level JSON object in `text`, left to right, in a single pass"""
+    idx = text.find('{')
+    while idx != -1:
+        try:
+            value, end = _decoder.raw_decode(text, idx)
+        except ValueError:
+            idx = text.find('{', idx + 1)
+            continue
+        if isinstance(value, dict):
+            yield value
+        idx = text.find('{', end)
+
+
+def _best(candidates, schema):
+    best, best_score = None, None
+    for candidate in candidates:
+        if schema is None:
+            score = (1, 0, len(candidate))
+        else:
+            score = (not validate(candidate, schema), coverage(candidate, schema), len(candidate))
+        if best_score is None or score > best_score:
+            best, best_score = candidate, score
+    if best is not None and schema is not None and not best_score[1]:
+        # Valid JSON, but nothing like what the stage asked for
+        return None
+    return best
+
+
+def extract_json(response, schema=None):
+    """The JSON object in `response` that best matches `schema`; None if there is none
+
+    Without a schema the largest object wins. Objects that only decode once
+    trailing commas are removed are accepted as well.
+    """
+    if not response:
+        return None
+    found = _best(json_objects(response), schema)
+    if found is None and _TRAILING_COMMA.search(response):
+        found = _best(json_objects(_TRAILING_COMMA.sub(r'\1', response)), schema)
+    return found
+
+
+def parse_synthesis(response, log=_noop_log, warn=_noop_warn):
+    """Extract the Stage 3 synthesis, falling back to a text-only synthesis
+
+    warn(message, raw) is called for problems the user should see, with the
+    raw response attached for debugging.
+    """
+    synthesis = extract_json(response, SYNTHESIS_SCHEMA)
+    if synthesis is not None:
+        log('JSON parsed successfully', 'info')
+    else:
+        # FALLBACK: Create synthesis from raw text response
+        log('JSON parsing failed, attempting text fallback...', 'info')
+        warn("⚠️ LLM did not return valid JSON. Creating synthesis from text response...", response)
+
+        # Create a basic synthesis from the text
+        synthesis = {
+            "clarifiedFocus": response[:500] if response else "Synthesis could not be generated",
+            "theoreticalFoundations": ["See raw response for details"],
+            "keyTensions": ["JSON parsing failed - review raw response"],
+            "criticalQuestions": ["Why did the LLM not return JSON?"],
+            "integratedPerspectives": "The LLM response was not in JSON format. Please review the raw response above for insights.",
+            "peerReviewInsights": "Could not extract structured insights",
+            "recommendedNextSteps": ["Review raw response", "Try running synthesis again", "Check if model supports JSON output"]
+        }
+        log('Created fallback synthesis from text', 'info')
+
+    missing_fields = [f for f in SYNTHESIS_FIELDS if f not in synthesis]
+    if missing_fields:
+        warn(f"⚠️ Synthesis missing fields: {', '.join(missing_fields)}")
+        log(f'Missing fields: {missing_fields}', 'error')
+
+    return synthesis
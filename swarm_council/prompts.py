@@ -0,0 +1,497 @@
+"""Prompt templates for the four council stages
+
+Idea and critique sections are rendered from memoized per-item fragments at a
+condensing level (0 = everything). fit_review_prompt() and
+fit_synthesis_prompt() pick the least condensed level whose prompt fits a
+model's input token budget, so prompt size stays bounded as the council grows.
+
+Stage 1 and Stage 2 send every agent the same system prompt and task, with
+the agent's own perspective (agent_prompt()) last. The shared part is then
+an identical prefix of all five requests, which providers can serve from
+their prompt caches after the first one.
+
+Debate rounds (see debate.py) send a running summary of fixed size and only
+the changes of the round before, so they do not grow as rounds add up.
+"""
+import json
+import threading
+
+from .config import DEBATE_IDEA_LEVEL
+from .tokens import count_tokens
+
+REVIEWER_SUFFIX = ' You are now acting as an anonymous peer reviewer.'
+
+EXPLORATION_SYSTEM_PROMPT = "You are one of several experts on a research council. Each expert explores the same topic from their own perspective, which is described at the end of the request."
+
+REVIEW_SYSTEM_PROMPT = "You are one of several experts on a research council, acting as an anonymous peer reviewer. Each expert reviews the same proposals from their own perspective, which is described at the end of the request."
+
+SYNTHESIS_SYSTEM_PROMPT = "You are a JSON-only response bot. You MUST output ONLY valid JSON with no other text, no markdown formatting, no explanations. Start with { and end with }. You synthesize research perspectives into structured JSON."
+
+PROPOSAL_SYSTEM_PROMPT = "You are a research proposal writer who creates concrete, feasible study designs."
+
+
+def agent_prompt(agent, reviewer=False):
+    """The agent's perspective, sent after the prompt every agent shares"""
+    return f"""YOUR PERSPECTIVE ({agent['name']}):
+{agent['system_prompt']}{REVIEWER_SUFFIX if reviewer else ''}"""
+
+
+def exploration_prompt(user_topic):
+    """Stage 1 prompt asking the agents to explore the topic, each from its perspective (see agent_prompt)"""
+    return f"""A researcher is interested in exploring this topic:
+
+"{user_topic}"
+
+From your perspective (described below), help them think through this topic by:
+1. Identifying the KEY CONCEPTS and theoretical frameworks that are relevant
+2. Highlighting what aspects are CLEAR vs. FUZZY/UNCLEAR and need more definition
+3. Suggesting important QUESTIONS they should consider
+4. Noting potential CHALLENGES or considerations from your lens
+
+Be concise but insightful. Format as JSON:
+{{
+  "keyConcepts": ["concept1", "concept2", "concept3"],
+  "theoreticalFrameworks": ["framework1", "framework2"],
+  "whatsClear": "brief statement of what seems well-defined",
+  "whatsFuzzy": "what needs clarification or further thought",
+  "importantQuestions": ["question1", "question2", "question3"],
+  "considerations": "key challenges or factors to consider from your perspective"
+}}"""
+
+
+def anonymize_ideas(explorations):
+    """Strip authorship from Stage 1 analyses, numbering ideas in exploration order
+
+    Partial analyses (see parsing.extract_json) get empty values for the
+    fields they are missing.
+    """
+    return [
+        {
+            'ideaNumber': idx + 1,
+            'keyConcepts': exp.get('keyConcepts', []),
+            'theoreticalFrameworks': exp.get('theoreticalFrameworks', []),
+            'whatsClear': exp.get('whatsClear', ''),
+            'whatsFuzzy': exp.get('whatsFuzzy', ''),
+            'importantQuestions': exp.get('importantQuestions', []),
+            'considerations': exp.get('considerations', '')
+        }
+        for idx, exp in enumerate(explorations)
+    ]
+
+
+IDEA_FIELDS = ['keyConcepts', 'theoreticalFrameworks', 'whatsClear', 'whatsFuzzy', 'importantQuestions',
+               'considerations']
+
+# Condensing steps for over-budget prompts, least to most aggressive.
+# Ideas: (max list items, max chars of prose, fields left out)
+IDEA_LEVELS = [
+    (None, None, ()),
+    (4, 300, ()),
+    (3, 160, ('whatsClear',)),
+    (2, 80, ('whatsClear', 'considerations')),
+]
+# Critiques: (max points per strengths/weaknesses/missing list, max chars per
+# point); 0 points drops the per-idea details, keeping ranking and commentary
+CRITIQUE_LEVELS = [
+    (None, None),
+    (2, 160),
+    (1, 100),
+    (0, 300),
+]
+# (idea level, critique level) pairs tried by fit_synthesis_prompt. Critiques
+# grow with reviewers x ideas, so they are condensed first.
+SYNTHESIS_COMPACTION_STEPS = [(0, 0), (0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (3, 3)]
+
+_FRAGMENT_CACHE_SIZE = 2048
+_fragments = {}
+_fragments_lock = threading.Lock()
+
+
+def _memoized(kind, content, level, render):
+    """render(content, level), cached on the content itself so equal data renders once"""
+    key = (kind, json.dumps(content, sort_keys=True, ensure_ascii=False, default=str), level)
+    with _fragments_lock:
+        text = _fragments.get(key)
+    if text is None:
+        text = render(content, level)
+        with _fragments_lock:
+            if len(_fragments) >= _FRAGMENT_CACHE_SIZE:
+                _fragments.clear()
+            _fragments[key] = text
+    return text
+
+
+def _clip(text, limit):
+    text = str(text)
+    if limit is None or len(text) <= limit:
+        return text
+    cut = text[:limit]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip(' ,;:.') + '…'
+
+
+def _points(values, max_items=None, limit=None):
+    values = list(values or [])
+    if max_items is not None:
+        values = values[:max_items]
+    return [_clip(value, limit) for value in values]
+
+
+def _render_idea(idea, level):
+    max_items, limit, dropped = IDEA_LEVELS[level]
+    lines = [
+        ('keyConcepts', f"- Key Concepts: {', '.join(_points(idea.get('keyConcepts'), max_items, limit))}"),
+        ('theoreticalFrameworks',
+         f"- Frameworks: {', '.join(_points(idea.get('theoreticalFrameworks'), max_items, limit))}"),
+        ('whatsClear', f"- What's Clear: {_clip(idea.get('whatsClear') or '', limit)}"),
+        ('whatsFuzzy', f"- What's Fuzzy: {_clip(idea.get('whatsFuzzy') or '', limit)}"),
+        ('importantQuestions',
+         f"- Important Questions: {'; '.join(_points(idea.get('importantQuestions'), max_items, limit))}"),
+        ('considerations', f"- Considerations: {_clip(idea.get('considerations') or '', limit)}"),
+    ]
+    return "\n".join(line for field, line in lines if field not in dropped)
+
+
+def idea_body(idea, level=0):
+    """The content of one Stage 1 analysis, without its author or number"""
+    return _memoized('idea', {field: idea.get(field) for field in IDEA_FIELDS}, level, _render_idea)
+
+
+def ideas_summary(anonymized_ideas, level=0):
+    return "\n\n".join(
+        f"IDEA #{idea['ideaNumber']}:\n{idea_body(idea, level)}" for idea in anonymized_ideas
+    )
+
+
+def _rank_instruction(idea_numbers):
+    idea_count = len(idea_numbers)
+    if list(idea_numbers) == list(range(1, idea_count + 1)):
+        return f"RANK all proposals from strongest (1) to weakest ({idea_count})"
+    return (f"RANK all {idea_count} proposals (numbers {', '.join(map(str, idea_numbers))}) "
+            f"from strongest to weakest")
+
+
+def _review_format(idea_numbers):
+    """The JSON layout of a review, with an example ranking of `idea_numbers`"""
+    example = list(idea_numbers)
+    for pos in range(1, len(example) - 1, 2):
+        example[pos], example[pos + 1] = example[pos + 1], example[pos]
+    return f"""{{
+  "reviews": [
+    {{
+      "ideaNumber": {example[0] if example else 1},
+      "strengths": ["strength1", "strength2"],
+      "weaknesses": ["weakness1", "weakness2"],
+      "missingElements": ["missing1", "missing2"]
+    }},
+    ... (one for each idea)
+  ],
+  "ranking": [{', '.join(map(str, example))}],
+  "overallCommentary": "brief synthesis of what patterns you see across proposals"
+}}"""
+
+
+def review_prompt(summary, idea_numbers):
+    """Stage 2 prompt asking a reviewer to critique and rank the anonymized ideas listed in `summary`"""
+    return f"""You are conducting an ANONYMOUS PEER REVIEW of research exploration proposals.
+
+Below are {len(idea_numbers)} different proposals exploring the same research topic. Your identity as a reviewer is anonymous, and you DO NOT know who created each proposal.
+
+YOUR TASK:
+1. For EACH proposal, identify:
+   - Key STRENGTHS (what's valuable/insightful)
+   - WEAKNESSES or gaps (what's missing/unclear)
+   - MISSING ELEMENTS (what should be added)
+
+2. {_rank_instruction(idea_numbers)}
+
+Be objective and constructive. Focus on the quality of ideas, not the author.
+
+PROPOSALS TO REVIEW:
+{summary}
+
+Format your review as JSON:
+{_review_format(idea_numbers)}
+
+The ranking array should list idea numbers from strongest to weakest."""
+
+
+def original_ideas(explorations, level=0):
+    return "\n\n".join(
+        f"{exp['agentName']} ({exp['icon']}):\n{idea_body(exp, level)}" for exp in explorations
+    )
+
+
+def _render_critique(review, level):
+    max_items, limit = CRITIQUE_LEVELS[level]
+    ranking = ', '.join(f"Idea #{i}" for i in review.get('ranking') or [])
+    critique = f"""{review['reviewerName']} ({review['icon']}) - Peer Review:
+Overall Commentary: {_clip(review.get('overallCommentary', ''), limit if max_items == 0 else None)}
+Ranking (strongest to weakest): {ranking}"""
+    if max_items == 0:
+        return critique
+
+    detailed_reviews = []
+    for r in review.get('reviews') or []:
+        detailed = f"  Idea #{r.get('ideaNumber')}:"
+        detailed += f"\n    ✓ Strengths: {'; '.join(_points(r.get('strengths'), max_items, limit))}"
+        detailed += f"\n    ✗ Weaknesses: {'; '.join(_points(r.get('weaknesses'), max_items, limit))}"
+        detailed += f"\n    + Missing: {'; '.join(_points(r.get('missingElements'), max_items, limit))}"
+        detailed_reviews.append(detailed)
+    return f"""{critique}
+
+Detailed Reviews:
+{chr(10).join(detailed_reviews)}"""
+
+
+def peer_critiques(reviews, level=0):
+    fields = ('reviewerName', 'icon', 'ranking', 'overallCommentary', 'reviews')
+    return "\n\n".join(
+        _memoized('critique', {field: review.get(field) for field in fields}, level, _render_critique)
+        for review in reviews
+    )
+
+
+def consensus_summary(consensus, explorations):
+    """One line per idea in consensus order, for the synthesis prompt"""
+    lines = []
+    for idea in consensus['ideas']:
+        exp = explorations[idea['ideaNumber'] - 1]
+        lines.append(f"{idea['rank']}. Idea #{idea['ideaNumber']} ({exp['agentName']}) - "
+                     f"reviewer agreement {idea['confidence']:.0%}")
+    return "\n".join(lines)
+
+
+def review_coverage(idea_count, reviews):
+    """How the synthesis prompt describes its sources: how many ideas, and who reviewed which
+
+    Returns the ORIGINAL IDEAS and PEER REVIEW CRITIQUES lines. With sparse
+    review each reviewer saw only a subset, and after a quorum some experts'
+    reviews are missing; the synthesizer should not be told otherwise.
+    """
+    ideas = f"ORIGINAL IDEAS from {idea_count} different expert perspectives"
+    seen = [len(review.get('assignedIdeas') or range(idea_count)) for review in reviews]
+    if all(count >= idea_count for count in seen):
+        who = 'each expert' if len(reviews) >= idea_count else f"{len(reviews)} of the {idea_count} experts each"
+        return ideas, f"PEER REVIEW CRITIQUES where {who} anonymously reviewed ALL ideas"
+    subset = str(min(seen)) if min(seen) == max(seen) else f"{min(seen)}-{max(seen)}"
+    return ideas, (f"PEER REVIEW CRITIQUES from {len(reviews)} experts, each of whom anonymously reviewed only "
+                   f"{subset} of the ideas; how often an idea is discussed reflects the review assignment, "
+                   f"not its merit")
+
+
+def synthesis_prompt(user_topic, original, critiques, consensus='', sources=None):
+    """Stage 3 prompt combining the original ideas with every peer critique
+
+    sources are review_coverage()'s two lines describing the ideas and critiques.
+    """
+    ideas, reviewed = sources or ("ORIGINAL IDEAS from different expert perspectives",
+                                  "PEER REVIEW CRITIQUES where experts anonymously reviewed the ideas")
+    if consensus:
+        # Ideas are numbered in the order of ORIGINAL IDEAS
+        critiques = f"""{critiques}
+
+PEER CONSENSUS RANKING (all reviewers' rankings combined; ideas numbered in the order of ORIGINAL IDEAS):
+{consensus}"""
+    return f"""A researcher asked about: "{user_topic}"
+
+You have access to:
+1. {ideas}
+2. {reviewed}
+
+YOUR TASK - Create a SUPERIOR SYNTHESIS that:
+- Integrates the BEST ELEMENTS from multiple original proposals
+- Addresses WEAKNESSES identified in peer reviews
+- Combines COMPLEMENTARY INSIGHTS across perspectives
+- Fills in MISSING ELEMENTS noted by reviewers
+
+ORIGINAL IDEAS:
+{original}
+
+PEER REVIEW CRITIQUES:
+{critiques}
+
+CRITICAL: You MUST respond with ONLY a valid JSON object. No explanations, no markdown, no text before or after. Start your response with {{ and end with }}.
+
+Respond with this exact JSON structure (fill in the values):
+{{
+  "clarifiedFocus": "your refined understanding here",
+  "theoreticalFoundations": ["framework1", "framework2", "framework3"],
+  "keyTensions": ["tension1", "tension2"],
+  "criticalQuestions": ["question1", "question2", "question3"],
+  "integratedPerspectives": "how perspectives complement each other",
+  "peerReviewInsights": "key insights from peer review",
+  "recommendedNextSteps": ["step1", "step2", "step3"]
+}}"""
+
+
+def fit_review_prompt(anonymized_ideas, budget, system_prompt=''):
+    """Stage 2 prompt condensed until it fits `budget` tokens together with system_prompt
+
+    system_prompt stands for everything sent besides the prompt, the agent's
+    perspective included. Returns (prompt, level, tokens); level 0 means
+    nothing was condensed. If even the most condensed prompt is over budget,
+    that one is returned.
+    """
+    system_tokens = count_tokens(system_prompt)
+    idea_numbers = [idea['ideaNumber'] for idea in anonymized_ideas]
+    for level in range(len(IDEA_LEVELS)):
+        prompt = review_prompt(ideas_summary(anonymized_ideas, level), idea_numbers)
+        tokens = system_tokens + count_tokens(prompt)
+        if tokens <= budget:
+            break
+    return prompt, level, tokens
+
+
+def fit_synthesis_prompt(user_topic, explorations, reviews, budget, system_prompt=SYNTHESIS_SYSTEM_PROMPT,
+                         consensus=None):
+    """Stage 3 prompt condensed until it fits `budget` tokens together with system_prompt
+
+    consensus (see ranking.consensus_ranking) is summarized after the
+    critiques. Returns (prompt, (idea level, critique level), tokens).
+    """
+    system_tokens = count_tokens(system_prompt)
+    ranking = consensus_summary(consensus, explorations) if consensus else ''
+    sources = review_coverage(len(explorations), reviews)
+    for levels in SYNTHESIS_COMPACTION_STEPS:
+        idea_level, critique_level = levels
+        prompt = synthesis_prompt(user_topic, original_ideas(explorations, idea_level),
+                                  peer_critiques(reviews, critique_level), ranking, sources)
+        tokens = system_tokens + count_tokens(prompt)
+        if tokens <= budget:
+            break
+    return prompt, levels, tokens
+
+
+def refinement_prompt(user_topic, synthesis, critiques):
+    """Stage 3 follow-up folding peer reviews that arrived after synthesis started"""
+    return f"""A researcher asked about: "{user_topic}"
+
+You already wrote this SYNTHESIS of the experts' ideas and peer reviews:
+{json.dumps(synthesis, indent=2, ensure_ascii=False)}
+
+Since then, these ADDITIONAL PEER REVIEW CRITIQUES have come in:
+{critiques}
+
+YOUR TASK - Revise the synthesis so it also reflects the additional critiques:
+- Keep what still holds; change only what the new critiques give reason to change
+- Address any new WEAKNESSES and fill in any new MISSING ELEMENTS
+- Update "peerReviewInsights" to cover all reviews
+
+CRITICAL: You MUST respond with ONLY a valid JSON object with exactly the same keys as the synthesis above. No explanations, no markdown, no text before or after. Start your response with {{ and end with }}."""
+
+
+POINT_MARKS = {'strengths': '✓', 'weaknesses': '✗', 'missingElements': '+'}
+
+
+def debate_summary(user_topic, anonymized_ideas, consensus, synthesis, level=DEBATE_IDEA_LEVEL):
+    """The running summary every debate round starts from: condensed ideas, consensus ranking, synthesis
+
+    Its size depends on the council, not on how many rounds came before.
+    Authors are not named, so reviewers stay anonymous.
+    """
+    standing = "\n".join(f"{idea['rank']}. Idea #{idea['ideaNumber']} - reviewer agreement {idea['confidence']:.0%}"
+                          for idea in consensus['ideas'])
+    return f"""RESEARCH TOPIC: "{user_topic}"
+
+PROPOSALS (condensed):
+{ideas_summary(anonymized_ideas, level)}
+
+CURRENT CONSENSUS RANKING (strongest first):
+{standing}
+
+CURRENT SYNTHESIS:
+- Focus: {_clip(synthesis.get('clarifiedFocus', ''), 400)}
+- Key Tensions: {'; '.join(_points(synthesis.get('keyTensions'), 4, 160))}
+- Critical Questions: {'; '.join(_points(synthesis.get('criticalQuestions'), 4, 160))}
+- Next Steps: {'; '.join(_points(synthesis.get('recommendedNextSteps'), 4, 160))}"""
+
+
+def debate_changes(moves, points, revised=(), names=None):
+    """What changed in the last round: ranking moves, new critique points and revised synthesis fields
+
+    names (idea number -> author) labels the ideas for the synthesizer;
+    reviewers get the numbers only.
+    """
+    def label(number):
+        return f"Idea #{number}" + (f" ({names[number]})" if names and number in names else '')
+
+    ranking = '; '.join(f"{label(move['ideaNumber'])} {move['from']} → {move['to']}" for move in moves)
+    lines = [f"Ranking moves: {ranking or 'none'}"]
+    if revised:
+        lines.append(f"Synthesis fields revised: {', '.join(revised)}")
+    if points:
+        lines.append("New critique points (✓ strength, ✗ weakness, + missing):")
+        current = None
+        for point in points:
+            if point['ideaNumber'] != current:
+                current = point['ideaNumber']
+                lines.append(f"{label(current)}:")
+            lines.append(f"  {POINT_MARKS.get(point['kind'], '-')} {_clip(point['text'], 200)}")
+    else:
+        lines.append("New critique points: none")
+    return "\n".join(lines)
+
+
+def debate_review_prompt(summary, changes, idea_numbers, round_number):
+    """Debate round prompt: respond to the last round's changes and rank the ideas again"""
+    return f"""You are taking part in round {round_number} of an ANONYMOUS DEBATE about research exploration proposals. The proposals, the reviewers' consensus ranking and the synthesis written from their reviews are summarized below, followed by what changed in the previous round.
+
+{summary}
+
+CHANGES IN THE PREVIOUS ROUND:
+{changes}
+
+YOUR TASK:
+1. Weigh the changes: do the new points hold, and does the ranking reflect the proposals' merits?
+2. For each proposal, list ONLY strengths, weaknesses and missing elements that appear NOWHERE above. Leave a list empty when you have nothing new; never repeat a point.
+3. {_rank_instruction(idea_numbers)}
+4. In "overallCommentary", say briefly what changed your mind, if anything.
+
+Be objective and constructive. Focus on the quality of ideas, not the author.
+
+Format your review as JSON:
+{_review_format(idea_numbers)}
+
+The ranking array should list idea numbers from strongest to weakest."""
+
+
+def debate_revision_prompt(user_topic, synthesis, changes, round_number):
+    """Debate round follow-up revising the synthesis with the round's changes only"""
+    return f"""A researcher asked about: "{user_topic}"
+
+You already wrote this SYNTHESIS of the experts' ideas and peer reviews:
+{json.dumps(synthesis, indent=2, ensure_ascii=False)}
+
+The experts have since debated the ideas for round {round_number}. These are the CHANGES from that round:
+{changes}
+
+YOUR TASK - Revise the synthesis so it reflects the changes:
+- Keep what still holds; change only what the changes give reason to change
+- Address any new WEAKNESSES and fill in any new MISSING ELEMENTS
+- Give ideas that moved up more weight, and ideas that moved down less
+- Update "peerReviewInsights" to say what the debate changed
+
+CRITICAL: You MUST respond with ONLY a valid JSON object with exactly the same keys as the synthesis above. No explanations, no markdown, no text before or after. Start your response with {{ and end with }}."""
+
+
+def proposal_prompt(user_topic, synthesis):
+    """Stage 4 prompt turning the synthesis into a concrete study design; missing fields are left empty"""
+    return f"""Based on the researcher's interest in: "{user_topic}"
+
+And the synthesized exploration showing:
+- Clarified Focus: {synthesis.get('clarifiedFocus', '')}
+- Theoretical Foundations: {', '.join(_points(synthesis.get('theoreticalFoundations')))}
+- Key Tensions: {'; '.join(_points(synthesis.get('keyTensions')))}
+- Critical Questions: {'; '.join(_points(synthesis.get('criticalQuestions')))}
+
+Generate a concrete research proposal. Format as JSON:
+{{
+  "title": "proposed study title",
+  "researchQuestion": "specific, answerable research question",
+  "background": "brief background explaining the gap this addresses",
+  "methodology": "proposed research design and methods",
+  "expectedContribution": "what this will add to the field",
+  "feasibilityNotes": "practical considerations for implementation"
+}}"""
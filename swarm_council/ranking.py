@@ -0,0 +1,235 @@
+"""Sparse peer-review assignments and rank aggregation
+
+With many agents, having every reviewer critique every idea costs
+reviewers x ideas in tokens. review_assignments() instead gives each reviewer
+a subset of k ideas, chosen as a covering design so that every pair of ideas
+is ranked side by side by at least one reviewer (when there are enough
+reviewers) and every idea is reviewed about equally often.
+
+aggregate_rankings() combines the resulting partial rankings into one
+consensus: Borda scores normalized per reviewer, Bradley-Terry strengths fit
+by minorization-maximization on the pairwise win matrix, and an approximate
+Kemeny ranking found by local Kemenization of the Bradley-Terry order. Each
+idea's confidence is the share of reviewer judgments involving it that agree
+with its consensus position.
+"""
+import math
+import random
+
+import numpy as np
+
+from .config import SPARSE_REVIEW_MIN_IDEAS, SPARSE_REVIEW_SIZE
+
+
+def _subset_size(n_ideas, n_reviewers, size):
+    """Smallest subset size >= `size` for which n_reviewers subsets can cover every pair"""
+    pairs = n_ideas * (n_ideas - 1)
+    k = size
+    while k < n_ideas and n_reviewers * k * (k - 1) < pairs:
+        k += 1
+    return min(k, n_ideas)
+
+
+def _greedy_cover(n_ideas, n_reviewers, k, rng):
+    covered = np.eye(n_ideas, dtype=bool)
+    load = np.zeros(n_ideas)
+    subsets = []
+    for _ in range(n_reviewers):
+        # Start from the least-reviewed idea, then keep adding the idea that
+        # covers the most new pairs (least-reviewed first on ties)
+        jitter = np.array([rng.random() for _ in range(n_ideas)]) * 1e-3
+        chosen = [int(np.argmin(load + jitter))]
+        available = np.ones(n_ideas, dtype=bool)
+        available[chosen[0]] = False
+        while len(chosen) < k:
+            gain = (~covered[:, chosen]).sum(axis=1).astype(float)
+            score = np.where(available, gain * n_ideas - load + jitter, -np.inf)
+            pick = int(np.argmax(score))
+            chosen.append(pick)
+            available[pick] = False
+        idx = np.array(chosen)
+        covered[np.ix_(idx, idx)] = True
+        load[idx] += 1
+        subsets.append(sorted(chosen))
+    return subsets, covered
+
+
+def review_assignments(n_ideas, n_reviewers, size=SPARSE_REVIEW_SIZE, min_ideas=SPARSE_REVIEW_MIN_IDEAS,
+                       rng=None):
+    """Idea indices (0-based) each reviewer should see, and the share of idea pairs covered
+
+    Councils with fewer than `min_ideas` ideas keep the dense design where
+    everyone reviews everything. Otherwise the subset size starts at `size`
+    and grows only as far as needed for every pair to be comparable.
+    """
+    if n_ideas < max(min_ideas, 2) or n_reviewers == 0:
+        return [list(range(n_ideas)) for _ in range(n_reviewers)], 1.0
+
+    rng = rng or random.Random()
+    k = _subset_size(n_ideas, n_reviewers, size)
+    while True:
+        subsets, covered = _greedy_cover(n_ideas, n_reviewers, k, rng)
+        if covered.all() or k == n_ideas:
+            break
+        k += 1
+    coverage = (covered.sum() - n_ideas) / (n_ideas * (n_ideas - 1))
+    return subsets, float(coverage)
+
+
+def clean_ranking(ranking, allowed):
+    """Idea numbers from a model's ranking that are in `allowed`, de-duplicated, in order"""
+    allowed = set(allowed)
+    seen = []
+    for value in ranking or []:
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            continue
+        if number in allowed and number not in seen:
+            seen.append(number)
+    return seen
+
+
+def win_matrix(rankings, n_ideas):
+    """W[i, j] = number of rankings that put idea i above idea j (0-based indices)"""
+    wins = np.zeros((n_ideas, n_ideas))
+    for ranking in rankings:
+        if len(ranking) < 2:
+            continue
+        order = np.asarray(ranking)
+        above, below = np.triu_indices(len(order), 1)
+        np.add.at(wins, (order[above], order[below]), 1)
+    return wins
+
+
+def borda_scores(rankings, n_ideas):
+    """Mean normalized Borda score per idea (1 = always ranked first); NaN if never ranked"""
+    totals = np.zeros(n_ideas)
+    counts = np.zeros(n_ideas)
+    for ranking in rankings:
+        m = len(ranking)
+        if m < 2:
+            continue
+        order = np.asarray(ranking)
+        np.add.at(totals, order, (m - 1 - np.arange(m)) / (m - 1))
+        np.add.at(counts, order, 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+
+def bradley_terry(wins, iterations=500, tol=1e-9, prior=0.1):
+    """Bradley-Terry strengths (summing to 1) from a win matrix, by MM iteration
+
+    A small symmetric prior keeps ideas that never won (or never lost) finite.
+    """
+    n = wins.shape[0]
+    w = wins + prior * (1 - np.eye(n))
+    games = w + w.T
+    total_wins = w.sum(axis=1)
+    strength = np.full(n, 1.0 / n)
+    for _ in range(iterations):
+        denom = (games / (strength[:, None] + strength[None, :])).sum(axis=1)
+        updated = total_wins / denom
+        updated /= updated.sum()
+        if np.abs(updated - strength).max() < tol:
+            strength = updated
+            break
+        strength = updated
+    return strength
+
+
+def local_kemeny(order, wins, max_passes=None):
+    """Adjacent-swap local search (local Kemenization) from an initial order
+
+    Swaps neighbours while more reviewers prefer the lower one, which never
+    increases the number of pairwise disagreements with the reviewers.
+    """
+    order = list(order)
+    passes = max_passes or len(order) ** 2
+    for _ in range(passes):
+        swapped = False
+        for pos in range(len(order) - 1):
+            a, b = order[pos], order[pos + 1]
+            if wins[b, a] > wins[a, b]:
+                order[pos], order[pos + 1] = b, a
+                swapped = True
+        if not swapped:
+            break
+    return order
+
+
+def kemeny_disagreements(order, wins):
+    position = np.empty(len(order), dtype=int)
+    position[np.asarray(order)] = np.arange(len(order))
+    above = position[:, None] < position[None, :]
+    # Disagreement: i placed above j but a reviewer put j above i
+    return float((wins.T * above).sum())
+
+
+def aggregate_rankings(rankings, n_ideas):
+    """Consensus over partial rankings of 0-based idea indices (best first)
+
+    Returns a dict with the consensus `order` (0-based indices, best first),
+    per-idea arrays `borda`, `bradley_terry`, `confidence` and `comparisons`,
+    the `wins` matrix and the order's number of `disagreements` with it.
+    """
+    wins = win_matrix(rankings, n_ideas)
+    borda = borda_scores(rankings, n_ideas)
+    strength = bradley_terry(wins)
+    # Seed with Bradley-Terry, Borda breaking ties, then locally Kemenize
+    seed = sorted(range(n_ideas), key=lambda i: (-strength[i], -np.nan_to_num(borda[i], nan=-1.0), i))
+    order = local_kemeny(seed, wins)
+
+    position = np.empty(n_ideas, dtype=int)
+    position[np.asarray(order, dtype=int)] = np.arange(n_ideas)
+    above = position[:, None] < position[None, :]
+    agree = (wins * above).sum(axis=1) + (wins.T * above.T).sum(axis=1)
+    comparisons = (wins + wins.T).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        confidence = np.where(comparisons > 0, agree / np.maximum(comparisons, 1), 0.0)
+    return {
+        'order': order,
+        'borda': borda,
+        'bradley_terry': strength,
+        'confidence': confidence,
+        'comparisons': comparisons.astype(int),
+        'disagreements': kemeny_disagreements(order, wins),
+        'wins': wins,
+    }
+
+
+def consensus_ranking(explorations, reviews):
+    """Combine every reviewer's ranking into one Consensus for the council's ideas
+
+    Idea numbers follow exploration order (see prompts.anonymize_ideas).
+    """
+    n_ideas = len(explorations)
+    rankings = []
+    for review in reviews:
+        allowed = review.get('assignedIdeas') or range(1, n_ideas + 1)
+        ranking = clean_ranking(review.get('ranking'), allowed)
+        rankings.append([number - 1 for number in ranking])
+    result = aggregate_rankings(rankings, n_ideas)
+
+    compared = result['wins'] + result['wins'].T
+    pairs_seen = (compared > 0).sum()
+    total_pairs = n_ideas * (n_ideas - 1)
+    ideas = []
+    for rank, idx in enumerate(result['order'], 1):
+        borda = result['borda'][idx]
+        ideas.append({
+            'ideaNumber': idx + 1,
+            'agentName': explorations[idx].get('agentName', ''),
+            'icon': explorations[idx].get('icon', ''),
+            'rank': rank,
+            'borda': None if math.isnan(borda) else round(float(borda), 3),
+            'bradleyTerry': round(float(result['bradley_terry'][idx]), 4),
+            'confidence': round(float(result['confidence'][idx]), 3),
+            'comparisons': int(result['comparisons'][idx]),
+        })
+    return {
+        'ranking': [idea['ideaNumber'] for idea in ideas],
+        'ideas': ideas,
+        'reviewers': sum(1 for ranking in rankings if len(ranking) >= 2),
+        'pairCoverage': round(float(pairs_seen) / total_pairs, 3) if total_pairs else 1.0,
+    }
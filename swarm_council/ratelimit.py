@@ -0,0 +1,320 @@
+"""Client-side rate limiting and retries for model calls
+
+Every call goes through the process-wide RateLimitScheduler, which
+  - paces requests and tokens with per-model and per-provider token buckets
+    (requests/min and tokens/min),
+  - bounds in-flight calls per model with an adaptive limit that halves on a
+    429 and creeps back up on success; a streamed call holds its slot until
+    its body has been read or closed,
+  - reads rate-limit headers when the API sends them (pausing a bucket until
+    the advertised reset once it is exhausted), and
+  - retries rate-limited and transient failures with exponential backoff plus
+    full jitter, honouring Retry-After.
+
+Rate limits belong to an account, so all of the above is kept per API key
+(by its fingerprint): one user's 429s do not slow down another user's key.
+Concurrent stages and batch runs therefore queue briefly instead of losing
+agents to 429s.
+"""
+import random
+import re
+import threading
+import time
+
+import openai
+
+from .config import (DEFAULT_RATE_LIMIT, MODEL_RATE_LIMITS, PROVIDER_RATE_LIMITS, RETRY_BASE_DELAY,
+                     RETRY_MAX_ATTEMPTS, RETRY_MAX_DELAY)
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                    openai.InternalServerError)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def provider_of(model):
+    return model.split('/', 1)[0]
+
+
+def _noop_log(message, log_type='info'):
+    pass
+
+
+class TokenBucket:
+    """Refills `rate_per_min` units per minute up to one minute's worth
+
+    consume() may drive the level negative, which is how usage that is only
+    known after a call (completion tokens) is charged.
+    """
+
+    def __init__(self, rate_per_min):
+        self.rate_per_min = rate_per_min
+        self.level = float(rate_per_min)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.rate_per_min, self.level + (now - self._updated) * self.rate_per_min / 60.0)
+        self._updated = now
+
+    def reserve(self, amount):
+        """Take `amount` units now if possible, else return the seconds to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            self._refill(now)
+            # Requests larger than a full bucket go through once it is full
+            needed = min(amount, self.rate_per_min)
+            if self.level >= needed:
+                self.level -= amount
+                return 0.0
+            return (needed - self.level) * 60.0 / self.rate_per_min
+
+    def consume(self, amount):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= amount
+
+    def set_rate(self, rate_per_min):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate_per_min = rate_per_min
+            self.level = min(self.level, rate_per_min)
+
+    def block_for(self, seconds):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+
+class AdaptiveLimit:
+    """Concurrency limit that halves on rate limiting and grows back additively"""
+
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / max(1.0, self.limit))
+            self._cond.notify_all()
+
+
+def parse_reset(value, now=None):
+    """Seconds until a rate-limit reset given as epoch ms/s, seconds, or a duration like '6m0s'"""
+    if value is None:
+        return None
+    now = time.time() if now is None else now
+    value = str(value).strip()
+    try:
+        number = float(value)
+    except ValueError:
+        parts = _DURATION_PART.findall(value)
+        if not parts:
+            return None
+        return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+    if number > 1e12:
+        return max(0.0, number / 1000.0 - now)
+    if number > 1e9:
+        return max(0.0, number - now)
+    return max(0.0, number)
+
+
+def retry_after(headers):
+    """Delay the server asked for, in seconds, if any"""
+    if not headers:
+        return None
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000.0
+        except ValueError:
+            pass
+    return parse_reset(headers.get('retry-after'))
+
+
+class _Limits:
+    def __init__(self, settings):
+        self.requests = TokenBucket(settings['rpm'])
+        self.tokens = TokenBucket(settings['tpm'])
+
+
+class RateLimitScheduler:
+    """Paces, bounds and retries model calls per account and model / provider
+
+    `account` identifies whose limits apply (see clients.key_fingerprint);
+    calls without one share a single anonymous account.
+    """
+
+    def __init__(self, max_attempts=RETRY_MAX_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 rng=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+        self.throttled = 0
+        self.retries = 0
+        self._models = {}
+        self._providers = {}
+        self._concurrency = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, model, account=None):
+        model_key = (account, model)
+        provider_key = (account, provider_of(model))
+        with self._lock:
+            if model_key not in self._models:
+                settings = {**DEFAULT_RATE_LIMIT, **MODEL_RATE_LIMITS.get(model, {})}
+                self._models[model_key] = _Limits(settings)
+                self._concurrency[model_key] = AdaptiveLimit(settings['concurrency'])
+            if provider_key not in self._providers:
+                self._providers[provider_key] = _Limits(
+                    {**DEFAULT_RATE_LIMIT, **PROVIDER_RATE_LIMITS.get(provider_key[1], {})})
+            return self._models[model_key], self._providers[provider_key], self._concurrency[model_key]
+
+    def _wait_for_capacity(self, buckets_and_amounts):
+        while True:
+            waits = [bucket.reserve(amount) for bucket, amount in buckets_and_amounts]
+            if not any(waits):
+                return
+            # Give back whatever was taken so nothing is double-charged while sleeping
+            for (bucket, amount), wait in zip(buckets_and_amounts, waits):
+                if not wait:
+                    bucket.consume(-amount)
+            time.sleep(min(max(waits), 5.0))
+
+    def observe_headers(self, model, headers, account=None):
+        """Adopt limits the API advertises and pause buckets that are exhausted"""
+        if not headers:
+            return
+        model_limits, _, _ = self._limits_for(model, account)
+        limit = headers.get('x-ratelimit-limit-requests') or headers.get('x-ratelimit-limit')
+        remaining = headers.get('x-ratelimit-remaining-requests') or headers.get('x-ratelimit-remaining')
+        reset = headers.get('x-ratelimit-reset-requests') or headers.get('x-ratelimit-reset')
+        try:
+            if limit is not None and float(limit) > 0:
+                model_limits.requests.set_rate(float(limit))
+            if remaining is not None and float(remaining) <= 0:
+                wait = parse_reset(reset)
+                if wait:
+                    model_limits.requests.block_for(wait)
+        except ValueError:
+            pass
+        token_limit = headers.get('x-ratelimit-limit-tokens')
+        token_remaining = headers.get('x-ratelimit-remaining-tokens')
+        try:
+            if token_limit is not None and float(token_limit) > 0:
+                model_limits.tokens.set_rate(float(token_limit))
+            if token_remaining is not None and float(token_remaining) <= 0:
+                wait = parse_reset(headers.get('x-ratelimit-reset-tokens'))
+                if wait:
+                    model_limits.tokens.block_for(wait)
+        except ValueError:
+            pass
+
+    def backoff(self, attempt, server_delay=None):
+        """Exponential backoff with full jitter, never shorter than what the server asked for"""
+        delay = self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if server_delay:
+            delay = max(delay, min(server_delay, self.max_delay * 4))
+        return delay
+
+    def call(self, model, prompt_tokens, request, agent_name='', log=_noop_log, account=None):
+        """Run request() -> raw response under the limits for `model`, retrying throttled attempts
+
+        prompt_tokens is an estimate charged up front; charge completion tokens
+        afterwards with record_completion().
+        """
+        raw, concurrency = self._send(model, prompt_tokens, request, agent_name, log, account)
+        concurrency.release()
+        return raw
+
+    def stream(self, model, prompt_tokens, request, agent_name='', log=_noop_log, account=None):
+        """Like call() for a streaming request; yields the chunks of raw.parse()
+
+        request() returns once the response headers are in, but the body is
+        what the concurrency limit is meant to bound, so the slot is held
+        until the stream is exhausted or the generator is closed.
+        """
+        raw, concurrency = self._send(model, prompt_tokens, request, agent_name, log, account)
+        stream = None
+        try:
+            stream = raw.parse()
+            yield from stream
+        finally:
+            if stream is not None:
+                stream.close()
+            concurrency.release()
+
+    def _send(self, model, prompt_tokens, request, agent_name, log, account):
+        """(raw response, concurrency limit whose slot the caller must release)"""
+        model_limits, provider_limits, concurrency = self._limits_for(model, account)
+        attempt = 0
+        while True:
+            self._wait_for_capacity([
+                (model_limits.requests, 1), (provider_limits.requests, 1),
+                (model_limits.tokens, prompt_tokens), (provider_limits.tokens, prompt_tokens),
+            ])
+            concurrency.acquire()
+            try:
+                raw = request()
+                self.observe_headers(model, getattr(raw, 'headers', None), account)
+                return raw, concurrency
+            except RETRYABLE_ERRORS as e:
+                headers = getattr(getattr(e, 'response', None), 'headers', None)
+                throttled = isinstance(e, openai.RateLimitError)
+                concurrency.release(throttled)
+                attempt += 1
+                # Counted from every caller's thread
+                with self._lock:
+                    if throttled:
+                        self.throttled += 1
+                    if attempt < self.max_attempts:
+                        self.retries += 1
+                if throttled:
+                    self.observe_headers(model, headers, account)
+                if attempt >= self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, retry_after(headers))
+                if throttled:
+                    # Everyone calling this model on this account waits, not just this caller
+                    model_limits.requests.block_for(delay)
+                reason = "Rate limited" if throttled else f"{type(e).__name__}"
+                log(f"{reason} on {model} ({agent_name}); retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{self.max_attempts})", 'progress')
+            except BaseException:
+                concurrency.release()
+                raise
+            time.sleep(delay)
+
+    def record_completion(self, model, completion_tokens, account=None):
+        model_limits, provider_limits, _ = self._limits_for(model, account)
+        model_limits.tokens.consume(completion_tokens)
+        provider_limits.tokens.consume(completion_tokens)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Return the process-wide scheduler shared by every session and batch job"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RateLimitScheduler()
+    return _scheduler
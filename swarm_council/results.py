@@ -0,0 +1,169 @@
+"""Typed results and progress events produced by the council engine
+
+Stage results stay plain dicts (they are stored in session state and rendered
+directly), described here as TypedDicts so callers know their shape.
+"""
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, TypedDict
+
+
+class Exploration(TypedDict, total=False):
+    """One agent's Stage 1 analysis"""
+    agentId: str
+    agentName: str
+    icon: str
+    model: str
+    keyConcepts: List[str]
+    theoreticalFrameworks: List[str]
+    whatsClear: str
+    whatsFuzzy: str
+    importantQuestions: List[str]
+    considerations: str
+
+
+class IdeaReview(TypedDict, total=False):
+    ideaNumber: int
+    strengths: List[str]
+    weaknesses: List[str]
+    missingElements: List[str]
+
+
+class PeerReview(TypedDict, total=False):
+    """One reviewer's Stage 2 critique of every idea"""
+    reviewerId: str
+    reviewerName: str
+    icon: str
+    model: str
+    reviews: List[IdeaReview]
+    ranking: List[int]
+    assignedIdeas: List[int]
+    overallCommentary: str
+
+
+class IdeaConsensus(TypedDict, total=False):
+    ideaNumber: int
+    agentName: str
+    icon: str
+    rank: int
+    borda: Optional[float]
+    bradleyTerry: float
+    confidence: float
+    comparisons: int
+
+
+class Consensus(TypedDict, total=False):
+    """Every reviewer's ranking combined (see ranking.consensus_ranking)"""
+    ranking: List[int]
+    ideas: List[IdeaConsensus]
+    reviewers: int
+    pairCoverage: float
+
+
+class Synthesis(TypedDict, total=False):
+    """Stage 3 synthesis"""
+    clarifiedFocus: str
+    theoreticalFoundations: List[str]
+    keyTensions: List[str]
+    criticalQuestions: List[str]
+    integratedPerspectives: str
+    peerReviewInsights: str
+    recommendedNextSteps: List[str]
+
+
+class DebatePoint(TypedDict, total=False):
+    ideaNumber: int
+    kind: str           # 'strengths', 'weaknesses' or 'missingElements'
+    text: str
+
+
+# An idea whose consensus rank changed ('from' is a keyword, hence the call syntax)
+RankMove = TypedDict('RankMove', {'ideaNumber': int, 'from': int, 'to': int}, total=False)
+
+
+class DebateRound(TypedDict, total=False):
+    """One round of the debate (see debate.py)"""
+    round: int
+    reviews: List[PeerReview]
+    consensus: Consensus
+    # Share of idea pairs ordered differently than in the round before
+    movement: float
+    rankChanges: List[RankMove]
+    newPoints: List[DebatePoint]
+    revisedFields: List[str]
+    promptTokens: int
+
+
+class Debate(TypedDict, total=False):
+    """Debate rounds after the synthesis; `stopped` is 'converged', 'max rounds' or 'no reviews'"""
+    rounds: List[DebateRound]
+    maxRounds: int
+    stopped: Optional[str]
+
+
+class Proposal(TypedDict, total=False):
+    """Stage 4 research proposal"""
+    title: str
+    researchQuestion: str
+    background: str
+    methodology: str
+    expectedContribution: str
+    feasibilityNotes: str
+
+
+@dataclass
+class ProgressEvent:
+    """Something that happened while a stage was running
+
+    kind is one of:
+      'log'      - message at level 'info' / 'progress' / 'success' / 'error';
+                   `metrics` may hold the agent, model, latency, chars and tokens of a call
+      'warning'  - problem the user should see; `raw` may hold the model output
+      'partial'  - `fields` parsed so far from a streaming response
+      'agent_done' / 'agent_failed' - one agent finished; completed/total give progress
+    """
+    stage: str
+    kind: str
+    message: str = ''
+    level: str = 'info'
+    agent: Optional[dict] = None
+    agent_index: Optional[int] = None
+    fields: Optional[dict] = None
+    raw: Optional[str] = None
+    metrics: Optional[dict] = None
+    completed: int = 0
+    total: int = 0
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class CouncilResult:
+    """Everything a full council run produced"""
+    topic: str
+    exploration: List[Exploration] = field(default_factory=list)
+    peer_reviews: List[PeerReview] = field(default_factory=list)
+    # Of the last debate round's reviews when the council debated, else of peer_reviews
+    consensus: Optional[Consensus] = None
+    synthesis: Optional[Synthesis] = None
+    # Rounds after the synthesis when the council debates (the synthesis is then the last revision)
+    debate: Optional[Debate] = None
+    proposal: Optional[Proposal] = None
+    # {run_id, topic, similarity} of the earlier run whose Stage 1 and 2 were reused (see topics.py)
+    reused_from: Optional[dict] = None
+
+
+@dataclass
+class LateResults:
+    """Agent calls a stage stopped waiting for once it reached its quorum
+
+    They keep running in the background; `futures` are the
+    concurrent.futures.Future of each call and `deadline` (time.monotonic())
+    is when they are abandoned.
+    """
+    futures: list
+    deadline: float
+
+
+class CouncilError(Exception):
+    """A stage produced no usable result"""
+
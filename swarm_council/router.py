@@ -0,0 +1,241 @@
+"""Adaptive model routing by latency, error rate and cost
+
+Every answered, failed or cancelled model attempt is fed to the router
+(observe()), which keeps exponentially weighted moving averages per model and
+stage: wall time of answered calls, the share of attempts that failed, and
+cost per token. A call that was cancelled after losing a hedge still tells
+the router its model took at least that long.
+
+Before each call the engine asks the router to order the role's allowed
+models (route()); the first is called and the rest become its fallback chain
+(see hedging.py). The latency policies try a model that has no latency for
+the stage yet before the measured ones, so every allowed model gets measured;
+the configured order breaks ties. Cost falls back to the price table until it
+is measured, and a model with neither comes last for cost. Stats and the most
+recent routing decisions are saved to SWARM_ROUTER_PATH (default
+~/.cache/ai-swarm-council/router.json) at most every SAVE_INTERVAL_SECONDS
+and at exit, so they survive restarts.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from .config import (MODEL_PRICES, ROUTER_DEFAULT_SLO_SECONDS, ROUTER_EWMA_ALPHA, ROUTER_LATENCY_SLO_SECONDS,
+                     ROUTER_MAX_ERROR_RATE, ROUTING_POLICIES)
+from .hedging import breaker_for
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROUTER_PATH = os.environ.get(
+    'SWARM_ROUTER_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-swarm-council', 'router.json')
+)
+
+# Stats and decisions are written at most this often (and by flush())
+SAVE_INTERVAL_SECONDS = 10
+MAX_DECISIONS = 200
+# Prompt tokens per completion token in a typical council call, to compare list prices
+PROMPT_SHARE = 0.75
+
+
+def allowed_models(agent):
+    """The models an agent may be routed to, in its configured order"""
+    return list(agent.get('allowed_models') or [agent['model'], *agent.get('fallback_models', ())])
+
+
+def list_price_per_token(model):
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return None
+    return (PROMPT_SHARE * price[0] + (1 - PROMPT_SHARE) * price[1]) / 1_000_000
+
+
+class ModelRouter:
+    """EWMA stats per (model, stage) and the policies that order a role's models by them"""
+
+    def __init__(self, path=DEFAULT_ROUTER_PATH, alpha=ROUTER_EWMA_ALPHA, slos=None,
+                 max_error_rate=ROUTER_MAX_ERROR_RATE):
+        self.path = path
+        self.alpha = alpha
+        self.slos = dict(ROUTER_LATENCY_SLO_SECONDS if slos is None else slos)
+        self.max_error_rate = max_error_rate
+        # model -> stage -> {'latency', 'error_rate', 'cost_per_token', 'samples'}
+        self._stats = {}
+        self._decisions = deque(maxlen=MAX_DECISIONS)
+        self._saved = 0.0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                state = json.load(f)
+            self._stats = state.get('models', {})
+            self._decisions.extend(state.get('decisions', []))
+        except (OSError, ValueError, AttributeError) as e:
+            logger.debug("Ignoring unreadable router state: %s", e)
+
+    def _state_to_save(self, force=False):
+        """The state as JSON when a save is due, else None; call with the lock held, then _write() it without"""
+        if not self.path or (not force and time.monotonic() - self._saved < SAVE_INTERVAL_SECONDS):
+            return None
+        self._saved = time.monotonic()
+        return json.dumps({'models': self._stats, 'decisions': list(self._decisions)}, indent=1, sort_keys=True)
+
+    def _write(self, state):
+        if state is None:
+            return
+        with self._write_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.write(state)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                logger.debug("Could not save router state: %s", e)
+
+    def _ewma(self, entry, key, value):
+        entry[key] = value if entry.get(key) is None else entry[key] + self.alpha * (value - entry[key])
+
+    def observe(self, stage, model, status, wall=None, cost=None, tokens=None):
+        """Fold one attempt into the model's stats; status as in telemetry (cached/coalesced calls are ignored)"""
+        if status not in ('ok', 'error', 'cancelled'):
+            return
+        with self._lock:
+            entry = self._stats.setdefault(model, {}).setdefault(
+                stage, {'latency': None, 'error_rate': None, 'cost_per_token': None, 'samples': 0})
+            if status == 'cancelled':
+                # Lost a hedge: the model had not answered after `wall` seconds
+                if wall is not None and entry['latency'] is not None and wall > entry['latency']:
+                    self._ewma(entry, 'latency', wall)
+            else:
+                entry['samples'] += 1
+                self._ewma(entry, 'error_rate', 1.0 if status == 'error' else 0.0)
+                if status == 'ok' and wall is not None:
+                    self._ewma(entry, 'latency', wall)
+                if status == 'ok' and cost is not None and tokens:
+                    self._ewma(entry, 'cost_per_token', cost / tokens)
+            state = self._state_to_save()
+        self._write(state)
+
+    def stats(self, stage, model):
+        """The model's stats for `stage`, with cost from the price table until one is measured"""
+        with self._lock:
+            entry = dict(self._stats.get(model, {}).get(stage) or
+                         {'latency': None, 'error_rate': None, 'cost_per_token': None, 'samples': 0})
+        if entry['cost_per_token'] is None:
+            entry['cost_per_token'] = list_price_per_token(model)
+        return entry
+
+    def slo(self, stage):
+        return self.slos.get(stage, ROUTER_DEFAULT_SLO_SECONDS)
+
+    def route(self, policy, stage, role, models):
+        """(models reordered by `policy`, reason for the first) for one call by `role`
+
+        The decision is remembered (see decisions()) unless the policy is 'static'.
+        """
+        if policy not in ROUTING_POLICIES:
+            raise ValueError(f"routing policy must be one of {ROUTING_POLICIES}")
+        models = list(dict.fromkeys(models))
+        if policy == 'static' or len(models) < 2:
+            return models, 'as configured'
+
+        stats = {model: self.stats(stage, model) for model in models}
+        healthy = [model for model in models if breaker_for(model).state != 'open'
+                   and (stats[model]['error_rate'] or 0.0) <= self.max_error_rate]
+        unhealthy = [model for model in models if model not in healthy]
+
+        def latency(model):
+            # Unmeasured models come first, in their configured order, so they get measured
+            return stats[model]['latency'] is not None, stats[model]['latency'] or 0.0
+
+        def cost(model):
+            return stats[model]['cost_per_token'] is None, stats[model]['cost_per_token'] or 0.0
+
+        def describe(model):
+            entry = stats[model]
+            parts = []
+            if entry['latency'] is not None:
+                parts.append(f"{entry['latency']:.1f}s avg")
+            if entry['cost_per_token'] is not None:
+                parts.append(f"${entry['cost_per_token'] * 1000:.4f}/1k tokens")
+            return ', '.join(parts) or 'no data yet'
+
+        fastest = sorted(healthy, key=latency)
+        if policy == 'fastest':
+            ordered, reason = fastest, 'fastest'
+        elif policy == 'cheapest':
+            ordered, reason = sorted(healthy, key=cost), 'cheapest'
+        else:
+            limit = self.slo(stage)
+            within = [model for model in healthy if stats[model]['latency'] is None
+                      or stats[model]['latency'] <= limit]
+            if within:
+                first = min(within, key=cost)
+                reason = f"cheapest within the {limit:g}s SLO"
+            elif fastest:
+                first = fastest[0]
+                reason = f"fastest, none meets the {limit:g}s SLO"
+            else:
+                first, reason = None, None
+            ordered = ([first] if first else []) + [model for model in fastest if model != first]
+        if not ordered:
+            ordered, reason = models, 'all unhealthy, as configured'
+            unhealthy = []
+        ordered += unhealthy
+        reason = f"{reason}: {describe(ordered[0])}"
+
+        with self._lock:
+            self._decisions.append({'time': round(time.time(), 3), 'stage': stage, 'role': role, 'policy': policy,
+                                    'model': ordered[0], 'chain': ordered, 'reason': reason})
+            state = self._state_to_save()
+        self._write(state)
+        return ordered, reason
+
+    def decisions(self, limit=20):
+        """The most recent routing decisions, newest last"""
+        with self._lock:
+            return list(self._decisions)[-limit:]
+
+    def snapshot(self):
+        """model -> stage -> stats, as measured"""
+        with self._lock:
+            return {model: {stage: dict(entry) for stage, entry in stages.items()}
+                    for model, stages in self._stats.items()}
+
+    def flush(self):
+        with self._lock:
+            state = self._state_to_save(force=True)
+        self._write(state)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide model router"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+                # Whatever changed since the last save
+                atexit.register(lambda: _router.flush())
+    return _router
+
+
+def set_router(router):
+    """Replace the process-wide router, e.g. with an in-memory one (path=None) for benchmarks"""
+    global _router
+    with _router_lock:
+        _router = router
@@ -0,0 +1,290 @@
+"""Durable store of council runs, so finished stages survive restarts
+
+Every run gets an id. Each completed stage's output is checkpointed under it
+as soon as the stage finishes, together with a record of every model call
+(prompts, response size, timing). Outputs and prompts are kept as
+zlib-compressed JSON blobs, content-addressed so that repeated prompts and
+re-saved stages are stored once. A run can be resumed from its last completed
+stage by loading it back (the UI does this for ?run=<id>). The MinHash
+signature of each run's topic is kept here too, for the near-duplicate topic
+index (see topics.py).
+
+Runs are private to whoever started them: each run records an owner (the
+fingerprint of the API key it was run with, see clients.key_fingerprint),
+and lookups given an owner only see that owner's runs. Runs saved before
+owners were recorded have none and are only visible to unscoped lookups.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+
+DEFAULT_RUNS_PATH = os.environ.get(
+    'SWARM_RUNS_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-swarm-council', 'runs.sqlite3')
+)
+
+STAGE_ORDER = ['explore', 'review', 'synthesize', 'debate', 'propose']
+
+
+def _pack(value):
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(data).hexdigest(), zlib.compress(data, 6)
+
+
+def _unpack(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8'))
+
+
+class RunStore:
+    """SQLite-backed store of runs, stage checkpoints and call records, safe to share across threads"""
+
+    def __init__(self, path=DEFAULT_RUNS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(
+            'CREATE TABLE IF NOT EXISTS blobs ('
+            ' hash TEXT PRIMARY KEY,'
+            ' data BLOB NOT NULL,'
+            ' size INTEGER NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS runs ('
+            ' id TEXT PRIMARY KEY,'
+            ' topic TEXT NOT NULL,'
+            ' created REAL NOT NULL,'
+            ' updated REAL NOT NULL,'
+            ' last_stage TEXT,'
+            ' owner TEXT);'
+            'CREATE TABLE IF NOT EXISTS stages ('
+            ' run_id TEXT NOT NULL,'
+            ' stage TEXT NOT NULL,'
+            ' output TEXT NOT NULL REFERENCES blobs(hash),'
+            ' saved REAL NOT NULL,'
+            ' PRIMARY KEY (run_id, stage));'
+            'CREATE TABLE IF NOT EXISTS calls ('
+            ' run_id TEXT NOT NULL,'
+            ' stage TEXT NOT NULL,'
+            ' agent TEXT NOT NULL,'
+            ' model TEXT NOT NULL,'
+            ' prompt TEXT NOT NULL REFERENCES blobs(hash),'
+            ' prompt_tokens INTEGER,'
+            ' completion_chars INTEGER,'
+            ' completion_tokens INTEGER,'
+            ' elapsed REAL,'
+            ' ok INTEGER NOT NULL,'
+            ' created REAL NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS topic_signatures ('
+            ' run_id TEXT PRIMARY KEY,'
+            ' signature BLOB NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS calls_run ON calls(run_id, stage);'
+            'CREATE INDEX IF NOT EXISTS runs_updated ON runs(updated);'
+        )
+        if 'owner' not in {row[1] for row in self._conn.execute('PRAGMA table_info(runs)')}:
+            self._conn.execute('ALTER TABLE runs ADD COLUMN owner TEXT')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS runs_owner ON runs(owner, updated)')
+
+    def _put_blob(self, value):
+        key, data = _pack(value)
+        self._conn.execute('INSERT OR IGNORE INTO blobs (hash, data, size) VALUES (?, ?, ?)', (key, data, len(data)))
+        return key
+
+    def _get_blob(self, key):
+        row = self._conn.execute('SELECT data FROM blobs WHERE hash = ?', (key,)).fetchone()
+        return None if row is None else _unpack(row[0])
+
+    def create_run(self, topic, run_id=None, owner=None):
+        """Register a run (a new random id unless one is given) for `owner` and return its id"""
+        run_id = run_id or uuid.uuid4().hex[:12]
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR IGNORE INTO runs (id, topic, created, updated, owner) VALUES (?, ?, ?, ?, ?)',
+                (run_id, topic, now, now, owner)
+            )
+        return run_id
+
+    def save_stage(self, run_id, stage, output):
+        """Checkpoint one stage's output; saving a stage again replaces it
+
+        The run's last_stage only moves forward: re-saving an earlier stage
+        (e.g. reviews that arrived late) leaves it where it is.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                key = self._put_blob(output)
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO stages (run_id, stage, output, saved) VALUES (?, ?, ?, ?)',
+                    (run_id, stage, key, now)
+                )
+                row = self._conn.execute('SELECT last_stage FROM runs WHERE id = ?', (run_id,)).fetchone()
+                last = row and row[0]
+                if last in STAGE_ORDER and stage in STAGE_ORDER and STAGE_ORDER.index(last) > STAGE_ORDER.index(stage):
+                    stage = last
+                self._conn.execute('UPDATE runs SET updated = ?, last_stage = ? WHERE id = ?', (now, stage, run_id))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def record_call(self, run_id, stage, agent, model, system_prompt, user_prompt, response=None, elapsed=None,
+                    prompt_tokens=None, completion_tokens=None):
+        """Keep the prompts and usage of one model call; response None means the call failed"""
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                key = self._put_blob({'system': system_prompt, 'user': user_prompt})
+                self._conn.execute(
+                    'INSERT INTO calls (run_id, stage, agent, model, prompt, prompt_tokens, completion_chars,'
+                    ' completion_tokens, elapsed, ok, created) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (run_id, stage, agent, model, key, prompt_tokens, len(response) if response else 0,
+                     completion_tokens, elapsed, response is not None, time.time())
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def copy_stages(self, source_run_id, run_id, stages):
+        """Checkpoint `stages` of one run as another's (blobs are shared); returns the stages copied"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                rows = self._conn.execute(
+                    f'SELECT stage, output FROM stages WHERE run_id = ? AND stage IN ({",".join("?" * len(stages))})',
+                    (source_run_id, *stages)
+                ).fetchall()
+                self._conn.executemany(
+                    'INSERT OR REPLACE INTO stages (run_id, stage, output, saved) VALUES (?, ?, ?, ?)',
+                    [(run_id, stage, key, now) for stage, key in rows]
+                )
+                copied = [stage for stage in STAGE_ORDER if stage in {row[0] for row in rows}]
+                if copied:
+                    self._conn.execute('UPDATE runs SET updated = ?, last_stage = ? WHERE id = ?',
+                                       (now, copied[-1], run_id))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return copied
+
+    def runs_with_stages(self, stages, since=0.0):
+        """(id, topic, updated, topic signature or None, owner) of runs updated after `since` with all `stages` saved"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT runs.id, runs.topic, runs.updated, topic_signatures.signature, runs.owner FROM runs'
+                ' LEFT JOIN topic_signatures ON topic_signatures.run_id = runs.id'
+                ' WHERE runs.updated > ? AND (SELECT COUNT(*) FROM stages WHERE stages.run_id = runs.id'
+                f' AND stages.stage IN ({",".join("?" * len(stages))})) = ?',
+                (since, *stages, len(stages))
+            ).fetchall()
+
+    def save_topic_signature(self, run_id, signature):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO topic_signatures (run_id, signature) VALUES (?, ?)',
+                               (run_id, signature))
+
+    def load_run(self, run_id, owner=None):
+        """The run's topic and every checkpointed stage output, or None if the run is unknown
+
+        With `owner`, another owner's run is unknown too.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT topic, created, updated, last_stage, owner FROM runs WHERE id = ?', (run_id,)
+            ).fetchone()
+            if row is None or (owner is not None and row[4] != owner):
+                return None
+            stages = {stage: self._get_blob(key) for stage, key in self._conn.execute(
+                'SELECT stage, output FROM stages WHERE run_id = ?', (run_id,)
+            )}
+        topic, created, updated, last_stage, run_owner = row
+        return {'id': run_id, 'topic': topic, 'created': created, 'updated': updated, 'last_stage': last_stage,
+                'owner': run_owner, 'stages': stages}
+
+    def calls(self, run_id):
+        """Call records for a run, oldest first, with their prompts"""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT stage, agent, model, prompt, prompt_tokens, completion_chars, completion_tokens, elapsed,'
+                ' ok, created FROM calls WHERE run_id = ? ORDER BY created', (run_id,)
+            ).fetchall()
+            prompts = {key: self._get_blob(key) for key in {row[3] for row in rows}}
+        columns = ('stage', 'agent', 'model', 'prompt', 'prompt_tokens', 'completion_chars', 'completion_tokens',
+                   'elapsed', 'ok', 'created')
+        records = []
+        for row in rows:
+            record = dict(zip(columns, row))
+            record['prompt'] = prompts[record['prompt']]
+            record['ok'] = bool(record['ok'])
+            records.append(record)
+        return records
+
+    def run_ids(self, since=0.0):
+        """Ids of the runs created after `since` (epoch seconds), oldest first"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT id FROM runs WHERE created > ? ORDER BY created', (since,)
+            )]
+
+    def recent_runs(self, limit=10, owner=None):
+        """(id, topic, last_stage, updated) of the most recently updated runs (of `owner`, if given)"""
+        with self._lock:
+            if owner is None:
+                return self._conn.execute(
+                    'SELECT id, topic, last_stage, updated FROM runs ORDER BY updated DESC LIMIT ?', (limit,)
+                ).fetchall()
+            return self._conn.execute(
+                'SELECT id, topic, last_stage, updated FROM runs WHERE owner = ? ORDER BY updated DESC LIMIT ?',
+                (owner, limit)
+            ).fetchall()
+
+    def delete_run(self, run_id):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM calls WHERE run_id = ?', (run_id,))
+            self._conn.execute('DELETE FROM stages WHERE run_id = ?', (run_id,))
+            self._conn.execute('DELETE FROM topic_signatures WHERE run_id = ?', (run_id,))
+            self._conn.execute('DELETE FROM runs WHERE id = ?', (run_id,))
+            # Blobs no longer referenced by any stage or call
+            self._conn.execute(
+                'DELETE FROM blobs WHERE hash NOT IN (SELECT output FROM stages)'
+                ' AND hash NOT IN (SELECT prompt FROM calls)'
+            )
+            self._conn.execute('COMMIT')
+
+
+def next_stage(run):
+    """The first stage a loaded run has no checkpoint for (None when all are done)
+
+    'debate' is only checkpointed by councils that debate (see
+    SwarmCouncil.debate_rounds).
+    """
+    for stage in STAGE_ORDER:
+        if stage not in run['stages']:
+            return stage
+    return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_run_store():
+    """Return the process-wide run store"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = RunStore()
+    return _store
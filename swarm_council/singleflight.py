@@ -0,0 +1,101 @@
+"""Coalescing of identical model requests that are in flight at the same time
+
+When several sessions (or a batch and a session) run the same topic at once,
+their Stage 1 prompts are identical and would each go upstream. The first
+such call leads a Flight and makes the request; identical calls arriving
+while it is running follow it instead: they receive every delta the leader
+receives, from the first one on, and end with its answer. Only one request is
+made and paid for. A leader that fails before any output may have failed for
+reasons of its own API key (bad key, no credits, its rate limit), so its
+followers then make their own request instead (see llm.call_llm); a failure
+after output was shared ends the followers too.
+"""
+import threading
+from collections import Counter
+
+
+class Flight:
+    """One upstream request in progress and the deltas it has produced so far"""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        # The model that answered, which may be a fallback of the one asked for
+        self.model = None
+        self._cond = threading.Condition()
+
+    def publish(self, delta):
+        with self._cond:
+            self.chunks.append(delta)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def follow(self):
+        """Yield every delta of the request as it arrives; raises the leader's error if it failed"""
+        idx = 0
+        while True:
+            with self._cond:
+                while idx == len(self.chunks) and not self.done:
+                    self._cond.wait()
+                new = self.chunks[idx:]
+                idx += len(new)
+                finished = self.done and idx == len(self.chunks)
+                error = self.error
+            yield from new
+            if finished:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Registry of in-flight requests by key, safe to share across threads"""
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def join(self, key):
+        """(flight, leads): the flight already running for `key`, or a new one the caller must run and land()"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._counts['coalesced'] += 1
+                return flight, False
+            flight = self._flights[key] = Flight()
+            self._counts['upstream'] += 1
+            return flight, True
+
+    def land(self, key, flight, error=None):
+        """End a flight: later identical calls make a request of their own"""
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+        flight.finish(error)
+
+    def stats(self):
+        """Requests sent upstream, calls that joined one instead, and requests in flight now"""
+        with self._lock:
+            return {'upstream': self._counts['upstream'], 'coalesced': self._counts['coalesced'],
+                    'in_flight': len(self._flights)}
+
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    """Return the process-wide registry of in-flight requests"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,245 @@
+"""JSON schemas for every stage, validation, and structured-output support per model
+
+Each stage's expected output is described as a JSON Schema. Responses are
+validated against it (a small validator covering the subset used here), and
+the schema is also sent as a `response_format` of type json_schema to models
+that honor it. Which models do is learned from their answers: a model that
+rejects the parameter, or keeps answering with something other than valid
+JSON for the schema, stops being asked. A rejection is only taken from an
+error that is about the parameter, and is tried again after
+REJECTION_TTL_SECONDS in case the provider has added support. What was
+learned is saved to a small JSON file so it survives restarts.
+"""
+import copy
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SUPPORT_PATH = os.environ.get(
+    'SWARM_STRUCTURED_OUTPUT_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ai-swarm-council', 'structured_output.json')
+)
+REJECTION_TTL_SECONDS = float(os.environ.get('SWARM_STRUCTURED_OUTPUT_REJECTION_TTL', 7 * 24 * 3600))
+
+# What an API error says when it is about response_format itself, rather than
+# e.g. the context length or a content filter
+_FORMAT_ERROR = re.compile(r'response_format|json_schema|structured[ _-]?output', re.IGNORECASE)
+
+
+def _strings():
+    return {'type': 'array', 'items': {'type': 'string'}}
+
+
+def _object(title, properties):
+    schema = {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False,
+    }
+    if title:
+        schema['title'] = title
+    return schema
+
+
+EXPLORATION_SCHEMA = _object('exploration', {
+    'keyConcepts': _strings(),
+    'theoreticalFrameworks': _strings(),
+    'whatsClear': {'type': 'string'},
+    'whatsFuzzy': {'type': 'string'},
+    'importantQuestions': _strings(),
+    'considerations': {'type': 'string'},
+})
+
+REVIEW_SCHEMA = _object('peer_review', {
+    'reviews': {'type': 'array', 'items': _object(None, {
+        'ideaNumber': {'type': 'integer'},
+        'strengths': _strings(),
+        'weaknesses': _strings(),
+        'missingElements': _strings(),
+    })},
+    'ranking': {'type': 'array', 'items': {'type': 'integer'}},
+    'overallCommentary': {'type': 'string'},
+})
+
+SYNTHESIS_SCHEMA = _object('synthesis', {
+    'clarifiedFocus': {'type': 'string'},
+    'theoreticalFoundations': _strings(),
+    'keyTensions': _strings(),
+    'criticalQuestions': _strings(),
+    'integratedPerspectives': {'type': 'string'},
+    'peerReviewInsights': {'type': 'string'},
+    'recommendedNextSteps': _strings(),
+})
+
+PROPOSAL_SCHEMA = _object('proposal', {
+    'title': {'type': 'string'},
+    'researchQuestion': {'type': 'string'},
+    'background': {'type': 'string'},
+    'methodology': {'type': 'string'},
+    'expectedContribution': {'type': 'string'},
+    'feasibilityNotes': {'type': 'string'},
+})
+
+_TYPES = {
+    'object': dict,
+    'array': list,
+    'string': str,
+    'integer': int,
+    'number': (int, float),
+    'boolean': bool,
+}
+
+
+def validate(value, schema, path='$'):
+    """Problems with `value` against `schema`, as readable strings (empty when valid)
+
+    Extra properties are tolerated; models add harmless ones.
+    """
+    expected = schema.get('type')
+    if expected:
+        types = _TYPES[expected]
+        if not isinstance(value, types) or (expected in ('integer', 'number') and isinstance(value, bool)):
+            return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    problems = []
+    if expected == 'object':
+        for key in schema.get('required', ()):
+            if key not in value:
+                problems.append(f"{path}.{key}: missing")
+        for key, subschema in schema.get('properties', {}).items():
+            if key in value:
+                problems.extend(validate(value[key], subschema, f"{path}.{key}"))
+    elif expected == 'array' and 'items' in schema:
+        for idx, item in enumerate(value):
+            problems.extend(validate(item, schema['items'], f"{path}[{idx}]"))
+    return problems
+
+
+def coverage(value, schema):
+    """How many of the schema's top-level properties `value` has"""
+    if not isinstance(value, dict):
+        return 0
+    return sum(1 for key in schema.get('properties', {}) if key in value)
+
+
+def response_format(schema):
+    """OpenAI-style response_format requesting output that matches `schema`"""
+    body = copy.deepcopy(schema)
+    name = body.pop('title', 'response')
+    return {'type': 'json_schema', 'json_schema': {'name': name, 'strict': True, 'schema': body}}
+
+
+def honors(content, schema):
+    """Whether `content` is exactly one JSON document valid for `schema` (no prose, no fences)"""
+    try:
+        value = json.loads(content)
+    except (TypeError, ValueError):
+        return False
+    return not validate(value, schema)
+
+
+def rejects_response_format(error):
+    """Whether an API error (e.g. openai.BadRequestError) is a refusal of response_format"""
+    parts = [str(getattr(error, 'message', '') or error)]
+    body = getattr(error, 'body', None)
+    if body is not None:
+        parts.append(json.dumps(body, default=str) if not isinstance(body, str) else body)
+    return any(_FORMAT_ERROR.search(part) for part in parts)
+
+
+class StructuredOutputSupport:
+    """Which models honor response_format json_schema, learned from their answers
+
+    Unknown models are asked. A model is marked unsupported when the API
+    rejects the parameter (for `rejection_ttl` seconds), or after `max_misses`
+    answers in a row that ignore it; one valid answer marks it supported again.
+    """
+
+    def __init__(self, path=DEFAULT_SUPPORT_PATH, max_misses=2, rejection_ttl=REJECTION_TTL_SECONDS):
+        self.path = path
+        self.max_misses = max_misses
+        self.rejection_ttl = rejection_ttl
+        self._models = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._models = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.debug("Ignoring unreadable structured-output support file: %s", e)
+
+    def _save(self):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._models, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.debug("Could not save structured-output support: %s", e)
+
+    def should_request(self, model):
+        with self._lock:
+            entry = self._models.get(model, {})
+            if entry.get('supported') is not False:
+                return True
+            rejected = entry.get('rejected')
+            return rejected is not None and time.time() - rejected >= self.rejection_ttl
+
+    def record(self, model, honored):
+        """Note whether `model` answered a structured request as asked"""
+        with self._lock:
+            entry = self._models.setdefault(model, {'supported': None, 'misses': 0})
+            before = dict(entry)
+            # Asked again after a rejection expired: the answer now decides
+            entry.pop('rejected', None)
+            if honored:
+                entry.update(supported=True, misses=0)
+            else:
+                entry['misses'] += 1
+                if entry['misses'] >= self.max_misses:
+                    entry['supported'] = False
+            if entry != before:
+                self._save()
+
+    def reject(self, model):
+        """The API refused response_format for `model`; it is asked again after rejection_ttl"""
+        with self._lock:
+            self._models[model] = {'supported': False, 'misses': self.max_misses, 'rejected': time.time()}
+            self._save()
+
+    def snapshot(self):
+        with self._lock:
+            return {model: entry.get('supported') for model, entry in self._models.items()}
+
+
+_support = None
+_support_lock = threading.Lock()
+
+
+def get_structured_support():
+    """Return the process-wide structured-output support record"""
+    global _support
+    if _support is None:
+        with _support_lock:
+            if _support is None:
+                _support = StructuredOutputSupport()
+    return _support
+
+
+def set_structured_support(support):
+    """Replace the process-wide record, e.g. with an in-memory one (path=None) for benchmarks"""
+    global _support
+    with _support_lock:
+        _support = support
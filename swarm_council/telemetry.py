@@ -0,0 +1,339 @@
+"""Per-call telemetry: latency, time to first token, token usage and cost
+
+Every model attempt (including hedges that lost, calls answered from the
+cache and calls that shared another's request in flight) is reported to the
+process-wide Telemetry with its wall time, time to first token, prompt and
+completion tokens (from the API's usage when it sends one, estimated
+otherwise), the prompt tokens the provider served from its prompt cache, and
+a cost from MODEL_PRICES. Stages are recorded as spans. From these it keeps
+  - per-run summaries (by stage and by agent) for the UI and batch records,
+  - counters and histograms exported in the Prometheus/OpenMetrics text
+    format (openmetrics(), or over HTTP with serve_metrics()), and
+  - optionally a trace file in the Chrome trace-event format
+    (SWARM_TRACE_PATH), which chrome://tracing and Perfetto open directly.
+"""
+import bisect
+import contextlib
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from .config import CACHED_PROMPT_PRICES, MODEL_PRICES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACE_PATH = os.environ.get('SWARM_TRACE_PATH') or None
+DEFAULT_METRICS_PORT = int(os.environ.get('SWARM_METRICS_PORT') or 0) or None
+# Loopback only unless set, e.g. to 0.0.0.0 for a Prometheus server on another host
+DEFAULT_METRICS_HOST = os.environ.get('SWARM_METRICS_HOST') or '127.0.0.1'
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+OPENMETRICS_CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# Answered without a request of their own: from the cache, or by joining an identical one in flight
+FREE_STATUSES = ('cached', 'coalesced')
+ANSWERED_STATUSES = ('ok',) + FREE_STATUSES
+
+
+def call_cost(model, prompt_tokens, completion_tokens, cached_tokens=None):
+    """Cost in USD of a call, or None when the model's price or the usage is unknown
+
+    cached_tokens, the part of prompt_tokens read from the provider's prompt
+    cache, are charged at CACHED_PROMPT_PRICES where the model has one.
+    """
+    price = MODEL_PRICES.get(model)
+    if price is None or prompt_tokens is None or completion_tokens is None:
+        return None
+    cached = min(cached_tokens or 0, prompt_tokens)
+    cached_price = CACHED_PROMPT_PRICES.get(model, price[0])
+    return ((prompt_tokens - cached) * price[0] + cached * cached_price + completion_tokens * price[1]) / 1_000_000
+
+
+def _labels(**labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items() if value is not None))
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+class _Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class Telemetry:
+    """Thread-safe collector of call records and stage spans
+
+    Call records are kept per run for the `max_runs` most recent runs; the
+    exported counters and histograms cover the whole process lifetime.
+    """
+
+    def __init__(self, trace_path=DEFAULT_TRACE_PATH, max_runs=200):
+        self.trace_path = trace_path
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._runs = OrderedDict()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._trace = None
+        self._trace_ids = {}
+        self._epoch = time.time() - time.monotonic()
+
+    # -- recording ----------------------------------------------------------
+
+    def _run(self, run):
+        entry = self._runs.get(run)
+        if entry is None:
+            entry = self._runs[run] = {'calls': [], 'spans': []}
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        else:
+            self._runs.move_to_end(run)
+        return entry
+
+    def _observe(self, name, labels, value):
+        histogram = self._histograms.get((name, labels))
+        if histogram is None:
+            histogram = self._histograms[(name, labels)] = _Histogram()
+        histogram.observe(value)
+
+    def record_call(self, run, stage, agent, model, started, wall, ttft=None, prompt_tokens=None,
+                    completion_tokens=None, estimated=False, status='ok', finish_reason=None, cached_tokens=None):
+        """Record one model attempt; status is 'ok', 'cached', 'coalesced', 'cancelled' or 'error'. Returns the record
+
+        finish_reason 'length' marks an answer cut off at its max_tokens;
+        cached_tokens is the part of prompt_tokens served from the provider's
+        prompt cache.
+        """
+        cost = 0.0 if status in FREE_STATUSES else call_cost(model, prompt_tokens, completion_tokens, cached_tokens)
+        record = {
+            'run': run,
+            'stage': stage,
+            'agent': agent,
+            'model': model,
+            'status': status,
+            'wall': round(wall, 3),
+            'ttft': None if ttft is None else round(ttft, 3),
+            'prompt_tokens': prompt_tokens,
+            'cached_tokens': cached_tokens,
+            'completion_tokens': completion_tokens,
+            'estimated': estimated,
+            'cost': cost,
+            'finish_reason': finish_reason,
+        }
+        labels = _labels(model=model, stage=stage)
+        with self._lock:
+            self._run(run)['calls'].append(record)
+            self._counters[('swarm_llm_calls', _labels(model=model, stage=stage, status=status))] += 1
+            if status not in FREE_STATUSES:
+                self._counters[('swarm_llm_prompt_tokens', labels)] += prompt_tokens or 0
+                self._counters[('swarm_llm_cached_prompt_tokens', labels)] += cached_tokens or 0
+                self._counters[('swarm_llm_completion_tokens', labels)] += completion_tokens or 0
+                self._counters[('swarm_llm_cost_usd', labels)] += cost or 0.0
+                if finish_reason == 'length':
+                    self._counters[('swarm_llm_truncations', labels)] += 1
+                if status == 'ok':
+                    self._observe('swarm_llm_call_seconds', labels, wall)
+                    if ttft is not None:
+                        self._observe('swarm_llm_ttft_seconds', _labels(model=model), ttft)
+            self._trace_event(run, agent or stage, f"{agent or stage} · {model}", started, wall,
+                              {key: value for key, value in record.items() if key not in ('run', 'wall')})
+        return record
+
+    @contextlib.contextmanager
+    def span(self, name, run=None, **attrs):
+        """Time the enclosed block as a span of `run` (a stage, usually)"""
+        started = time.monotonic()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            duration = time.monotonic() - started
+            span = {'name': name, 'started': self._epoch + started, 'duration': round(duration, 3),
+                    'status': status, **attrs}
+            with self._lock:
+                self._run(run)['spans'].append(span)
+                self._observe('swarm_stage_seconds', _labels(stage=name, status=status), duration)
+                self._trace_event(run, 'stages', name, started, duration, {'status': status, **attrs})
+
+    # -- trace file ---------------------------------------------------------
+
+    def _trace_id(self, kind, name):
+        """Numeric pid/tid for `name`, announcing its name to the trace on first use"""
+        key = (kind, name)
+        if key not in self._trace_ids:
+            self._trace_ids[key] = len(self._trace_ids) + 1
+            return self._trace_ids[key], True
+        return self._trace_ids[key], False
+
+    def _trace_event(self, run, lane, name, started, duration, args):
+        if not self.trace_path:
+            return
+        try:
+            if self._trace is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                fresh = not os.path.exists(self.trace_path) or os.path.getsize(self.trace_path) == 0
+                self._trace = open(self.trace_path, 'a', encoding='utf-8', buffering=1)
+                if fresh:
+                    # The JSON array format allows the closing bracket to be omitted
+                    self._trace.write('[\n')
+            pid, new_pid = self._trace_id('run', run)
+            tid, new_tid = self._trace_id('lane', (run, lane))
+            lines = []
+            if new_pid:
+                lines.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': f"run {run}"}})
+            if new_tid:
+                lines.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': lane}})
+            lines.append({'name': name, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': int((self._epoch + started) * 1e6),
+                          'dur': int(duration * 1e6), 'args': args})
+            self._trace.write(''.join(json.dumps(line, ensure_ascii=False) + ',\n' for line in lines))
+        except OSError as e:
+            logger.warning("Could not write trace file %s: %s", self.trace_path, e)
+            self.trace_path = None
+
+    # -- reading ------------------------------------------------------------
+
+    def calls(self, run):
+        with self._lock:
+            entry = self._runs.get(run)
+            return list(entry['calls']) if entry else []
+
+    def run_summary(self, run):
+        """Totals for a run, with breakdowns by stage and by agent"""
+        with self._lock:
+            entry = self._runs.get(run) or {'calls': [], 'spans': []}
+            calls, spans = list(entry['calls']), list(entry['spans'])
+
+        def totals(records):
+            costs = [record['cost'] for record in records if record['cost'] is not None]
+            answered = [record for record in records if record['status'] in ANSWERED_STATUSES]
+            ttfts = [record['ttft'] for record in answered if record['ttft'] is not None]
+            return {
+                'calls': len(records),
+                'cost': round(sum(costs), 6),
+                'cost_known': len(costs) == len(records),
+                'prompt_tokens': sum(record['prompt_tokens'] or 0 for record in records),
+                'cached_tokens': sum(record['cached_tokens'] or 0 for record in records),
+                'completion_tokens': sum(record['completion_tokens'] or 0 for record in records),
+                'max_wall': max((record['wall'] for record in answered), default=None),
+                'max_ttft': max(ttfts, default=None),
+            }
+
+        by_stage = defaultdict(list)
+        by_agent = defaultdict(list)
+        for record in calls:
+            by_stage[record['stage']].append(record)
+            by_agent[(record['stage'], record['agent'])].append(record)
+        stages = {stage: totals(records) for stage, records in by_stage.items()}
+        for span in spans:
+            stages.setdefault(span['name'], totals([]))['wall'] = span['duration']
+        summary = totals(calls)
+        summary['wall'] = round(sum(span['duration'] for span in spans), 3)
+        summary['stages'] = stages
+        summary['agents'] = [{'stage': stage, 'agent': agent, 'model': records[-1]['model'], **totals(records)}
+                             for (stage, agent), records in by_agent.items()]
+        return summary
+
+    def openmetrics(self):
+        """Process-wide counters and histograms in the OpenMetrics text format"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(h.counts), h.sum) for key, h in self._histograms.items()}
+        lines = []
+        helps = {
+            'swarm_llm_calls': 'Model call attempts by outcome',
+            'swarm_llm_prompt_tokens': 'Prompt tokens sent',
+            'swarm_llm_cached_prompt_tokens': "Prompt tokens read from the provider's prompt cache",
+            'swarm_llm_completion_tokens': 'Completion tokens received',
+            'swarm_llm_cost_usd': 'Cost of model calls in USD, from the local price table',
+            'swarm_llm_truncations': 'Answers cut off at their max_tokens',
+        }
+        for name, help_text in helps.items():
+            samples = sorted((labels, value) for (metric, labels), value in counters.items() if metric == name)
+            lines += [f"# TYPE {name} counter", f"# HELP {name} {help_text}"]
+            if name == 'swarm_llm_cost_usd':
+                lines.append(f"# UNIT {name} usd")
+            lines += [f"{name}_total{_format_labels(labels)} {value:g}" for labels, value in samples]
+        hist_helps = {
+            'swarm_llm_call_seconds': 'Wall time of answered model calls',
+            'swarm_llm_ttft_seconds': 'Time to first token of answered model calls',
+            'swarm_stage_seconds': 'Wall time of council stages',
+        }
+        for name, help_text in hist_helps.items():
+            lines += [f"# TYPE {name} histogram", f"# HELP {name} {help_text}", f"# UNIT {name} seconds"]
+            for labels, (counts, total) in sorted((labels, data) for (metric, labels), data in histograms.items()
+                                                  if metric == name):
+                cumulative = 0
+                for bound, count in zip(list(LATENCY_BUCKETS) + ['+Inf'], counts):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else f"{float(bound):g}"
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        lines.append('# EOF')
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Return the process-wide telemetry collector"""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+    return _telemetry
+
+
+def serve_metrics(port=DEFAULT_METRICS_PORT, telemetry=None, host=DEFAULT_METRICS_HOST):
+    """Serve openmetrics() at http://host:port/metrics from a daemon thread; returns the server"""
+    telemetry = telemetry or get_telemetry()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = telemetry.openmetrics().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', OPENMETRICS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='swarm-metrics', daemon=True).start()
+    return server
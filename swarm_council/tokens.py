@@ -0,0 +1,159 @@
+"""Offline token counting and per-model prompt budgets
+
+count_tokens() uses tiktoken when it is installed and its encoding is
+available locally; otherwise a regex approximation of BPE tokenization is used
+(words split into pieces of up to 8 letters, digits in groups of 3, every other
+symbol on its own), which is within ~15% of real tokenizers on English prose.
+Counts are only used for budgeting and pacing, so either is good enough.
+
+Output budgets adapt instead: OutputLengths keeps recent completion lengths
+per model and stage and turns them into the max_tokens to ask for.
+PrefillTimes keeps recent times to first token against uncached prompt
+tokens per model, for the prompt-cache warm-up decision in Stage 2.
+"""
+import logging
+import math
+import re
+import threading
+from collections import deque
+from functools import lru_cache
+
+from .config import (MODEL_PROMPT_TOKEN_BUDGETS, OUTPUT_TOKENS_HEADROOM, OUTPUT_TOKENS_MAX, OUTPUT_TOKENS_MIN,
+                     OUTPUT_TOKENS_MIN_SAMPLES, OUTPUT_TOKENS_PERCENTILE, PREFILL_MIN_SAMPLES, PROMPT_TOKEN_BUDGET)
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+_APPROX_TOKEN = re.compile(r"[^\W\d_]{1,8}|\d{1,3}|[^\w\s]|_")
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding('cl100k_base')
+        except Exception as e:
+            # The encoding file is fetched on first use; offline that fails
+            logger.warning("tiktoken encoding unavailable (%s); using approximate token counts", e)
+            _encoding_failed = True
+    return _encoding
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text):
+    """Number of tokens in `text`"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_APPROX_TOKEN.findall(text))
+
+
+def prompt_budget(model):
+    """Input token budget (system + user prompt) for `model`"""
+    return MODEL_PROMPT_TOKEN_BUDGETS.get(model, PROMPT_TOKEN_BUDGET)
+
+
+class OutputLengths:
+    """Rolling window of completion lengths per (model, stage), and the max_tokens they call for
+
+    Answers that were cut off at their limit are recorded at that length;
+    they pull the percentile up, so the next limit grows by the headroom.
+    """
+
+    def __init__(self, window=200, percentile=OUTPUT_TOKENS_PERCENTILE, headroom=OUTPUT_TOKENS_HEADROOM,
+                 min_tokens=OUTPUT_TOKENS_MIN, max_tokens=OUTPUT_TOKENS_MAX, min_samples=OUTPUT_TOKENS_MIN_SAMPLES):
+        self.percentile = percentile
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.min_samples = min_samples
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, stage, tokens):
+        if not tokens:
+            return
+        with self._lock:
+            self._samples.setdefault((model, stage), deque(maxlen=self._window)).append(tokens)
+
+    def limit(self, model, stage, default):
+        """max_tokens for the next call of `model` in `stage`; `default` until there are enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get((model, stage), ()))
+        if len(samples) < self.min_samples:
+            return default
+        observed = samples[min(len(samples) - 1, int(self.percentile * len(samples)))]
+        return max(self.min_tokens, min(self.max_tokens, math.ceil(observed * self.headroom)))
+
+    def for_stage(self, stage):
+        """This tracker seen from one stage, as call_llm's output_limits"""
+        return StageOutputLengths(self, stage)
+
+    def snapshot(self):
+        """(model, stage) -> sample count and current p50 / percentile"""
+        with self._lock:
+            items = {key: sorted(samples) for key, samples in self._samples.items()}
+        return {key: {'samples': len(samples), 'p50': samples[len(samples) // 2],
+                      'high': samples[min(len(samples) - 1, int(self.percentile * len(samples)))]}
+                for key, samples in items.items()}
+
+
+class StageOutputLengths:
+    def __init__(self, lengths, stage):
+        self.lengths = lengths
+        self.stage = stage
+
+    def limit(self, model, default):
+        return self.lengths.limit(model, self.stage, default)
+
+    def record(self, model, tokens):
+        self.lengths.record(model, self.stage, tokens)
+
+
+class PrefillTimes:
+    """Rolling window of (uncached prompt tokens, time to first token) per model
+
+    A least-squares line through the samples splits the time to first token
+    into a fixed part (queueing, network) and a prefill time per token.
+    """
+
+    def __init__(self, window=200, min_samples=PREFILL_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, model, prompt_tokens, ttft):
+        if not prompt_tokens or ttft is None:
+            return
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self._window)).append((prompt_tokens, ttft))
+
+    def fit(self, model):
+        """(fixed seconds, seconds per prompt token) for `model`, or None without enough spread-out samples"""
+        with self._lock:
+            samples = list(self._samples.get(model, ()))
+        if len(samples) < self.min_samples:
+            return None
+        mean_tokens = sum(tokens for tokens, _ in samples) / len(samples)
+        mean_ttft = sum(ttft for _, ttft in samples) / len(samples)
+        spread = sum((tokens - mean_tokens) ** 2 for tokens, _ in samples)
+        if not spread:
+            return None
+        per_token = sum((tokens - mean_tokens) * (ttft - mean_ttft) for tokens, ttft in samples) / spread
+        if per_token <= 0:
+            return None
+        return max(0.0, mean_ttft - per_token * mean_tokens), per_token
+
+
+output_lengths = OutputLengths()
+prefill_times = PrefillTimes()
@@ -0,0 +1,176 @@
+"""Near-duplicate topic lookup over past runs (MinHash signatures, LSH buckets)
+
+The response cache only helps when a topic is submitted again word for word.
+Users more often reword one they already explored, and Stage 1 and Stage 2
+(ten model calls) would answer it much the same way.
+
+A topic is normalized (case, accents, punctuation, stop words, plural -s) and
+turned into a set of shingles: its words and the character trigrams of each
+word, so word order barely matters and a typo costs little. The similarity
+of two topics is the Jaccard index of their shingle sets. Each run with
+Stage 1 and Stage 2 saved gets a MinHash signature of its topic (kept in the
+run store) and is put in LSH_BANDS buckets, one per band of the signature; a
+new topic is compared exactly only with the runs sharing a bucket with it.
+With the default 32 bands of 4 rows, topics at 0.6 similarity share a bucket
+about 99% of the time, but at 0.5 only about 87%: use thresholds of 0.6 or
+more. Lookups are scoped to the runs of one owner (see runstore.py), so a
+user is never offered another user's stages.
+"""
+import hashlib
+import re
+import random
+import threading
+import unicodedata
+import weakref
+from array import array
+from collections import defaultdict
+
+from .config import LSH_BANDS, MINHASH_PERMUTATIONS
+
+# The stages a reused run provides
+REUSED_STAGES = ('explore', 'review')
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers him his
+how i if in into is it its itself just me might more most my no nor not now of off on once only or other our ours
+out over own same she should so some such than that the their them then there these they this those through to too
+under until up very was we were what when where which while who whom why will with would you your yours
+interested interest im id like want wondering explore exploring research topic question
+""".split())
+
+
+def normalize_topic(text):
+    """Lowercase, accent-free content words of a topic, with plural -s dropped"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    words = []
+    for word in re.findall(r"[a-z0-9]+", text):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def shingles(text):
+    """The topic's words and the character trigrams of each word"""
+    result = set()
+    for word in normalize_topic(text):
+        result.add(word)
+        padded = f' {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures of shingle sets, with `permutations` fixed (seeded) hash functions"""
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, seed=1):
+        rng = random.Random(seed)
+        self.permutations = permutations
+        self._params = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                        for _ in range(permutations)]
+
+    def signature(self, items):
+        hashes = [int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'little')
+                  for item in items]
+        if not hashes:
+            return array('I', [_MAX_HASH] * self.permutations)
+        return array('I', (min(((a * value + b) % _MERSENNE_PRIME) & _MAX_HASH for value in hashes)
+                           for a, b in self._params))
+
+
+class TopicIndex:
+    """LSH index of the topics of runs whose Stage 1 and Stage 2 could be reused
+
+    Backed by a run store: runs are picked up from it as they get their
+    Stage 2 checkpoint (find() checks for new ones first), and their
+    signatures are saved there so they are computed once. Safe to share
+    across threads.
+    """
+
+    def __init__(self, run_store, permutations=MINHASH_PERMUTATIONS, bands=LSH_BANDS):
+        if permutations % bands:
+            raise ValueError("permutations must be a multiple of bands")
+        self.run_store = run_store
+        self.hasher = MinHasher(permutations)
+        self.bands = bands
+        self._rows = permutations // bands
+        self._buckets = defaultdict(set)
+        self._topics = {}
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    def _keys(self, signature):
+        return [(band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+                for band in range(self.bands)]
+
+    def _refresh(self):
+        for run_id, topic, updated, stored, owner in self.run_store.runs_with_stages(REUSED_STAGES, self._since):
+            self._since = max(self._since, updated)
+            if run_id in self._topics:
+                continue
+            topic_shingles = shingles(topic)
+            signature = array('I')
+            if stored is not None and len(stored) == 4 * self.hasher.permutations:
+                signature.frombytes(stored)
+            else:
+                signature = self.hasher.signature(topic_shingles)
+                self.run_store.save_topic_signature(run_id, signature.tobytes())
+            self._topics[run_id] = (topic, topic_shingles, owner)
+            for key in self._keys(signature):
+                self._buckets[key].add(run_id)
+
+    def find(self, topic, threshold, exclude=None, owner=None):
+        """The most similar earlier run at or above `threshold`, as {run_id, topic, similarity}, or None
+
+        With `owner`, only that owner's runs are considered.
+        """
+        topic_shingles = shingles(topic)
+        if not topic_shingles:
+            return None
+        signature = self.hasher.signature(topic_shingles)
+        with self._lock:
+            self._refresh()
+            candidates = set()
+            for key in self._keys(signature):
+                candidates |= self._buckets.get(key, set())
+            candidates.discard(exclude)
+            scored = [(jaccard(topic_shingles, self._topics[run_id][1]), run_id) for run_id in candidates
+                      if owner is None or self._topics[run_id][2] == owner]
+        best = max(scored, default=None)
+        if best is None or best[0] < threshold:
+            return None
+        similarity, run_id = best
+        return {'run_id': run_id, 'topic': self._topics[run_id][0], 'similarity': round(similarity, 3)}
+
+    def forget(self, run_id):
+        """Drop a run from the index (e.g. after deleting it from the store)"""
+        with self._lock:
+            if self._topics.pop(run_id, None) is not None:
+                for bucket in self._buckets.values():
+                    bucket.discard(run_id)
+
+
+_indexes = weakref.WeakKeyDictionary()
+_indexes_lock = threading.Lock()
+
+
+def get_topic_index(run_store):
+    """The topic index over `run_store`, created on first use"""
+    with _indexes_lock:
+        index = _indexes.get(run_store)
+        if index is None:
+            index = _indexes[run_store] = TopicIndex(run_store)
+        return index
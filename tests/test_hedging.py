@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from swarm_council import hedging
+from swarm_council.hedging import CircuitBreaker, LatencyTracker, hedged
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(hedging, '_breakers', {})
+    monkeypatch.setattr(hedging, 'latency', LatencyTracker())
+    monkeypatch.setattr(hedging, 'HEDGE_DEFAULT_DELAY', 0.05)
+
+
+def _attempts(behaviour, started):
+    """attempt(model, cancel) following behaviour[model]: (delay, deltas or an exception)"""
+    def attempt(model, cancel):
+        started.append(model)
+        delay, result = behaviour[model]
+        if cancel.wait(delay):
+            return
+        if isinstance(result, Exception):
+            raise result
+        for delta in result:
+            if isinstance(delta, Exception):
+                raise delta
+            yield delta
+    return attempt
+
+
+def test_a_slow_primary_is_hedged_and_loses():
+    started = []
+    attempt = _attempts({'a/slow': (2.0, ['late']), 'b/fast': (0.0, ['fast ', 'answer'])}, started)
+    winners = []
+    assert ''.join(hedged(['a/slow', 'b/fast'], attempt, on_winner=winners.append)) == 'fast answer'
+    assert started == ['a/slow', 'b/fast']
+    assert winners == ['b/fast']
+
+
+def test_without_hedging_a_slow_primary_is_waited_for():
+    started = []
+    attempt = _attempts({'a/slow': (0.2, ['slow answer']), 'b/fast': (0.0, ['fast answer'])}, started)
+    assert ''.join(hedged(['a/slow', 'b/fast'], attempt, hedge=False)) == 'slow answer'
+    assert started == ['a/slow']
+
+
+def test_a_failing_model_is_replaced_and_counted_by_its_breaker():
+    started = []
+    attempt = _attempts({'a/bad': (0.0, RuntimeError('down')), 'b/ok': (0.0, ['answer'])}, started)
+    assert ''.join(hedged(['a/bad', 'b/ok'], attempt, hedge=False)) == 'answer'
+    assert hedging.breaker_for('a/bad').failures == 1
+    assert hedging.breaker_for('b/ok').failures == 0
+
+
+def test_a_winner_failing_mid_stream_is_a_breaker_failure():
+    attempt = _attempts({'a/flaky': (0.0, ['partial', RuntimeError('connection dropped')])}, [])
+    received = []
+    with pytest.raises(RuntimeError):
+        for delta in hedged(['a/flaky'], attempt):
+            received.append(delta)
+    assert received == ['partial']
+    assert hedging.breaker_for('a/flaky').failures == 1
+
+
+def test_breaker_opens_and_lets_one_probe_through_after_the_cooldown():
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.admit() is None
+    time.sleep(0.06)
+    assert breaker.admit() == 'probe'
+    assert breaker.admit() is None
+    breaker.release_probe()
+    assert breaker.admit() == 'probe'
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_a_probe_that_loses_the_hedge_is_released(monkeypatch):
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=0.0)
+    breaker.record_failure()
+    monkeypatch.setitem(hedging._breakers, 'a', breaker)
+    attempt = _attempts({'a/probe': (2.0, ['late']), 'b/fast': (0.0, ['answer'])}, [])
+    assert ''.join(hedged(['a/probe', 'b/fast'], attempt)) == 'answer'
+    assert breaker.admit() == 'probe'
+
+
+def test_censored_samples_raise_the_latency_estimate(monkeypatch):
+    monkeypatch.setattr(hedging, 'HEDGE_MIN_SAMPLES', 1)
+    tracker = LatencyTracker()
+    for seconds in (1.0, 1.0, 1.0):
+        tracker.record('m', seconds)
+    assert tracker.percentile('m', 0.9) == 1.0
+    for _ in range(7):
+        tracker.record('m', 5.0, censored=True)
+    # Seven attempts ran 5s without answering: the p90 is at least that
+    assert tracker.percentile('m', 0.9) == 5.0
+
+
+def test_consumer_abort_cancels_the_running_attempt():
+    cancelled = threading.Event()
+
+    def attempt(model, cancel):
+        yield 'first'
+        cancel.wait(2)
+        cancelled.set()
+
+    stream = hedged(['a/model'], attempt)
+    assert next(stream) == 'first'
+    stream.close()
+    assert cancelled.wait(1)
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from swarm_council import jobs
+from swarm_council.jobs import JobQueue
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def _gated(gate, started, result=None):
+    """work(job) that notes its start and returns `result` once `gate` is set"""
+    async def run(job):
+        started.append(job.label)
+        while not gate.is_set():
+            await asyncio.sleep(0.01)
+        return result
+    return run
+
+
+@pytest.fixture
+def queue():
+    queue = JobQueue(max_running=3, per_user=2, max_calls=4)
+    yield queue
+    queue.shutdown()
+
+
+def test_per_user_limit_and_round_robin_start_order(queue):
+    gate, started = threading.Event(), []
+    submitted = [queue.submit('alice', f"alice-{i}", _gated(gate, started)) for i in range(4)]
+    submitted.append(queue.submit('bob', 'bob-0', _gated(gate, started)))
+
+    _wait_for(lambda: len(started) == 3)
+    # Alice holds her two slots; Bob gets the third although he queued last
+    assert sorted(started) == ['alice-0', 'alice-1', 'bob-0']
+    assert queue.stats()['users']['alice'] == {'running': 2, 'waiting': 2}
+    assert queue.position(submitted[2]) == 0
+    assert queue.position(submitted[3]) == 1
+
+    gate.set()
+    _wait_for(lambda: all(job.done for job in submitted))
+    assert [job.state for job in submitted] == ['done'] * 5
+    assert queue.stats() == {'running': 0, 'waiting': 0, 'users': {}}
+
+
+def test_results_and_failures_are_kept_on_the_job(queue):
+    gate = threading.Event()
+    gate.set()
+
+    async def fail(job):
+        raise ValueError("no reviews")
+
+    ok = queue.submit('alice', 'ok', _gated(gate, [], result=42))
+    failed = queue.submit('alice', 'fails', fail)
+    _wait_for(lambda: ok.done and failed.done)
+    assert (ok.state, ok.result) == ('done', 42)
+    assert failed.state == 'failed'
+    assert isinstance(failed.error, ValueError)
+    assert 'no reviews' in failed.error_details
+
+
+def test_queued_and_running_jobs_can_be_cancelled(queue):
+    gate, started = threading.Event(), []
+    running = [queue.submit('alice', f"run-{i}", _gated(gate, started)) for i in range(2)]
+    waiting = queue.submit('alice', 'waiting', _gated(gate, started))
+    _wait_for(lambda: len(started) == 2)
+
+    queue.cancel(waiting.id)
+    queue.cancel(running[0].id)
+    _wait_for(lambda: waiting.done and running[0].done)
+    assert waiting.state == running[0].state == 'cancelled'
+    assert 'waiting' not in started
+
+    gate.set()
+    _wait_for(lambda: running[1].done)
+    assert running[1].state == 'done'
+
+
+def test_jobs_nobody_polls_are_cancelled(monkeypatch):
+    monkeypatch.setattr(jobs, 'REAP_INTERVAL_SECONDS', 0.05)
+    queue = JobQueue(abandon_after=0.1)
+    try:
+        gate = threading.Event()
+        polled = queue.submit('alice', 'polled', _gated(gate, []))
+        abandoned = queue.submit('bob', 'abandoned', _gated(gate, []))
+        deadline = time.monotonic() + 0.5
+        while time.monotonic() < deadline:
+            queue.get(polled.id)
+            time.sleep(0.02)
+        assert abandoned.state == 'cancelled'
+        assert polled.state == 'running'
+    finally:
+        queue.shutdown()
@@ -0,0 +1,61 @@
+import json
+import random
+
+import pytest
+
+from swarm_council.jsonstream import IncrementalJSONParser
+
+DOCUMENT = {
+    'clarifiedFocus': 'How "retrieval practice" changes {clinical} reasoning\\n, [fast]',
+    'theoreticalFoundations': ['Dual-process theory', 'Cognitive load: intrinsic, extraneous'],
+    'keyTensions': [],
+    'reviews': [{'ideaNumber': 1, 'strengths': ['clear']}, {'ideaNumber': 2, 'strengths': []}],
+    'score': 3.5,
+    'final': True,
+    'notes': None,
+    'unicode': 'café – naïve ✓',
+}
+
+
+def _feed_in_pieces(text, rng):
+    parser = IncrementalJSONParser()
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 7)
+        parser.feed(text[pos:pos + size])
+        pos += size
+    return parser
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('wrap', ['{}', 'Here is my analysis:\n```json\n{}\n```\nHope this helps!'])
+def test_any_split_of_the_stream_yields_the_whole_document(seed, wrap):
+    text = wrap.replace('{}', json.dumps(DOCUMENT, indent=2, ensure_ascii=False))
+    parser = _feed_in_pieces(text, random.Random(seed))
+    assert parser.fields == DOCUMENT
+    assert parser.done
+
+
+def test_fields_appear_as_soon_as_their_value_closes():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"clarifiedFocus": "AI in med') == []
+    assert set(parser.feed('ical education", "keyTensions": ["cost"')) == {'clarifiedFocus', 'keyTensions'}
+    assert parser.fields == {'clarifiedFocus': 'AI in medical education', 'keyTensions': ['cost']}
+    assert 'keyTensions' not in parser.closed
+    parser.feed(', "time"]}')
+    assert parser.fields['keyTensions'] == ['cost', 'time']
+    assert parser.closed == {'clarifiedFocus', 'keyTensions'}
+    assert parser.done
+
+
+def test_an_escape_split_across_deltas_is_kept():
+    parser = IncrementalJSONParser()
+    parser.feed('{"quote": "say \\')
+    parser.feed('"hi\\"", "next": 1}')
+    assert parser.fields == {'quote': 'say "hi"', 'next': 1}
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+    parser.feed('{"a": 1} and then {"b": 2}')
+    assert parser.fields == {'a': 1}
@@ -0,0 +1,88 @@
+import itertools
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from swarm_council.ranking import (aggregate_rankings, bradley_terry, clean_ranking, consensus_ranking,
+                                   kemeny_disagreements, local_kemeny, review_assignments, win_matrix)
+
+
+@pytest.mark.parametrize('n', [20, 50])
+@pytest.mark.parametrize('seed', range(3))
+def test_review_assignments_cover_every_pair_with_balanced_load(n, seed):
+    subsets, coverage = review_assignments(n, n, rng=random.Random(seed))
+
+    assert coverage == 1.0
+    assert len(subsets) == n
+    assert len({len(subset) for subset in subsets}) == 1
+    assert all(len(set(subset)) == len(subset) < n for subset in subsets)
+    pairs = {pair for subset in subsets for pair in itertools.combinations(subset, 2)}
+    assert pairs == set(itertools.combinations(range(n), 2))
+    load = Counter(idea for subset in subsets for idea in subset)
+    assert set(load) == set(range(n))
+    assert max(load.values()) - min(load.values()) <= 2
+
+
+def test_small_councils_keep_the_dense_design():
+    subsets, coverage = review_assignments(5, 5)
+    assert coverage == 1.0
+    assert subsets == [list(range(5))] * 5
+
+
+def test_bradley_terry_strengths_sum_to_one_and_follow_the_win_order():
+    rng = random.Random(0)
+    rankings = []
+    for _ in range(30):
+        # Noisy reviewers of the true order 0 > 1 > ... > 5, each seeing 4 ideas
+        subset = rng.sample(range(6), 4)
+        rankings.append(sorted(subset, key=lambda idea: idea + rng.gauss(0, 0.8)))
+    strength = bradley_terry(win_matrix(rankings, 6))
+
+    assert strength.sum() == pytest.approx(1.0)
+    assert (strength > 0).all()
+    assert list(np.argsort(-strength)) == list(range(6))
+
+
+def test_bradley_terry_keeps_ideas_that_never_won_finite():
+    strength = bradley_terry(win_matrix([[0, 1, 2]] * 5, 3))
+    assert np.isfinite(strength).all()
+    assert strength[0] > strength[1] > strength[2] > 0
+
+
+def test_local_kemenization_never_increases_disagreements():
+    rng = random.Random(1)
+    for _ in range(50):
+        n = rng.randint(3, 12)
+        rankings = [rng.sample(range(n), rng.randint(2, n)) for _ in range(rng.randint(1, 10))]
+        wins = win_matrix(rankings, n)
+        seed = rng.sample(range(n), n)
+        order = local_kemeny(seed, wins)
+        assert sorted(order) == list(range(n))
+        assert kemeny_disagreements(order, wins) <= kemeny_disagreements(seed, wins)
+
+
+def test_unanimous_rankings_aggregate_to_that_order():
+    result = aggregate_rankings([[2, 0, 3, 1]] * 4, 4)
+    assert result['order'] == [2, 0, 3, 1]
+    assert result['disagreements'] == 0
+    assert (result['confidence'] == 1.0).all()
+
+
+def test_clean_ranking_drops_ideas_outside_the_subset():
+    assert clean_ranking([3, '7', 3, 'x', None, 9, 1], allowed=[1, 3, 7]) == [3, 7, 1]
+    assert clean_ranking(None, allowed=[1, 2]) == []
+
+
+def test_consensus_ignores_ranks_of_unassigned_ideas():
+    explorations = [{'agentName': f"Agent {i}"} for i in range(1, 5)]
+    reviews = [
+        {'assignedIdeas': [1, 2], 'ranking': [4, 2, 1]},
+        {'assignedIdeas': [1, 2], 'ranking': [2, 1]},
+    ]
+    consensus = consensus_ranking(explorations, reviews)
+    assert consensus['ranking'].index(2) < consensus['ranking'].index(1)
+    assert consensus['reviewers'] == 2
+    comparisons = {idea['ideaNumber']: idea['comparisons'] for idea in consensus['ideas']}
+    assert comparisons == {1: 2, 2: 2, 3: 0, 4: 0}
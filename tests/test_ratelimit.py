@@ -0,0 +1,140 @@
+import random
+import threading
+
+import httpx
+import openai
+import pytest
+
+from swarm_council.ratelimit import AdaptiveLimit, RateLimitScheduler, TokenBucket, parse_reset, retry_after
+
+
+def _rate_limited():
+    request = httpx.Request('POST', 'https://openrouter.ai/api/v1/chat/completions')
+    response = httpx.Response(429, request=request, headers={'retry-after-ms': '1'})
+    return openai.RateLimitError('Rate limit exceeded', response=response, body=None)
+
+
+class _Raw:
+    headers = {}
+
+    def __init__(self, chunks=()):
+        self.chunks = chunks
+        self.closed = False
+
+    def parse(self):
+        raw = self
+
+        class Stream:
+            def __iter__(self):
+                return iter(raw.chunks)
+
+            def close(self):
+                raw.closed = True
+        return Stream()
+
+
+def test_adaptive_limit_halves_on_throttling_and_grows_back_additively():
+    limit = AdaptiveLimit(8)
+    for _ in range(2):
+        limit.acquire()
+        limit.release(throttled=True)
+    assert limit.limit == 2.0
+    for _ in range(3):
+        limit.acquire()
+        limit.release()
+    assert 2.0 < limit.limit < 4.0
+    for _ in range(200):
+        limit.acquire()
+        limit.release()
+    assert limit.limit == 8
+    assert limit.in_flight == 0
+
+
+def test_adaptive_limit_bounds_calls_in_flight():
+    limit = AdaptiveLimit(2)
+    limit.acquire()
+    limit.acquire()
+    third = threading.Thread(target=limit.acquire)
+    third.start()
+    third.join(0.1)
+    assert third.is_alive()
+    limit.release()
+    third.join(1)
+    assert not third.is_alive()
+    assert limit.in_flight == 2
+
+
+def test_token_bucket_asks_callers_to_wait_once_empty():
+    bucket = TokenBucket(60)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(30) > 0
+
+
+@pytest.mark.parametrize('value, expected', [('1.5', 1.5), ('6m0s', 360), ('250ms', 0.25)])
+def test_parse_reset(value, expected):
+    assert parse_reset(value) == pytest.approx(expected)
+
+
+def test_parse_reset_of_epoch_timestamps():
+    assert parse_reset('1700000030', now=1700000000) == pytest.approx(30)
+    assert parse_reset('1700000030000', now=1700000000) == pytest.approx(30)
+    assert parse_reset(None) is None
+
+
+def test_retry_after_prefers_milliseconds():
+    assert retry_after({'retry-after-ms': '1500', 'retry-after': '9'}) == 1.5
+    assert retry_after({'retry-after': '2'}) == 2.0
+    assert retry_after(None) is None
+
+
+def test_throttled_calls_are_retried_and_counted():
+    scheduler = RateLimitScheduler(max_attempts=3, base_delay=0.001, max_delay=0.001, rng=random.Random(0))
+    failures = iter([_rate_limited(), _rate_limited()])
+
+    def request():
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return _Raw()
+
+    assert isinstance(scheduler.call('test/model', 10, request, account='a'), _Raw)
+    assert (scheduler.throttled, scheduler.retries) == (2, 2)
+
+
+def test_counters_are_exact_under_concurrent_retries():
+    scheduler = RateLimitScheduler(max_attempts=2, base_delay=0.0, max_delay=0.0)
+
+    def call(account):
+        attempts = iter([_rate_limited()])
+
+        def request():
+            error = next(attempts, None)
+            if error is not None:
+                raise error
+            return _Raw()
+        scheduler.call('test/model', 1, request, account=account)
+
+    threads = [threading.Thread(target=call, args=(f"account-{i}",)) for i in range(32)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert (scheduler.throttled, scheduler.retries) == (32, 32)
+
+
+def test_a_stream_holds_its_slot_until_closed():
+    scheduler = RateLimitScheduler()
+    raw = _Raw(['a', 'b', 'c'])
+    stream = scheduler.stream('test/model', 1, lambda: raw, account='a')
+    assert next(stream) == 'a'
+    _, _, concurrency = scheduler._limits_for('test/model', 'a')
+    assert concurrency.in_flight == 1
+    stream.close()
+    assert concurrency.in_flight == 0
+    assert raw.closed
+
+
+def test_limits_are_kept_per_account():
+    scheduler = RateLimitScheduler()
+    assert scheduler._limits_for('test/model', 'a')[2] is not scheduler._limits_for('test/model', 'b')[2]
+    assert scheduler._limits_for('test/model', 'a')[2] is scheduler._limits_for('test/model', 'a')[2]
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from swarm_council import engine
+from swarm_council.engine import SwarmCouncil
+from swarm_council.results import CouncilError
+from swarm_council.router import ModelRouter
+from swarm_council.runstore import RunStore
+from swarm_council.telemetry import Telemetry
+
+ANSWERS = {
+    'exploration': {'keyConcepts': ['a'], 'theoreticalFrameworks': ['b'], 'whatsClear': 'c', 'whatsFuzzy': 'd',
+                    'importantQuestions': ['e'], 'considerations': 'f'},
+    'peer_review': {'reviews': [{'ideaNumber': 1, 'strengths': ['s'], 'weaknesses': ['w'],
+                                 'missingElements': ['m']}],
+                    'ranking': [1, 2, 3, 4, 5], 'overallCommentary': 'ok'},
+    'synthesis': {'clarifiedFocus': 'focus', 'theoreticalFoundations': ['t'], 'keyTensions': ['k'],
+                  'criticalQuestions': ['q'], 'integratedPerspectives': 'i', 'peerReviewInsights': 'p',
+                  'recommendedNextSteps': ['n']},
+    'proposal': {'title': 'A study', 'researchQuestion': 'rq', 'background': 'bg', 'methodology': 'm',
+                 'expectedContribution': 'ec', 'feasibilityNotes': 'fn'},
+}
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Stages asked for, answering every model call with a valid answer for its schema"""
+    asked = []
+
+    def call_llm(system_prompt, user_prompt, model, agent_name, api_key, schema=None, on_model=None, **kwargs):
+        asked.append(schema['title'])
+        if on_model is not None:
+            on_model(model)
+        return json.dumps(ANSWERS[schema['title']])
+
+    monkeypatch.setattr(engine, 'call_llm', call_llm)
+    return asked
+
+
+def _council(store, api_key='key-a', **kwargs):
+    return SwarmCouncil(api_key, run_store=store, run_id='r1', debate_rounds=0, review_quorum=None,
+                        router=ModelRouter(path=None), telemetry=Telemetry(trace_path=None), **kwargs)
+
+
+def test_a_run_resumes_after_its_last_checkpoint(calls):
+    store = RunStore(':memory:')
+    first = asyncio.run(_council(store).run('topic', proposal=True))
+    assert first.proposal['title'] == 'A study'
+    assert store.load_run('r1')['last_stage'] == 'propose'
+
+    # As if the process died after Stage 2
+    store._conn.execute("DELETE FROM stages WHERE stage IN ('synthesize', 'propose')")
+    calls.clear()
+    resumed = asyncio.run(_council(store).run('topic', proposal=True))
+
+    assert calls == ['synthesis', 'proposal']
+    assert resumed.exploration == first.exploration
+    assert resumed.peer_reviews == first.peer_reviews
+    assert resumed.proposal == first.proposal
+
+
+def test_a_finished_run_makes_no_calls(calls):
+    store = RunStore(':memory:')
+    asyncio.run(_council(store).run('topic', proposal=True))
+    calls.clear()
+    asyncio.run(_council(store).run('topic', proposal=True))
+    assert calls == []
+
+
+def test_another_keys_run_is_not_resumed(calls):
+    store = RunStore(':memory:')
+    asyncio.run(_council(store).run('topic'))
+    with pytest.raises(CouncilError):
+        asyncio.run(_council(store, api_key='key-b').run('topic'))
+    assert store.recent_runs(owner=_council(store).owner)[0][0] == 'r1'
+    assert store.recent_runs(owner=_council(store, api_key='key-b').owner) == []
@@ -0,0 +1,26 @@
+from swarm_council.runstore import RunStore, next_stage
+
+
+def test_resaving_an_earlier_stage_keeps_last_stage():
+    store = RunStore(':memory:')
+    run_id = store.create_run('topic')
+    for stage in ('explore', 'review', 'synthesize'):
+        store.save_stage(run_id, stage, {'stage': stage})
+    # Late reviews are checkpointed again after the synthesis
+    store.save_stage(run_id, 'review', {'stage': 'review', 'late': True})
+
+    run = store.load_run(run_id)
+    assert run['last_stage'] == 'synthesize'
+    assert run['stages']['review'] == {'stage': 'review', 'late': True}
+    assert next_stage(run) == 'debate'
+
+
+def test_copied_stages_end_on_the_latest_one():
+    store = RunStore(':memory:')
+    source = store.create_run('topic')
+    for stage in ('explore', 'review', 'synthesize', 'debate'):
+        store.save_stage(source, stage, {'stage': stage})
+    run_id = store.create_run('topic')
+
+    assert store.copy_stages(source, run_id, ['debate', 'explore', 'review']) == ['explore', 'review', 'debate']
+    assert store.load_run(run_id)['last_stage'] == 'debate'
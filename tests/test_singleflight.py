@@ -0,0 +1,87 @@
+import threading
+import time
+
+import httpx
+import openai
+
+from swarm_council import llm
+from swarm_council.singleflight import SingleFlight
+
+
+def _auth_error():
+    request = httpx.Request('POST', 'https://openrouter.ai/api/v1/chat/completions')
+    return openai.AuthenticationError('Invalid API key', response=httpx.Response(401, request=request), body=None)
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_follower_asks_with_its_own_key_when_the_leader_fails(monkeypatch):
+    flights = SingleFlight()
+    release = threading.Event()
+    sent_with = []
+
+    def request_llm(system_prompt, user_prompt, model, agent_name, api_key, *args):
+        sent_with.append(api_key)
+        if api_key == 'bad-key':
+            release.wait(5)
+            raise _auth_error()
+        return 'answer'
+
+    monkeypatch.setattr(llm, 'get_single_flight', lambda: flights)
+    monkeypatch.setattr(llm, 'request_llm', request_llm)
+
+    def call(api_key, results):
+        try:
+            results[api_key] = llm.call_llm('system', 'user', 'test/singleflight', api_key, api_key,
+                                            use_cache=False)
+        except Exception as e:
+            results[api_key] = e
+
+    results = {}
+    leader = threading.Thread(target=call, args=('bad-key', results))
+    leader.start()
+    _wait_for(lambda: flights.stats()['in_flight'] == 1)
+    follower = threading.Thread(target=call, args=('good-key', results))
+    follower.start()
+    _wait_for(lambda: flights.stats()['coalesced'] == 1)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(results['bad-key'], openai.AuthenticationError)
+    assert results['good-key'] == 'answer'
+    assert sent_with == ['bad-key', 'good-key']
+
+
+def test_followers_share_the_leaders_answer(monkeypatch):
+    flights = SingleFlight()
+    release = threading.Event()
+    sent_with = []
+
+    def request_llm(system_prompt, user_prompt, model, agent_name, api_key, *args):
+        sent_with.append(api_key)
+        release.wait(5)
+        return 'answer'
+
+    monkeypatch.setattr(llm, 'get_single_flight', lambda: flights)
+    monkeypatch.setattr(llm, 'request_llm', request_llm)
+
+    results = {}
+    threads = [threading.Thread(target=lambda key=key: results.__setitem__(
+        key, llm.call_llm('system', 'user', 'test/singleflight', key, key, use_cache=False))) for key in 'abc']
+    threads[0].start()
+    _wait_for(lambda: flights.stats()['in_flight'] == 1)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_for(lambda: flights.stats()['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == {'a': 'answer', 'b': 'answer', 'c': 'answer'}
+    assert len(sent_with) == 1
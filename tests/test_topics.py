@@ -0,0 +1,56 @@
+import pytest
+
+from swarm_council.runstore import RunStore
+from swarm_council.topics import MinHasher, TopicIndex, jaccard, shingles
+
+
+def _store_with_runs(*runs):
+    store = RunStore(':memory:')
+    for run_id, topic, owner in runs:
+        store.create_run(topic, run_id=run_id, owner=owner)
+        store.save_stage(run_id, 'explore', [])
+        store.save_stage(run_id, 'review', [])
+    return store
+
+
+def test_minhash_estimates_jaccard_similarity():
+    a = shingles("How might AI affect clinical reasoning in medical students?")
+    b = shingles("How does artificial intelligence affect clinical reasoning of medical students")
+    hasher = MinHasher(256)
+    estimate = sum(x == y for x, y in zip(hasher.signature(a), hasher.signature(b))) / 256
+    assert estimate == pytest.approx(jaccard(a, b), abs=0.1)
+
+
+def test_reworded_topic_finds_the_earlier_run():
+    store = _store_with_runs(('r1', "How might AI affect clinical reasoning in medical students?", 'alice'),
+                             ('r2', "Sleep deprivation and surgical residents' error rates", 'alice'))
+    index = TopicIndex(store)
+
+    match = index.find("how AI might affect the clinical reasoning of medical students", 0.6)
+    assert match['run_id'] == 'r1'
+    assert match['similarity'] >= 0.6
+    assert index.find("Ocean acidification and coral reef recovery", 0.6) is None
+
+
+def test_lookups_only_see_the_owners_runs():
+    topic = "How might AI affect clinical reasoning in medical students?"
+    store = _store_with_runs(('r1', topic, 'alice'))
+    index = TopicIndex(store)
+
+    assert index.find(topic, 0.8, owner='bob') is None
+    assert index.find(topic, 0.8, owner='alice')['run_id'] == 'r1'
+    assert index.find(topic, 0.8, exclude='r1', owner='alice') is None
+
+
+def test_runs_without_review_are_not_indexed_until_it_is_saved():
+    topic = "How might AI affect clinical reasoning in medical students?"
+    store = RunStore(':memory:')
+    store.create_run(topic, run_id='r1')
+    store.save_stage('r1', 'explore', [])
+    index = TopicIndex(store)
+    assert index.find(topic, 0.8) is None
+
+    store.save_stage('r1', 'review', [])
+    assert index.find(topic, 0.8)['run_id'] == 'r1'
+    # The signature is saved with the run and reused by a fresh index
+    assert TopicIndex(store).find(topic, 0.8)['run_id'] == 'r1'